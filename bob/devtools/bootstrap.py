@@ -4,14 +4,21 @@
 
 """Bootstraps a new miniconda installation and prepares it for development."""
 
+import collections
+import contextlib
 import glob
+import gzip
 import hashlib
+import itertools
+import json
 import logging
 import os
 import platform
+import queue
 import shutil
 import subprocess
 import sys
+import threading
 import time
 
 _BASE_CONDARC = """\
@@ -45,6 +52,15 @@ _INTERVALS = (
 )
 """Time intervals that make up human readable time slots"""
 
+_SPANS = []
+"""Timing spans (build phases) recorded by :py:func:`span` in this process"""
+
+_SPAN_IDS = itertools.count()
+"""Sequence of span identifiers in this process"""
+
+_OPEN_SPANS = threading.local()
+"""Spans being timed on each thread, innermost last"""
+
 
 logger = logging.getLogger(__name__)
 
@@ -93,20 +109,278 @@ def human_time(seconds, granularity=2):
     return ", ".join([x for x in result[:granularity] if x is not None])
 
 
-def run_cmdline(cmd, env=None, **kwargs):
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Times the execution of a block of code, recording it as a build phase.
+
+    Spans are kept in memory for the remainder of the process.  Use
+    :py:func:`write_timing_report` to dump them to a machine-readable report.
+    Spans are recorded even if the block raises an exception, in which case
+    their status is set to ``error``.  Spans opened (on the same thread)
+    while another one is being timed are recorded as its children.
+
+    Example:
+
+    .. code-block:: python
+
+       with span("render", recipe="conda", python="3.10"):
+           metadata = get_rendered_metadata(recipe_dir, config)
+
+
+    Args:
+
+      name: The name of the phase being timed.  We typically use one of
+        ``render``, ``channel``, ``solve``, ``build``, ``variant``, ``index``,
+        ``test``, ``upload`` or ``cleanup``
+      attributes: Further (JSON-serializable) information to be recorded with
+        the span, such as the recipe or package being handled
+    """
+
+    stack = _open_spans()
+    record = dict(
+        name=name,
+        id="%d-%d" % (os.getpid(), next(_SPAN_IDS)),
+        parent=stack[-1]["id"] if stack else None,
+        start=time.time(),
+        status="error",
+    )
+    record.update(attributes)
+    stack.append(record)
+    try:
+        yield record
+        record["status"] = "ok"
+    finally:
+        stack.pop()
+        record["duration"] = time.time() - record["start"]
+        _SPANS.append(record)
+        logger.info(
+            "%s phase took %s (%s)",
+            name,
+            human_time(record["duration"]),
+            record["status"],
+        )
+
+
+def _open_spans():
+    """Returns the stack of spans being timed on the current thread"""
+
+    if not hasattr(_OPEN_SPANS, "stack"):
+        _OPEN_SPANS.stack = []
+    return _OPEN_SPANS.stack
+
+
+def take_spans():
+    """Removes and returns all timing spans recorded so far in this process.
+
+    Use this on worker processes (e.g. variants built concurrently) to
+    forward their spans to the parent process, which records them with
+    :py:func:`add_spans`.  Workers that are forked inherit the spans of their
+    parent, call this function once before doing any work to discard them.
+
+
+    Returns: a list with the recorded spans (dictionaries)
+    """
+
+    retval = list(_SPANS)
+    del _SPANS[:]
+    return retval
+
+
+def add_spans(spans):
+    """Records timing spans taken from another process (see
+    :py:func:`take_spans`) on this process
+
+    Top-level spans of the other process become children of the innermost
+    span being timed on the current thread, if any.
+    """
+
+    stack = _open_spans()
+    for k in spans:
+        if k.get("parent") is None and stack:
+            k = dict(k, parent=stack[-1]["id"])
+        _SPANS.append(k)
+
+
+def _self_times(spans):
+    """Returns the time spent on each span, excluding its children
+
+    Children running concurrently (e.g. on other processes) may add up to
+    more than their parent, in which case the parent is accounted no time.
+    """
+
+    children = {}
+    for k in spans:
+        if k.get("parent") is not None:
+            children[k["parent"]] = children.get(k["parent"], 0.0) + (
+                k["duration"]
+            )
+    return [
+        max(0.0, k["duration"] - children.get(k.get("id"), 0.0)) for k in spans
+    ]
+
+
+def write_timing_report(path, command=None):
+    """Writes timing spans recorded in this process to a JSON report.
+
+    If the report file already exists (e.g. from previous ``bdt`` calls in the
+    same CI job), then spans from this process are appended to it, so that a
+    single report is kept per job.  The report also contains the total time
+    spent in each phase, across all recorded runs.  Time spent in nested
+    phases (e.g. ``test`` within ``build``) is only accounted to the
+    innermost one, so totals do not count time twice.
+
+
+    Args:
+
+      path: Path leading to the JSON report to write
+      command: An optional string describing the command that executed, to be
+        recorded together with the spans of this process
+    """
+
+    if not _SPANS:
+        return
+
+    report = dict(job=os.environ.get("CI_JOB_NAME"), runs=[], phases={})
+    if os.path.exists(path):
+        with open(path, "rt") as f:
+            report = json.load(f)
+
+    report["runs"].append(
+        dict(command=command, pid=os.getpid(), spans=list(_SPANS))
+    )
+
+    phases = {}
+    for run in report["runs"]:
+        for k, v in zip(run["spans"], _self_times(run["spans"])):
+            phases[k["name"]] = phases.get(k["name"], 0.0) + v
+    report["phases"] = phases
+
+    dirname = os.path.dirname(os.path.realpath(path))
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, path)
+
+    logger.info("Wrote timing report for %d span(s) at %s", len(_SPANS), path)
+    del _SPANS[:]
+
+
+_FORWARDER_QUEUE = 64
+"""Maximum number of output chunks queued for writing by
+:py:class:`_OutputForwarder`"""
+
+
+class _OutputForwarder(threading.Thread):
+    """Forwards subprocess output to our standard output (and a log file).
+
+    Writing happens on a separate thread, so that a slow consumer of our
+    output (e.g. CI log collectors) does not block the subprocess being
+    monitored.  Chunks queued while a previous write was ongoing are coalesced
+    and written (and flushed) at once.  At most :py:data:`_FORWARDER_QUEUE`
+    chunks are queued: if output is produced faster than it can be written,
+    then the reader blocks (and so does the subprocess), instead of queueing
+    output without limit.
+
+    Args:
+
+      log_file: If set, the path to a gzip-compressed file where output is
+        also appended to
+    """
+
+    def __init__(self, log_file=None):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(maxsize=_FORWARDER_QUEUE)
+        self.stream = getattr(sys.stdout, "buffer", None)
+        self.log = None
+        if log_file:
+            self.log = gzip.open(log_file, "ab", compresslevel=6)
+
+    def run(self):
+        sys.stdout.flush()  # we write bytes after any previous text
+        done = False
+        while not done:
+            chunks = [self.queue.get()]
+            while True:
+                try:
+                    chunks.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if chunks[-1] is None:
+                done = True
+                chunks.pop()
+            data = b"".join(chunks)
+            if not data:
+                continue
+            if self.stream is not None:
+                self.stream.write(data)
+                self.stream.flush()
+            else:
+                sys.stdout.write(data.decode(errors="replace"))
+                sys.stdout.flush()
+            if self.log is not None:
+                self.log.write(data)
+        if self.log is not None:
+            self.log.close()
+
+    def write(self, data):
+        self.queue.put(data)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+
+def _env_flag(name):
+    """Tells if an environment variable is set to a "true" value"""
+
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+def run_cmdline(
+    cmd, env=None, log_file=None, timestamps=None, tail=None, **kwargs
+):
     """Runs a command on a environment, logs output and reports status.
 
+    Output from the command is read in chunks and forwarded to our standard
+    output by a separate thread.  The last lines of output are kept in memory
+    and reported in case the command fails.
+
+
     Parameters:
 
       cmd (list): The command to run, with parameters separated on a list
 
       env (dict, Optional): Environment to use for running the program on. If not
         set, use :py:obj:`os.environ`.
+
+      log_file (str, Optional): If set, also append the command output to this
+        (gzip-compressed) file.  If not set, use the value of
+        ``${BDT_LOG_FILE}``, if that is set.
+
+      timestamps (bool, Optional): If set, prefix every line of output with
+        the time elapsed since the command started.  If not set, use the value
+        of ``${BDT_TIMESTAMPS}``.
+
+      tail (int, Optional): Number of lines of output to keep in memory, and
+        report in case the command fails.  If not set, use the value of
+        ``${BDT_LOG_TAIL}``, or 50 if that is not set.
     """
 
     if env is None:
         env = os.environ
 
+    if log_file is None:
+        log_file = os.environ.get("BDT_LOG_FILE")
+
+    if timestamps is None:
+        timestamps = _env_flag("BDT_TIMESTAMPS")
+
+    if tail is None:
+        tail = int(os.environ.get("BDT_LOG_TAIL", "50"))
+
     logger.info("(system) %s" % " ".join(cmd))
 
     start = time.time()
@@ -116,20 +390,54 @@ def run_cmdline(cmd, env=None, **kwargs):
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         env=env,
-        bufsize=1,
-        universal_newlines=True,
+        bufsize=0,
         **kwargs,
     )
 
-    for line in iter(p.stdout.readline, ""):
-        sys.stdout.write(line)
-        sys.stdout.flush()
+    last_lines = collections.deque(maxlen=tail)
+    partial = b""  # last line of output, while not terminated
+    line_start = True  # next byte of output starts a new line
+
+    forwarder = _OutputForwarder(log_file)
+    forwarder.start()
+    try:
+        while True:
+            chunk = os.read(p.stdout.fileno(), 65536)
+            if not chunk:
+                break
+
+            if tail:
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()[-4096:]  # caps progress bars, etc.
+                last_lines.extend(lines)
+
+            if timestamps:
+                stamp = b"[%8.1fs] " % (time.time() - start)
+                chunk = chunk.replace(b"\n", b"\n" + stamp)
+                if line_start:
+                    chunk = stamp + chunk
+                line_start = chunk.endswith(b"\n" + stamp)
+                if line_start:
+                    chunk = chunk[: -len(stamp)]
+
+            forwarder.write(chunk)
+    finally:
+        forwarder.close()
+        p.stdout.close()
 
     if p.wait() != 0:
-        raise RuntimeError(
-            "command `%s' exited with error state (%d)"
-            % (" ".join(cmd), p.returncode)
+        if partial:
+            last_lines.append(partial)
+        message = "command `%s' exited with error state (%d)" % (
+            " ".join(cmd),
+            p.returncode,
         )
+        if last_lines:
+            message += "\nlast %d line(s) of output:\n%s" % (
+                len(last_lines),
+                b"\n".join(last_lines).decode(errors="replace"),
+            )
+        raise RuntimeError(message)
 
     total = time.time() - start
 
@@ -640,6 +948,9 @@ if __name__ == "__main__":
         if conda_cmd == "create" and args.python is not None:
             cmd += [f"python={args.python}"]
         cmd += ["bob.devtools"]
+        # compiler cache requested for builds (see ``bdt build --help``)
+        if os.environ.get("BDT_COMPILER_CACHE"):
+            cmd += [os.environ["BDT_COMPILER_CACHE"]]
         if conda_cmd == "install":
             cmd += ["--update-specs"]
         run_cmdline(cmd)
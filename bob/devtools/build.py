@@ -6,23 +6,47 @@
 
 import contextlib
 import copy
-import distutils.version
 import glob
+import hashlib
 import json
 import logging
 import os
 import platform
 import re
+import shutil
 import subprocess
 import sys
+import tempfile
 
 import click
-import conda_build.api
-import yaml
 
 logger = logging.getLogger(__name__)
 
 
+_CHANNEL_INDEX_CACHE = {}
+"""In-process cache of downloaded channel indexes, keyed by channel URL"""
+
+
+_CHANNEL_PACKAGES_CACHE = {}
+"""In-process cache of channel index entries, keyed by channel URL, then by
+package name and version"""
+
+
+_MAX_HEAD_REQUESTS = 8
+"""Maximum number of packages to look-up through HTTP HEAD requests, before
+downloading the channel index"""
+
+
+_ENV_DIRECTORY_CACHE = {}
+"""In-process cache of conda environment directories, keyed by conda
+executable and environment name"""
+
+
+_PINS_CACHE = {}
+"""In-process cache of parsed package pins, keyed by configuration file path,
+modification time and size"""
+
+
 @contextlib.contextmanager
 def root_logger_protection():
     """Protects the root logger against spurious (conda) manipulation"""
@@ -79,6 +103,57 @@ def should_skip_build(metadata_tuples):
     return all(m[0].skip() for m in metadata_tuples)
 
 
+def get_channel_index(channel_url):
+    """Returns the conda index of a channel, downloading it only once.
+
+    The index is downloaded on the first request for a given channel and kept
+    in memory for the remainder of the process, so that multiple lookups on
+    the same channel (e.g. for various variants of the same recipe) share the
+    same snapshot.
+
+
+    Args:
+
+      channel_url: The URL of the channel to index
+
+
+    Returns: The channel index, as returned by ``conda.exports.fetch_index()``
+    """
+
+    if channel_url not in _CHANNEL_INDEX_CACHE:
+        from conda.core.index import calculate_channel_urls
+        from conda.exports import fetch_index
+
+        channel_urls = calculate_channel_urls(
+            [channel_url], prepend=False, use_local=False
+        )
+        logger.debug("Downloading channel index from %s", channel_urls)
+        _CHANNEL_INDEX_CACHE[channel_url] = fetch_index(
+            channel_urls=channel_urls
+        )
+
+    return _CHANNEL_INDEX_CACHE[channel_url]
+
+
+def _channel_packages(channel_url):
+    """Returns the entries of a channel index, grouped by name and version
+
+    Grouping happens once per channel, so that repeated look-ups do not need to
+    traverse the whole index.
+    """
+
+    if channel_url not in _CHANNEL_PACKAGES_CACHE:
+        index = get_channel_index(channel_url)
+        packages = {}
+        for dist in index:
+            packages.setdefault((dist.name, dist.version), []).append(
+                (dist, index[dist])
+            )
+        _CHANNEL_PACKAGES_CACHE[channel_url] = packages
+
+    return _CHANNEL_PACKAGES_CACHE[channel_url]
+
+
 def next_build_number(channel_url, basename):
     """Calculates the next build number of a package given the channel.
 
@@ -99,16 +174,6 @@ def next_build_number(channel_url, basename):
     (reversed) build-number.
     """
 
-    from conda.core.index import calculate_channel_urls
-    from conda.exports import fetch_index
-
-    # get the channel index
-    channel_urls = calculate_channel_urls(
-        [channel_url], prepend=False, use_local=False
-    )
-    logger.debug("Downloading channel index from %s", channel_urls)
-    index = fetch_index(channel_urls=channel_urls)
-
     # remove .tar.bz2/.conda from name, then split from the end twice, on '-'
     if basename.endswith(".tar.bz2"):
         name, version, build = basename[:-8].rsplit("-", 2)
@@ -145,13 +210,9 @@ def next_build_number(channel_url, basename):
     # search if package with the same characteristics
     urls = {}
     build_number = 0
-    for dist in index:
-        if (
-            dist.name == name
-            and dist.version == version
-            and dist.build_string.startswith(build_variant)
-        ):  # match!
-            url = index[dist].url
+    for dist, record in _channel_packages(channel_url).get((name, version), []):
+        if dist.build_string.startswith(build_variant):  # match!
+            url = record.url
             logger.debug(
                 "Found match at %s for %s-%s-%s",
                 url,
@@ -160,7 +221,7 @@ def next_build_number(channel_url, basename):
                 build_variant,
             )
             build_number = max(build_number, dist.build_number + 1)
-            urls[index[dist].timestamp] = url.replace(channel_url, "")
+            urls[record.timestamp] = url.replace(channel_url, "")
 
     sorted_urls = [urls[k] for k in reversed(list(urls.keys()))]
 
@@ -187,6 +248,8 @@ def make_conda_config(config, python, append_file, condarc_options):
     """
 
     with root_logger_protection():
+        import conda_build.api
+
         from conda_build.conda_interface import url_path
 
         retval = conda_build.api.get_or_merge_config(
@@ -218,6 +281,8 @@ def make_conda_config(config, python, append_file, condarc_options):
 def get_output_path(metadata, config):
     """Renders the recipe and returns the name of the output file."""
 
+    import conda_build.api
+
     with root_logger_protection():
         return conda_build.api.get_output_file_paths(metadata, config=config)
 
@@ -233,6 +298,8 @@ def use_mambabuild():
 def get_rendered_metadata(recipe_dir, config):
     """Renders the recipe and returns the interpreted YAML file."""
 
+    import conda_build.api
+
     with root_logger_protection():
         # use mambabuild instead
         use_mambabuild()
@@ -246,22 +313,351 @@ def get_parsed_recipe(metadata):
         return metadata[0][0].get_rendered_recipe_text()
 
 
-def exists_on_channel(channel_url, basename):
-    """Checks on the given channel if a package with the specs exist.
+def _source_tree_digest(path):
+    """Computes a hash of the contents of a source tree.
+
+    If the source tree is part of a git repository, then the (content-based)
+    hashes of all tracked files, as well as uncommitted changes are used.
+    Otherwise, all (non-hidden) files are read and hashed.
+    """
+
+    h = hashlib.sha256()
+
+    try:
+        for cmd in (["ls-files", "--stage"], ["diff", "HEAD"]):
+            h.update(
+                subprocess.check_output(
+                    ["git", "-C", path] + cmd + ["--", "."],
+                    stderr=subprocess.DEVNULL,
+                )
+            )
+        return h.hexdigest()
+    except (subprocess.CalledProcessError, OSError):
+        h = hashlib.sha256()  # not a git repository
+
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(k for k in dirs if not k.startswith("."))
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            h.update(os.path.relpath(filename, path).encode())
+            with open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+
+    return h.hexdigest()
+
+
+def get_build_key(recipe_dir, metadata):
+    """Computes a content-addressed key identifying the build of a recipe.
+
+    The key is a hash of the rendered recipe (which, once finalized, includes
+    the exact resolved build and host dependency set), the platform and the
+    source tree the recipe builds.  Build numbers and strings are not part of
+    the key.  If the key of a previously built package is the same, then
+    re-building it would produce the same package.
 
-    This procedure always ignores the package hash code, if one is set.  It
-    differentiates between `.conda` and `.tar.bz2` packages.
 
     Args:
 
-      channel_url: The URL where to look for packages clashes (normally a beta
-        channel)
-      basename: The basename of the tarball to search for
+      recipe_dir: The directory containing the recipe's ``meta.yaml`` file
+      metadata: The rendered recipe metadata, as returned by
+        :py:func:`get_rendered_metadata`
 
-    Returns: A complete package url, if the package already exists in the
-    channel or ``None`` otherwise.
+
+    Returns: a string with the hexadecimal digest of the key
+    """
+
+    recipe = copy.deepcopy(get_parsed_recipe(metadata))
+    recipe.get("build", {}).pop("number", None)
+    recipe.get("build", {}).pop("string", None)
+
+    h = hashlib.sha256()
+    h.update(json.dumps(recipe, sort_keys=True, default=str).encode())
+    h.update(conda_arch().encode())
+    source_dir = os.path.dirname(os.path.realpath(recipe_dir))
+    h.update(_source_tree_digest(source_dir).encode())
+    return h.hexdigest()
+
+
+def set_build_key(config, key):
+    """Records a build key on the metadata (``info/about.json``) of packages
+    built with a given conda-build configuration"""
+
+    config.extra_meta = dict(config.extra_meta or {}, bdt_build_key=key)
+
+
+def get_package_build_key(path):
+    """Reads the build key recorded on a conda package.
+
+    Args:
+
+      path: Path to a (``.conda`` or ``.tar.bz2``) conda package
+
+
+    Returns: the build key recorded on the package metadata, or ``None``, if
+    no build key was recorded
+    """
+
+    import tempfile
+
+    from conda_package_handling.api import extract
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        extract(path, dest_dir=tmpdir, components="info")
+        about = os.path.join(tmpdir, "info", "about.json")
+        if not os.path.exists(about):
+            return None
+        with open(about, "rt") as f:
+            return json.load(f).get("extra", {}).get("bdt_build_key")
+
+
+def _tested_build_key_path(basename):
+    """Returns the path where the build key a package was tested with is
+    cached"""
+
+    from .constants import CACHE_DIR
+
+    return os.path.join(CACHE_DIR, "build-keys", basename + ".key")
+
+
+def get_tested_build_key(basename):
+    """Reads the build key a package was last successfully tested with.
+
+    Packages that pass their tests with a new build key are not re-built, so
+    that key is not recorded on their metadata (see
+    :py:func:`get_package_build_key`).  It is kept on a cache inside the bdt
+    cache directory instead (see :py:func:`record_tested_build_key`).
+
+
+    Args:
+
+      basename: The (file) name of the conda package
+
+
+    Returns: the build key recorded for the package, or ``None``, if no build
+    key was recorded
+    """
+
+    path = _tested_build_key_path(basename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rt") as f:
+        return f.read().strip()
+
+
+def record_tested_build_key(basename, key):
+    """Records the build key a package was successfully tested with.
+
+    Args:
+
+      basename: The (file) name of the conda package
+      key: The build key (see :py:func:`get_build_key`)
     """
 
+    path = _tested_build_key_path(basename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wt") as f:
+        f.write(key + "\n")
+    os.replace(tmp, path)
+
+
+def merge_into_croot(croot, packages):
+    """Merges packages built on isolated build directories into the local
+    channel at a conda-build root directory, and re-indexes it.
+
+    Args:
+
+      croot: The conda-build root directory to merge packages into
+      packages: A list of paths to built packages
+
+
+    Returns: a list with the paths of the merged packages, inside ``croot``
+    """
+
+    import conda_build.api
+
+    retval = []
+    for k in packages:
+        subdir = os.path.join(croot, os.path.basename(os.path.dirname(k)))
+        os.makedirs(subdir, exist_ok=True)
+        logger.info("Merging %s -> %s", k, subdir)
+        shutil.copy2(k, subdir)
+        retval.append(os.path.join(subdir, os.path.basename(k)))
+
+    with root_logger_protection():
+        conda_build.api.update_index(croot)
+
+    return retval
+
+
+_CONDA_COMPILERS = {
+    ("linux", "x86_64"): (
+        "x86_64-conda-linux-gnu-cc",
+        "x86_64-conda-linux-gnu-c++",
+    ),
+    ("linux", "aarch64"): (
+        "aarch64-conda-linux-gnu-cc",
+        "aarch64-conda-linux-gnu-c++",
+    ),
+    ("darwin", "x86_64"): (
+        "x86_64-apple-darwin13.4.0-clang",
+        "x86_64-apple-darwin13.4.0-clang++",
+    ),
+    ("darwin", "arm64"): (
+        "arm64-apple-darwin20.0.0-clang",
+        "arm64-apple-darwin20.0.0-clang++",
+    ),
+}
+"""C and C++ compilers (as activated by conda-build) per system and machine
+type"""
+
+
+def _compiler_cache_environment(tool, executable, cache_dir, croot):
+    """Returns environment variables configuring a compiler cache"""
+
+    if tool == "ccache":
+        retval = dict(
+            CCACHE_DIR=cache_dir,
+            # conda-build uses a different work directory for each build:
+            # rewrite paths relative to the build root so hits are possible
+            CCACHE_BASEDIR=croot,
+            CCACHE_NOHASHDIR="true",
+            CCACHE_COMPILERCHECK="content",
+        )
+    else:
+        retval = dict(SCCACHE_DIR=cache_dir)
+
+    # for recipes driving the compiler directly, e.g.:
+    # export FC="${BDT_COMPILER_LAUNCHER} ${FC}"
+    retval.update(BDT_COMPILER_LAUNCHER=executable)
+
+    # conda compiler activation keeps $CC and $CXX if they are set, so
+    # setuptools and CMake builds use the cache (with the default compilers)
+    compilers = _CONDA_COMPILERS.get(
+        (platform.system().lower(), platform.machine().lower())
+    )
+    if compilers is not None:
+        retval.update(
+            CC="%s %s" % (executable, compilers[0]),
+            CXX="%s %s" % (executable, compilers[1]),
+        )
+    else:
+        retval.update(
+            CMAKE_C_COMPILER_LAUNCHER=executable,
+            CMAKE_CXX_COMPILER_LAUNCHER=executable,
+        )
+
+    return retval
+
+
+def _compiler_cache_append_file(append_file, variables):
+    """Writes a copy of a recipe-append file that exposes ``variables`` to
+    build scripts (conda-build otherwise strips them from the build
+    environment)"""
+
+    import tempfile
+
+    with open(append_file, "rt") as f:
+        contents = f.read()
+
+    if re.search(r"^build\s*:", contents, re.MULTILINE):
+        logger.warning(
+            "Recipe-append file %s already contains a build section - not "
+            "exposing compiler cache settings to build scripts",
+            append_file,
+        )
+        return append_file
+
+    contents = contents.rstrip("\n") + "\n\nbuild:\n  script_env:\n"
+    contents += "".join("    - %s\n" % k for k in sorted(variables))
+
+    fd, path = tempfile.mkstemp(prefix="recipe_append-", suffix=".yaml")
+    with os.fdopen(fd, "wt") as f:
+        f.write(contents)
+    return path
+
+
+@contextlib.contextmanager
+def compiler_cache(tool, append_file, croot):
+    """Sets up a compiler cache (ccache or sccache) for conda-build.
+
+    The cache is kept under the bdt cache directory (``.cache/bdt`` on the CI,
+    which is preserved by :py:func:`git_clean_build` and across jobs), so that
+    compiled recipes re-use object files from previous builds.  The C and
+    C++ compilers (``$CC`` and ``$CXX``) of builds are wrapped by the cache.
+    Hit/miss statistics are printed, and the environment is restored, when
+    the context exits.
+
+    Args:
+
+      tool: Either ``ccache`` or ``sccache``.  If ``None``, then this context
+        manager does nothing
+      append_file: Path leading to the ``recipe_append.yaml`` file to use
+      croot: The conda-build root directory, where builds take place
+
+
+    Returns: A context manager yielding the path to the ``recipe_append.yaml``
+    file that should be used for builds
+    """
+
+    from .constants import CACHE_DIR
+
+    if tool is None:
+        yield append_file
+        return
+
+    executable = shutil.which(tool)
+    if executable is None:
+        raise RuntimeError(
+            "Cannot find `%s' on your path - install it on the environment "
+            "running bdt (e.g. with ``mamba install %s``)" % (tool, tool)
+        )
+
+    cache_dir = os.path.join(CACHE_DIR, tool)
+    os.makedirs(cache_dir, exist_ok=True)
+    logger.info("Using %s for compiled code (cache at %s)", tool, cache_dir)
+
+    variables = _compiler_cache_environment(tool, executable, cache_dir, croot)
+    previous = dict((k, os.environ.get(k)) for k in variables)
+    for k, v in variables.items():
+        logger.debug('environ["%s"] = %s', k, v)
+        os.environ[k] = v
+
+    try:
+        # zero statistics so the report only covers this run
+        subprocess.call([executable, "--zero-stats"], stdout=subprocess.DEVNULL)
+
+        path = _compiler_cache_append_file(append_file, variables)
+        try:
+            yield path
+        finally:
+            if path != append_file:
+                os.unlink(path)
+            stats = subprocess.run(
+                [executable, "--show-stats"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+            logger.info(
+                "%s statistics:\n%s",
+                tool,
+                stats.stdout.decode(errors="replace"),
+            )
+
+    finally:
+        # later steps (e.g. the next package of a nightly) may not use a cache
+        for k, v in previous.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _exists_in_index(channel_url, basename):
+    """Checks on the (cached) channel index if a package exists, ignoring its
+    hash code"""
+
     build_number, urls = next_build_number(channel_url, basename)
 
     def _get_build_number(name):
@@ -290,15 +686,98 @@ def exists_on_channel(channel_url, basename):
         return s[1] if len(s) == 2 else s[0]
 
     self_build_number = _get_build_number(basename)
-    other_build_numbers = dict(
-        [(k, _get_build_number(os.path.basename(k))) for k in urls]
-    )
+    pkg_type = ".conda" if basename.endswith(".conda") else ".tar.bz2"
+    for k in urls:
+        if k.endswith(pkg_type) and (
+            _get_build_number(os.path.basename(k)) == self_build_number
+        ):  # match
+            return "".join((channel_url, k))
+
+
+def _head_on_channel(channel_url, paths):
+    """Checks for exact package matches on a channel through HTTP HEAD requests
+
+    Returns a dictionary mapping each path found on the channel to its URL.
+    Paths that cannot be checked (e.g. private channels requiring
+    authentication, network errors) are simply left out.
+    """
 
-    if self_build_number in other_build_numbers.values():
-        pkg_type = ".conda" if basename.endswith(".conda") else ".tar.bz2"
-        for k, v in other_build_numbers.items():
-            if k.endswith(pkg_type):  # match
-                return "".join((channel_url, k))
+    import requests
+
+    retval = {}
+    with requests.Session() as session:
+        for k in paths:
+            subdir = os.path.basename(os.path.dirname(k))
+            url = "/".join((channel_url, subdir, os.path.basename(k)))
+            try:
+                response = session.head(url, allow_redirects=True, timeout=10)
+            except requests.RequestException as e:
+                logger.debug("HEAD %s failed: %s", url, e)
+                continue
+            logger.debug("HEAD %s -> %d", url, response.status_code)
+            if response.status_code == 200:
+                retval[k] = url
+    return retval
+
+
+def find_on_channel(channel_url, paths):
+    """Checks on the given channel which of the packages exist.
+
+    This procedure always ignores the package hash code, if one is set.  It
+    differentiates between `.conda` and `.tar.bz2` packages.  All packages are
+    looked up in a single (in-process cached) snapshot of the channel index.
+    If the index was not downloaded yet and only a few packages are queried,
+    exact matches are first searched for through HTTP HEAD requests, avoiding
+    the index download when all packages exist.
+
+    Args:
+
+      channel_url: The URL where to look for packages clashes (normally a beta
+        channel)
+      paths: Paths (or basenames) of the tarballs to search for, as returned
+        by :py:func:`get_output_path`.  The name of the parent directory, if
+        set, should be the conda subdir (e.g. ``linux-64`` or ``noarch``)
+
+    Returns: A list with complete package urls, in the same order as
+    ``paths``.  Entries are ``None`` for packages that do not exist in the
+    channel.
+    """
+
+    found = {}
+    if (
+        channel_url not in _CHANNEL_PACKAGES_CACHE
+        and len(paths) <= _MAX_HEAD_REQUESTS
+    ):
+        found = _head_on_channel(
+            channel_url, [k for k in paths if os.path.dirname(k)]
+        )
+
+    return [
+        found[k]
+        if k in found
+        else _exists_in_index(channel_url, os.path.basename(k))
+        for k in paths
+    ]
+
+
+def exists_on_channel(channel_url, basename):
+    """Checks on the given channel if a package with the specs exist.
+
+    This procedure always ignores the package hash code, if one is set.  It
+    differentiates between `.conda` and `.tar.bz2` packages.  To check for
+    various packages at once, prefer :py:func:`find_on_channel`.
+
+    Args:
+
+      channel_url: The URL where to look for packages clashes (normally a beta
+        channel)
+      basename: The basename of the tarball to search for
+
+    Returns: A complete package url, if the package already exists in the
+    channel or ``None`` otherwise.
+    """
+
+    return find_on_channel(channel_url, [basename])[0]
 
 
 def remove_pins(deps):
@@ -356,19 +835,57 @@ def parse_dependencies(recipe_dir, config):
     return uniq(requirements)
 
 
-def get_env_directory(conda, name):
-    """Get the directory of a particular conda environment or fail silently."""
+def _is_conda_env(path):
+    """Tells if a given directory contains a conda environment"""
+
+    return os.path.isdir(os.path.join(path, "conda-meta"))
+
+
+def _list_env_directories(conda):
+    """Lists environments of a conda installation without running conda.
+
+    This function searches for environments in the same places ``conda env
+    list`` would: the installation root, the environment directories and the
+    user's ``~/.conda/environments.txt`` registry.  The installation root is
+    inferred from the location of the conda (or mamba) executable.
+
+
+    Args:
+
+      conda: path to the main conda executable of the installation
 
-    cmd = [conda, "env", "list", "--json"]
-    output = subprocess.check_output(cmd)
-    data = json.loads(output)
-    paths = data.get("envs", [])
 
-    if not paths:
-        # real error condition, reports it at least, but no exception raising...
-        logger.error("No environments in conda (%s) installation?", conda)
+    Returns: a list of environment directories, starting with the base
+    environment, or ``None``, if the installation root could not be inferred.
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.realpath(conda)))
+    if not _is_conda_env(root):
         return None
 
+    home = os.path.expanduser("~")
+    envs_dirs = os.environ.get("CONDA_ENVS_PATH", "").split(os.pathsep)
+    envs_dirs += os.environ.get("CONDA_ENVS_DIRS", "").split(os.pathsep)
+    envs_dirs += [
+        os.path.join(root, "envs"),
+        os.path.join(home, ".conda", "envs"),
+    ]
+
+    paths = [root]
+    for d in [k for k in envs_dirs if k and os.path.isdir(k)]:
+        paths += [os.path.join(d, k) for k in sorted(os.listdir(d))]
+
+    environments_txt = os.path.join(home, ".conda", "environments.txt")
+    if os.path.exists(environments_txt):
+        with open(environments_txt, "rt") as f:
+            paths += [k.strip() for k in f if k.strip()]
+
+    return uniq([k for k in paths if _is_conda_env(k)])
+
+
+def _find_env_directory(paths, name):
+    """Finds the directory of a named environment in a list of paths"""
+
     if name in ("base", "root"):
         return paths[0]  # first environment is base
 
@@ -381,12 +898,400 @@ def get_env_directory(conda, name):
     return None
 
 
-def conda_create(conda, name, overwrite, condarc, packages, dry_run, use_local):
+def get_env_directory(conda, name):
+    """Get the directory of a particular conda environment or fail silently.
+
+    Environments are first searched for on the file system, with results
+    cached for the lifetime of the process.  We only resort to ``conda env
+    list`` if an environment cannot be found that way.
+    """
+
+    key = (conda, name)
+    retval = _ENV_DIRECTORY_CACHE.get(key)
+    if retval is not None and _is_conda_env(retval):
+        return retval
+
+    paths = _list_env_directories(conda)
+    retval = _find_env_directory(paths, name) if paths else None
+
+    if retval is None:
+        cmd = [conda, "env", "list", "--json"]
+        output = subprocess.check_output(cmd)
+        data = json.loads(output)
+        paths = data.get("envs", [])
+
+        if not paths:
+            # real error condition, reports it at least, but no exception raising...
+            logger.error("No environments in conda (%s) installation?", conda)
+            return None
+
+        retval = _find_env_directory(paths, name)
+
+    if retval is not None:
+        _ENV_DIRECTORY_CACHE[key] = retval
+
+    return retval
+
+
+def _environment_metadata(packages, channels):
+    """Returns all inputs that may influence the solution of an environment
+
+    These are the (sorted) package specifications, channels and the current
+    platform.
+    """
+
+    return dict(
+        packages=sorted(packages),
+        channels=list(channels),
+        platform=conda_arch(),
+    )
+
+
+def _environment_digest(packages, channels):
+    """Returns a hash of all inputs influencing the solution of an environment"""
+
+    key = json.dumps(_environment_metadata(packages, channels), sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _lockfile_path(packages, channels):
+    """Returns the path of the lockfile for a particular environment setup.
+
+    Lockfiles are kept in the bdt cache directory and are keyed by a hash of
+    all inputs that may influence the solution of an environment.
+    """
+
+    from .constants import CACHE_DIR
+
+    digest = _environment_digest(packages, channels)
+    return os.path.join(CACHE_DIR, "lockfiles", "%s.txt" % digest)
+
+
+def _write_lockfile(conda, target, path):
+    """Saves an explicit specification (URLs and hashes) of an environment"""
+
+    cmd = [conda, "list", "--explicit", "--md5"] + target
+    logger.debug("$ " + " ".join(cmd))
+    output = subprocess.check_output(cmd).decode()
+
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    tmpfile = path + ".%d" % os.getpid()
+    with open(tmpfile, "wt") as f:
+        f.write(output)
+    os.replace(tmpfile, path)  # atomic
+    logger.info("Saved lockfile for environment `%s' at %s", target[1], path)
+
+
+def _create_environment(
+    conda,
+    target,
+    channels,
+    specs,
+    dry_run,
+    use_local,
+    lockfile,
+    refresh_lockfile,
+):
+    """Creates a conda environment, from a lockfile or solving from scratch
+
+    Args:
+      conda: path to the main conda executable of the installation
+      target: a list with conda command-line options indicating the
+        environment to create (e.g. ``["--name", "myenv"]``, or ``["--prefix",
+        "/path/to/env"]``)
+      channels: list of channels to use for solving the environment
+      specs: list of package specifications to install
+      dry_run: if set, then don't execute anything, just print stuff
+      use_local: include the local conda-bld directory as a possible
+        installation channel
+      lockfile: path of the lockfile to install from (if it exists), or to
+        save after solving.  If ``None``, then lockfiles are not used.
+      refresh_lockfile: if set, then ignore an existing lockfile, solving the
+        environment from scratch, and then update the lockfile
+    """
+
+    from .bootstrap import run_cmdline, span
+
+    if (
+        lockfile is not None
+        and not refresh_lockfile
+        and os.path.exists(lockfile)
+    ):
+        logger.info("Installing environment `%s' from %s", target[1], lockfile)
+        cmd = [conda, "create", "--yes"] + target + ["--file", lockfile]
+        if dry_run:
+            cmd.append("--dry-run")
+        try:
+            with span("solve", env=target[1], lockfile=lockfile):
+                run_cmdline(cmd)
+            return
+        except RuntimeError as e:
+            logger.warning(
+                "Installation from lockfile failed (%s) - re-solving...", e
+            )
+            os.unlink(lockfile)
+            cmd = [conda, "env", "remove", "--yes"] + target
+            logger.debug("$ " + " ".join(cmd))
+            if not dry_run:
+                run_cmdline(cmd)
+
+    cmdline_channels = ["--channel=%s" % k for k in channels]
+    cmd = (
+        [conda, "create", "--yes"]
+        + target
+        + ["--override-channels"]
+        + cmdline_channels
+    )
+    if dry_run:
+        cmd.append("--dry-run")
+    if use_local:
+        cmd.append("--use-local")
+    cmd.extend(sorted(specs))
+    with span("solve", env=target[1]):
+        run_cmdline(cmd)
+
+    if lockfile is not None and not dry_run:
+        _write_lockfile(conda, target, lockfile)
+
+
+def _closest_template(templates_dir, packages, channels):
+    """Finds the template environment most similar to a given setup.
+
+    Only finished templates (see :py:func:`_template_ready`) for the same
+    platform, channels and python version are considered.  Amongst those, the
+    one sharing the largest number of package specifications is returned.
+    Ties are broken by the smallest number of extra specifications (packages
+    that would have to be removed), then by the most recent template.
+
+    Returns: the path to the closest template environment, or ``None``, if no
+    suitable template exists.
+    """
+
+    metadata = _environment_metadata(packages, channels)
+    python = [k for k in metadata["packages"] if k.startswith("python=")]
+
+    candidates = []
+    for path in glob.glob(os.path.join(templates_dir, "*.json")):
+        prefix = os.path.splitext(path)[0]
+        if not _template_ready(prefix):
+            continue
+        with open(path, "rt") as f:
+            other = json.load(f)
+        if other["platform"] != metadata["platform"]:
+            continue
+        if other["channels"] != metadata["channels"]:
+            continue
+        if [k for k in other["packages"] if k.startswith("python=")] != python:
+            continue
+        shared = len(set(other["packages"]) & set(metadata["packages"]))
+        extra = len(set(other["packages"]) - set(metadata["packages"]))
+        candidates.append((shared, -extra, os.path.getmtime(path), prefix))
+
+    if not candidates:
+        return None
+
+    return sorted(candidates)[-1][-1]
+
+
+def _template_ready(prefix):
+    """Tells if a template environment was completely created
+
+    The metadata file of a template (``<prefix>.json``) is only written after
+    the template environment was successfully created, so it is the only
+    proof of a finished template.
+    """
+
+    return os.path.exists(prefix + ".json") and _is_conda_env(prefix)
+
+
+def _installed_packages(prefix):
+    """Returns the packages installed on an environment, without running conda
+
+    Returns a dictionary mapping package names to tuples with their version
+    and build string.
+    """
+
+    retval = {}
+    for path in glob.glob(os.path.join(prefix, "conda-meta", "*.json")):
+        with open(path, "rt") as f:
+            record = json.load(f)
+        retval[record["name"]] = (record["version"], record["build"])
+    return retval
+
+
+def _solve(conda, channels, specs):
+    """Solves an environment without creating it
+
+    Returns a dictionary mapping package names to tuples with their version
+    and build string, for all packages of a fresh environment created from
+    the given specifications.
+    """
+
+    cmd = (
+        [conda, "create", "--yes", "--dry-run", "--json"]
+        + ["--prefix", os.path.join(tempfile.gettempdir(), "bdt-solve")]
+        + ["--override-channels"]
+        + ["--channel=%s" % k for k in channels]
+        + sorted(specs)
+    )
+    logger.debug("$ " + " ".join(cmd))
+    try:
+        output = json.loads(subprocess.check_output(cmd))
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(
+            "cannot solve environment for %s (%s)" % (", ".join(specs), e)
+        )
+    return dict(
+        (k["name"], (k["version"], k["build_string"]))
+        for k in output["actions"]["LINK"]
+    )
+
+
+def _update_template(conda, prefix, channels, specs):
+    """Turns a clone of another template into a template for the given specs
+
+    The clone is made identical to a fresh environment created from the
+    specifications: packages of the original template that are not part of
+    the solution are removed, and packages of the solution that are missing
+    (or differ) are installed with their exact versions and builds, without
+    solving the environment again (the solution is already complete).
+    """
+
+    from .bootstrap import run_cmdline, span
+
+    with span("solve", env=prefix):
+        solution = _solve(conda, channels, specs)
+
+    installed = _installed_packages(prefix)
+    extra = sorted(set(installed) - set(solution))
+    if extra:
+        logger.info("Removing %s from %s", ", ".join(extra), prefix)
+        cmd = [conda, "remove", "--yes", "--force-remove", "--prefix", prefix]
+        run_cmdline(cmd + extra)
+
+    missing = sorted(k for k, v in solution.items() if installed.get(k) != v)
+    if not missing:
+        return
+
+    logger.info("Installing %s on %s", ", ".join(missing), prefix)
+    cmd = (
+        [conda, "install", "--yes", "--no-deps", "--prefix", prefix]
+        + ["--override-channels"]
+        + ["--channel=%s" % k for k in channels]
+        + ["%s==%s=%s" % (k, solution[k][0], solution[k][1]) for k in missing]
+    )
+    with span("install", env=prefix):
+        run_cmdline(cmd)
+
+
+def _get_template(conda, channels, specs, lockfile, refresh_lockfile):
+    """Returns a template environment for the given setup, creating it if
+    needed.
+
+    Template environments are kept in the bdt cache directory and are keyed
+    by a hash of all inputs that may influence the solution of an environment
+    (package specifications, which include the python version, channels and
+    platform).  If a matching template does not exist, then the closest
+    existing template is cloned and made identical to a fresh solution of the
+    specifications (only the differences are installed or removed).  If no
+    suitable template exists, then a new one is created from scratch (or from
+    its lockfile).  Templates that could not be created are removed.
+
+    Returns: the path to the template environment
+    """
+
+    from .bootstrap import run_cmdline, span
+    from .constants import CACHE_DIR
+
+    templates_dir = os.path.join(CACHE_DIR, "templates")
+    digest = _environment_digest(specs, channels)
+    prefix = os.path.join(templates_dir, digest)
+
+    if _template_ready(prefix) and not refresh_lockfile:
+        logger.info("Using template environment at %s", prefix)
+        return prefix
+
+    if os.path.exists(prefix + ".json"):
+        os.unlink(prefix + ".json")
+    if os.path.exists(prefix):
+        logger.info("Removing outdated template environment at %s", prefix)
+        shutil.rmtree(prefix)
+
+    if not os.path.exists(templates_dir):
+        os.makedirs(templates_dir)
+
+    target = ["--prefix", prefix]
+    closest = None
+    if not refresh_lockfile:
+        closest = _closest_template(templates_dir, specs, channels)
+
+    try:
+        if closest is not None:
+            logger.info(
+                "Creating template environment at %s from %s", prefix, closest
+            )
+            cmd = [conda, "create", "--yes"] + target + ["--clone", closest]
+            with span("clone", env=prefix):
+                run_cmdline(cmd)
+            _update_template(conda, prefix, channels, specs)
+        else:
+            logger.info("Creating template environment at %s", prefix)
+            _create_environment(
+                conda,
+                target,
+                channels,
+                specs,
+                dry_run=False,
+                use_local=False,
+                lockfile=lockfile,
+                refresh_lockfile=refresh_lockfile,
+            )
+    except Exception:
+        if os.path.exists(prefix):
+            logger.warning("Removing incomplete template at %s", prefix)
+            shutil.rmtree(prefix)
+        raise
+
+    # written last: marks the template as finished
+    tmpfile = prefix + ".json.%d" % os.getpid()
+    with open(tmpfile, "wt") as f:
+        json.dump(_environment_metadata(specs, channels), f, indent=2)
+    os.replace(tmpfile, prefix + ".json")
+
+    return prefix
+
+
+def conda_create(
+    conda,
+    name,
+    overwrite,
+    condarc,
+    packages,
+    dry_run,
+    use_local,
+    use_lockfile=False,
+    refresh_lockfile=False,
+    use_template=False,
+):
     """Creates a new conda environment following package specifications.
 
     This command can create a new conda environment following the list of input
     packages.  It will overwrite an existing environment if indicated.
 
+    If ``use_lockfile`` is set, then after a successful creation, the explicit
+    list of installed packages (URLs and hashes) is saved to a lockfile in the
+    bdt cache directory.  Later calls with the same inputs (package
+    specifications, channels and platform) install directly from that
+    lockfile, skipping the solver.
+
+    If ``use_template`` is set, then a template environment for the same
+    inputs is kept in the bdt cache directory, and the new environment is
+    created by cloning it (hard-linking files).  Templates for new inputs are
+    created by cloning the closest existing template and only installing the
+    differences.
+
     Args:
       conda: path to the main conda executable of the installation
       name: the name of the environment to create or overwrite
@@ -398,9 +1303,20 @@ def conda_create(conda, name, overwrite, condarc, packages, dry_run, use_local):
       use_local: include the local conda-bld directory as a possible installation
         channel (useful for testing multiple interdependent recipes that are
         built locally)
+      use_lockfile: if set, then install from (and save) a lockfile for this
+        environment.  Lockfiles are never used if ``use_local`` is set, as
+        locally built packages may change without notice.
+      refresh_lockfile: if set, then ignore an existing lockfile (and
+        template) for this environment, solving it from scratch, and then
+        update the lockfile (and template)
+      use_template: if set, then create the environment by cloning a template
+        environment.  Templates are never used if ``use_local`` or ``dry_run``
+        are set.
     """
 
-    from .bootstrap import run_cmdline
+    import yaml
+
+    from .bootstrap import run_cmdline, span
 
     specs = []
     for k in packages:
@@ -424,21 +1340,28 @@ def conda_create(conda, name, overwrite, condarc, packages, dry_run, use_local):
                 "--overwrite to overwrite" % (name, envdir)
             )
 
-    cmdline_channels = ["--channel=%s" % k for k in condarc["channels"]]
-    cmd = [
-        conda,
-        "create",
-        "--yes",
-        "--name",
-        name,
-        "--override-channels",
-    ] + cmdline_channels
-    if dry_run:
-        cmd.append("--dry-run")
-    if use_local:
-        cmd.append("--use-local")
-    cmd.extend(sorted(specs))
-    run_cmdline(cmd)
+    lockfile = None
+    if use_lockfile and not use_local:
+        lockfile = _lockfile_path(specs, condarc["channels"])
+
+    if use_template and not (use_local or dry_run):
+        template = _get_template(
+            conda, condarc["channels"], specs, lockfile, refresh_lockfile
+        )
+        cmd = [conda, "create", "--yes", "--name", name, "--clone", template]
+        with span("clone", env=name):
+            run_cmdline(cmd)
+    else:
+        _create_environment(
+            conda,
+            ["--name", name],
+            condarc["channels"],
+            specs,
+            dry_run,
+            use_local,
+            lockfile,
+            refresh_lockfile,
+        )
 
     # creates a .condarc file to sediment the just created environment
     if not dry_run:
@@ -562,6 +1485,8 @@ def check_version(workdir, envtag):
     pre-release or a stable release.
     """
 
+    import distutils.version
+
     version = open(os.path.join(workdir, "version.txt"), "rt").read().rstrip()
 
     # if we're building a stable release, ensure a tag is set
@@ -612,6 +1537,7 @@ def git_clean_build(runner, verbose):
         "sphinx",  # build artifact -- documentation
         "test_results.xml",  # build artifact -- tests report
         "coverage.xml",  # build artifact -- coverage report
+        "timings-*.json",  # build artifact -- timing report
     ]
 
     # artifacts
@@ -675,6 +1601,8 @@ def base_build(
       ``conda_build.api.build()``
     """
 
+    import conda_build.api
+
     # if you get to this point, tries to build the package
     channels, upload_channel = bootstrap.get_channels(
         public=True,
@@ -697,7 +1625,8 @@ def base_build(
         conda_build_config, None, None, condarc_options
     )
 
-    metadata = get_rendered_metadata(recipe_dir, conda_config)
+    with bootstrap.span("render", recipe=recipe_dir):
+        metadata = get_rendered_metadata(recipe_dir, conda_config)
     arch = conda_arch()
 
     # checks we should actually build this recipe
@@ -708,9 +1637,8 @@ def base_build(
         return
 
     paths = get_output_path(metadata, conda_config)
-    urls = [
-        exists_on_channel(upload_channel, os.path.basename(k)) for k in paths
-    ]
+    with bootstrap.span("channel", recipe=recipe_dir):
+        urls = find_on_channel(upload_channel, paths)
 
     if all(urls):
         logger.info(
@@ -731,40 +1659,146 @@ def base_build(
 
     # if you get to this point, just builds the package(s)
     logger.info("Building %s", recipe_dir)
-    with root_logger_protection():
+    with root_logger_protection(), bootstrap.span("build", recipe=recipe_dir):
         use_mambabuild()
         return conda_build.api.build(recipe_dir, config=conda_config)
 
 
+def _selector_namespace():
+    """Returns the namespace to evaluate conda-build selectors on pins.
+
+    This is a lightweight version of conda-build's ``ns_cfg()``, covering the
+    platform selectors that can be evaluated without a conda-build
+    configuration.
+    """
+
+    arch = conda_arch()  # e.g. linux-64, osx-arm64
+    system, _, machine = arch.partition("-")
+    return dict(
+        linux=(system == "linux"),
+        osx=(system == "osx"),
+        win=False,
+        unix=True,
+        linux64=(arch == "linux-64"),
+        aarch64=(arch == "linux-aarch64"),
+        arm64=(arch == "osx-arm64"),
+        x86_64=(machine == "64"),
+        x86=(machine == "64"),
+        ppc64le=False,
+        armv7l=False,
+        s390x=False,
+        os=os,
+        environ=os.environ,
+    )
+
+
+def _select_lines(content, namespace):
+    """Evaluates conda-build selectors (``# [expr]``) in YAML contents
+
+    Lines with selectors evaluating to ``False`` are removed.  Selectors are
+    removed from the remaining lines.
+    """
+
+    selector = re.compile(r"^(.*?)\s*#\s*\[(.+)\]\s*$")
+
+    retval = []
+    for line in content.splitlines():
+        m = selector.match(line)
+        if m is None:
+            retval.append(line)
+            continue
+        try:
+            keep = eval(m.group(2), {}, namespace)
+        except NameError as e:
+            raise RuntimeError(
+                "Unsupported selector `[%s]' in pins: %s" % (m.group(2), e)
+            )
+        if keep:
+            retval.append(m.group(1))
+
+    return "\n".join(retval) + "\n"
+
+
+def load_conda_build_config_pins(conda_build_config):
+    """Loads the package pins section of a conda_build_config.yaml file.
+
+    Pins are read from the section of the file between the ``# AUTOMATIC
+    PARSING START`` and ``# AUTOMATIC PARSING END`` markers.  Selectors are
+    evaluated for the current platform without using conda-build.  Parsed
+    results are cached for the lifetime of the process, and are refreshed if
+    the file is modified.
+
+
+    Args:
+
+      conda_build_config: Path to the ``conda_build_config.yaml`` file to read
+
+
+    Returns: a tuple containing a dictionary mapping (variant) package names to
+    their pinned versions (as strings, including eventual build string
+    specifications, such as ``cuda*``), and a dictionary mapping variant names
+    to conda package names, for packages which contain dashes or dots in their
+    names.
+    """
+
+    import yaml
+
+    stat = os.stat(conda_build_config)
+    key = (
+        os.path.realpath(conda_build_config),
+        stat.st_mtime_ns,
+        stat.st_size,
+    )
+
+    if key not in _PINS_CACHE:
+        with open(conda_build_config, "r") as f:
+            content = f.read()
+
+        idx1 = content.find("# AUTOMATIC PARSING START")
+        idx2 = content.find("# AUTOMATIC PARSING END")
+        content = _select_lines(content[idx1:idx2], _selector_namespace())
+
+        package_pins = yaml.safe_load(content)
+        package_names_map = package_pins.pop("package_names_map")
+        pins = dict((k, str(v[0])) for k, v in package_pins.items())
+        _PINS_CACHE[key] = (pins, package_names_map)
+
+    pins, package_names_map = _PINS_CACHE[key]
+    return dict(pins), dict(package_names_map)
+
+
 def load_packages_from_conda_build_config(
-    conda_build_config, condarc_options, with_pins=False
+    conda_build_config, condarc_options=None, with_pins=False
 ):
-    with open(conda_build_config, "r") as f:
-        content = f.read()
+    """Lists the packages pinned in a conda_build_config.yaml file.
+
+    See :py:func:`load_conda_build_config_pins` for details.
+
 
-    idx1 = content.find("# AUTOMATIC PARSING START")
-    idx2 = content.find("# AUTOMATIC PARSING END")
-    content = content[idx1:idx2]
+    Args:
 
-    # filter out using conda-build specific markers
-    from conda_build.metadata import ns_cfg, select_lines
+      conda_build_config: Path to the ``conda_build_config.yaml`` file to read
+      condarc_options: Unused, kept for backwards compatibility
+      with_pins: If set, return package specifications including the pinned
+        version (e.g. ``numpy=1.23.4``), instead of just package names
 
-    config = make_conda_config(conda_build_config, None, None, condarc_options)
-    content = select_lines(content, ns_cfg(config), variants_in_place=False)
 
-    package_pins = yaml.safe_load(content)
+    Returns: a tuple containing the list of conda package names (or
+    specifications) and a dictionary mapping variant names to conda package
+    names.
+    """
 
-    package_names_map = package_pins.pop("package_names_map")
+    pins, package_names_map = load_conda_build_config_pins(conda_build_config)
 
     if with_pins:
         # NB : in pins, need to strip the occasional " cuda*" suffix
         # tensorflow=x.x.x cuda* -> tensorflow=x.x.x
         packages = [
-            f"{package_names_map.get(p, p)}={str(v[0]).split(' ')[0]}"
-            for p, v in package_pins.items()
+            f"{package_names_map.get(p, p)}={v.split(' ')[0]}"
+            for p, v in pins.items()
         ]
     else:
-        packages = [package_names_map.get(p, p) for p in package_pins.keys()]
+        packages = [package_names_map.get(p, p) for p in pins.keys()]
 
     return packages, package_names_map
 
@@ -889,6 +1923,9 @@ def cli(
     test_mark_expr,
 ):
     "Builds bob.devtools on the CI"
+
+    import yaml
+
     ctx.ensure_object(dict)
 
     # loads the "adjacent" bootstrap module
@@ -1008,6 +2045,8 @@ def build_deps(obj):
 )
 @click.pass_obj
 def build_devtools(obj, twine_check):
+    import conda_build.api
+
     bootstrap = obj["bootstrap"]
     condarc_options = obj["condarc_options"]
     conda_build_config = obj["conda_build_config"]
@@ -1052,6 +2091,7 @@ def build_devtools(obj, twine_check):
     # resolved the "wrong" build number.  We'll have to reparse after setting the
     # environment variable BOB_BUILD_NUMBER.
     bootstrap.set_environment("BOB_BUILD_NUMBER", str(build_number))
+
     with root_logger_protection():
         conda_build.api.build(recipe_dir, config=conda_config)
 
@@ -5,11 +5,8 @@
 
 
 import contextlib
-import distutils.version
 import os
 
-import git
-
 from .build import load_order_file
 from .log import echo_info, get_logger
 
@@ -33,6 +30,8 @@ def is_master(refname, tag, repodir):
     the tag being built was issued on the master branch.
     """
 
+    import git
+
     if tag is not None:
         repo = git.Repo(repodir)
         _tag = repo.tag("refs/tags/%s" % tag)
@@ -98,6 +97,8 @@ def is_stable(package, refname, tag, repodir):
     Returns: a boolean, indicating if the current build is for a stable release
     """
 
+    import distutils.version
+
     if tag is not None:
         logger.info('Project %s tag is "%s"', package, tag)
         parsed_tag = distutils.version.LooseVersion(
@@ -142,6 +143,40 @@ def read_packages(filename):
     return packages
 
 
+def read_package_levels(filename):
+    """Return a python list of levels, each a list of tuples (repository,
+    branch), given a file containing one package (and branch) per line.
+
+    Levels are separated by comment lines starting with ``# level``, as
+    written by ``bdt gitlab graph --order``: packages on the same level do not
+    depend on each other.  If the file does not contain any level separators,
+    then each package is considered to be on its own level (i.e. packages
+    depend on all packages listed before them).  Other comments are excluded.
+    """
+
+    levels = [[]]
+    separated = False
+    with open(filename, "rt") as f:
+        for line in f:
+            if line.strip().lower().startswith("# level"):
+                separated = True
+                if levels[-1]:
+                    levels.append([])
+                continue
+            line = line.partition("#")[0].strip()
+            if not line:
+                continue
+            if "," in line:  # user specified a branch
+                path, branch = [k.strip() for k in line.split(",", 1)]
+                levels[-1].append((path, branch))
+            else:
+                levels[-1].append((line, "master"))
+
+    if not separated:
+        return [[k] for k in levels[0]]
+    return [k for k in levels if k]
+
+
 def select_build_file(basename, paths, branch):
     """Selects the file to use for a build.
 
@@ -322,3 +357,396 @@ def temporary_cwd(path):
         yield
     finally:
         os.chdir(oldpwd)
+
+
+def _git_auth(token):
+    """Returns git options to authenticate with a CI job token, if any
+
+    Credentials are passed as an HTTP header instead of being part of the
+    remote URL, so they never get recorded on the (cached) mirrors.
+    """
+
+    if token is None:
+        return {}
+
+    import base64
+
+    credentials = base64.b64encode(
+        ("gitlab-ci-token:%s" % token).encode()
+    ).decode()
+    return dict(c="http.extraHeader=Authorization: Basic %s" % credentials)
+
+
+def mirror_path(package, cache_dir=None):
+    """Returns the path of the local bare mirror of a package repository
+
+    Args:
+
+      package: Fully qualified (i.e., with a namespace) package name
+      cache_dir: The directory where to keep mirrors.  If not set, use
+        ``git`` on the bdt cache directory.
+
+    """
+
+    if cache_dir is None:
+        from .constants import CACHE_DIR
+
+        cache_dir = os.path.join(CACHE_DIR, "git")
+
+    return os.path.join(cache_dir, package + ".git")
+
+
+def mirror_commit(package, branch, cache_dir=None):
+    """Returns the commit a branch points to on the local mirror of a package
+
+    The mirror is not updated (see :py:func:`git_mirror`).
+
+
+    Args:
+
+      package: Fully qualified (i.e., with a namespace) package name
+      branch: The branch to look up
+      cache_dir: The directory where to keep mirrors.  If not set, use
+        ``git`` on the bdt cache directory.
+
+
+    Returns: the commit (hash), or ``None``, if the mirror or the branch do not
+    exist
+
+    """
+
+    import git
+
+    path = mirror_path(package, cache_dir)
+    if not os.path.exists(os.path.join(path, "HEAD")):
+        return None
+    try:
+        return git.Git(path).rev_parse("--verify", "refs/heads/%s" % branch)
+    except git.GitCommandError:
+        return None
+
+
+def git_mirror(baseurl, package, token=None, cache_dir=None, update=True):
+    """Creates or updates a local bare mirror of a package repository
+
+    Mirrors are kept in the bdt cache directory, so that (on CI) they are
+    persisted between jobs.  Only objects missing from the mirror are
+    transferred from the server on each update.
+
+
+    Args:
+
+      baseurl: The base URL for the gitlab service hosting the package
+      package: Fully qualified (i.e., with a namespace) package name
+      token: The CI job token to authenticate with (if ``None``, then do not
+        authenticate)
+      cache_dir: The directory where to keep mirrors.  If not set, use
+        ``git`` on the bdt cache directory.
+      update: If set to ``False``, existing mirrors are not updated (e.g.
+        because they were just updated by another process)
+
+
+    Returns: the path to the updated bare repository
+
+    """
+
+    import git
+
+    path = mirror_path(package, cache_dir)
+    if not os.path.exists(os.path.join(path, "HEAD")):
+        logger.info('Creating mirror of "%s" at %s...', package, path)
+        git.Repo.init(path, bare=True, mkdir=True)
+    elif not update:
+        logger.info('Using mirror of "%s" as is...', package)
+        return path
+
+    logger.info('Updating mirror of "%s"...', package)
+    git.Git(path)(**_git_auth(token)).fetch(
+        "%s/%s" % (baseurl, package),
+        "+refs/heads/*:refs/heads/*",
+        "+refs/tags/*:refs/tags/*",
+        prune=True,
+        quiet=True,
+    )
+
+    return path
+
+
+def git_clone(
+    baseurl,
+    package,
+    branch,
+    clone_to,
+    token=None,
+    cache_dir=None,
+    filter=None,
+    sparse=None,
+    update_mirror=True,
+):
+    """Clones a package repository, borrowing objects from a local mirror
+
+    The local mirror (see :py:func:`git_mirror`) is updated and the clone
+    shares its objects (via git alternates), avoiding to download them from
+    the server again.  The ``origin`` remote of the clone points to the
+    server.  If the mirror cannot be updated, a shallow clone of the package
+    is made directly from the server instead (blobless, for sparse checkouts).
+
+    Sparse checkouts of clones from the mirror do not transfer any objects.
+    Partial clones (e.g. ``filter="blob:none"``) are always made directly from
+    the server, as (full) mirrors would download all objects anyway.
+
+
+    Args:
+
+      baseurl: The base URL for the gitlab service hosting the package
+      package: Fully qualified (i.e., with a namespace) package name
+      branch: The branch to check out
+      clone_to: The directory where to clone the package
+      token: The CI job token to authenticate with (if ``None``, then do not
+        authenticate)
+      cache_dir: The directory where to keep mirrors.  If not set, use
+        ``git`` on the bdt cache directory.
+      filter: If set, make a shallow partial clone of the package from the
+        server, using this object filter (e.g. ``blob:none``)
+      sparse: If set, a list of (gitignore-style) patterns of the files to
+        check out (see ``git sparse-checkout``).  Other files are left out of
+        the working tree.
+      update_mirror: If set to ``False``, an existing mirror is used without
+        updating it
+
+
+    Returns: the cloned repository (:py:class:`git.Repo`)
+
+    """
+
+    import git
+
+    url = "%s/%s" % (baseurl, package)
+    if token is not None:
+        scheme, rest = url.split("://", 1)
+        url = "%s://gitlab-ci-token:%s@%s" % (scheme, token, rest)
+
+    options = dict(branch=branch, no_checkout=bool(sparse))
+
+    if filter is not None:
+        logger.info(
+            'Cloning "%s", branch "%s" (depth=1, filter=%s)...',
+            package,
+            branch,
+            filter,
+        )
+        repo = git.Repo.clone_from(
+            url, clone_to, depth=1, filter=filter, **options
+        )
+
+    else:
+        try:
+            mirror = git_mirror(
+                baseurl, package, token, cache_dir, update=update_mirror
+            )
+        except git.GitCommandError as e:
+            logger.warning(
+                'Cannot update mirror of "%s" (%s) - cloning from server...',
+                package,
+                e.stderr.strip(),
+            )
+            if sparse:
+                options["filter"] = "blob:none"
+            repo = git.Repo.clone_from(url, clone_to, depth=1, **options)
+        else:
+            logger.info(
+                'Cloning "%s", branch "%s" from mirror...', package, branch
+            )
+            repo = git.Repo.clone_from(mirror, clone_to, shared=True, **options)
+            repo.remotes.origin.set_url(url)
+
+    if sparse:
+        logger.info(
+            'Checking out "%s" (sparse: %s)...', package, " ".join(sparse)
+        )
+        repo.git.sparse_checkout("set", "--no-cone", *sparse)
+        repo.git.checkout(branch)
+
+    return repo
+
+
+def channel_state(previous, environment):
+    """Returns a digest of the state of the local channel for a nightly build
+
+    The state of the local channel, before a package is built, is defined by
+    the packages (and commits) built before it, and by the environment of the
+    build (python version, pipeline identifier, etc.).  If any of those
+    change, then previous builds of the package cannot be reused.
+
+
+    Args:
+
+      previous: A list of tuples (package, commit) of packages built before,
+        in build order
+      environment: A dictionary with extra (JSON serializable) variables that
+        influence the build
+
+
+    Returns: a string with the (hexadecimal) digest of the state
+
+    """
+
+    import hashlib
+    import json
+
+    data = json.dumps(
+        dict(previous=previous, environment=environment), sort_keys=True
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def load_checkpoint(path):
+    """Loads records of package builds from a nightlies checkpoint file
+
+    Returns a dictionary mapping package names to their records.  Each
+    record is a dictionary with the keys ``package``, ``branch``, ``commit``,
+    ``channel`` (see :py:func:`channel_state`), ``artifacts`` (paths relative
+    to the checkpoint file directory) and ``result`` (``success`` or
+    ``failed``).  The dictionary is empty if the file does not exist.
+    """
+
+    import json
+
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rt") as f:
+        return json.load(f)
+
+
+def remove_checkpoint(path):
+    """Removes a nightlies checkpoint file and all of its artifacts"""
+
+    import shutil
+
+    basedir = os.path.dirname(path)
+    if os.path.exists(path):
+        logger.info("Removing nightlies checkpoint at %s", path)
+        os.unlink(path)
+    if os.path.exists(os.path.join(basedir, "artifacts")):
+        shutil.rmtree(os.path.join(basedir, "artifacts"))
+
+
+def reset_checkpoint(path, environment):
+    """Removes a nightlies checkpoint recorded on a different environment
+
+    Checkpoints recorded on a different environment (e.g. on another
+    pipeline) cannot be reused, so there is no point in keeping their
+    artifacts (e.g. on the CI cache).  The environment is recorded next to
+    the checkpoint file (``environment.json``).
+
+
+    Args:
+
+      path: Path to the checkpoint file
+      environment: A dictionary with extra (JSON serializable) variables that
+        influence the build (see :py:func:`channel_state`)
+
+    """
+
+    import json
+
+    env_path = os.path.join(os.path.dirname(path), "environment.json")
+    if os.path.exists(env_path):
+        with open(env_path, "rt") as f:
+            if json.load(f) == environment:
+                return
+
+    remove_checkpoint(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%d.tmp" % (env_path, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(environment, f, indent=2, sort_keys=True)
+    os.replace(tmp, env_path)
+
+
+def checkpoint_valid(path, record, commit, channel):
+    """Tells if a checkpoint record may be reused
+
+    Records may only be reused if the package was successfully built before,
+    from the same commit and on the same local channel state, and all of its
+    artifacts are still available.
+
+
+    Args:
+
+      path: Path to the checkpoint file
+      record: The checkpoint record of the package, as returned by
+        :py:func:`load_checkpoint` (may be ``None``)
+      commit: The commit (hash) of the package to be built
+      channel: The local channel state, as returned by
+        :py:func:`channel_state`
+
+
+    Returns: a boolean, indicating the previous build may be reused
+
+    """
+
+    if record is None or record["result"] != "success":
+        return False
+    if record["commit"] != commit or record["channel"] != channel:
+        return False
+    basedir = os.path.dirname(path)
+    return all(
+        os.path.exists(os.path.join(basedir, k)) for k in record["artifacts"]
+    )
+
+
+def record_checkpoint(
+    path, package, branch, commit, channel, artifacts, result
+):
+    """Records the build of a package on a nightlies checkpoint file
+
+    Artifacts are copied next to the checkpoint file, so they remain available
+    if the local channel is lost (e.g. on a new CI job).  Artifacts of
+    previous builds of the package are removed.
+
+
+    Args:
+
+      path: Path to the checkpoint file
+      package: Fully qualified (i.e., with a namespace) package name
+      branch: The branch of the package that was built
+      commit: The commit (hash) of the package that was built
+      channel: The local channel state, as returned by
+        :py:func:`channel_state`
+      artifacts: A list of paths to conda packages built
+      result: Either ``success`` or ``failed``
+
+    """
+
+    import json
+    import shutil
+
+    basedir = os.path.dirname(path)
+    records = load_checkpoint(path)
+
+    for k in records.get(package, {}).get("artifacts", []):
+        if os.path.exists(os.path.join(basedir, k)):
+            os.unlink(os.path.join(basedir, k))
+
+    stored = []
+    for k in artifacts:
+        subdir = os.path.basename(os.path.dirname(k))
+        dest = os.path.join("artifacts", subdir, os.path.basename(k))
+        os.makedirs(os.path.join(basedir, "artifacts", subdir), exist_ok=True)
+        shutil.copy2(k, os.path.join(basedir, dest))
+        stored.append(dest)
+
+    records[package] = dict(
+        package=package,
+        branch=branch,
+        commit=commit,
+        channel=channel,
+        artifacts=stored,
+        result=result,
+    )
+
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(records, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
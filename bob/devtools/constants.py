@@ -5,8 +5,6 @@
 
 import os
 
-import pkg_resources
-
 from . import bootstrap, deploy
 from .log import get_logger
 
@@ -17,14 +15,14 @@ BASE_CONDARC = bootstrap._BASE_CONDARC
 """Default setup for conda builds"""
 
 
-CONDA_BUILD_CONFIG = pkg_resources.resource_filename(
-    __name__, os.path.join("data", "conda_build_config.yaml")
+CONDA_BUILD_CONFIG = os.path.join(
+    os.path.dirname(__file__), "data", "conda_build_config.yaml"
 )
 """Configuration variants we like building"""
 
 
-CONDA_RECIPE_APPEND = pkg_resources.resource_filename(
-    __name__, os.path.join("data", "recipe_append.yaml")
+CONDA_RECIPE_APPEND = os.path.join(
+    os.path.dirname(__file__), "data", "recipe_append.yaml"
 )
 """Extra information to be appended to every recipe upon building"""
 
@@ -86,9 +84,7 @@ CACERT_URL = "https://curl.haxx.se/ca/cacert.pem"
 """Location of the most up-to-date CA certificate bundle"""
 
 
-CACERT = pkg_resources.resource_filename(
-    __name__, os.path.join("data", "cacert.pem")
-)
+CACERT = os.path.join(os.path.dirname(__file__), "data", "cacert.pem")
 """We keep a copy of the CA certificates we trust here
 
    To update this file use: ``curl --remote-name --time-cond cacert.pem https://curl.haxx.se/ca/cacert.pem``
@@ -97,14 +93,34 @@ CACERT = pkg_resources.resource_filename(
 """
 
 
-MATPLOTLIB_RCDIR = pkg_resources.resource_filename(__name__, "data")
+MATPLOTLIB_RCDIR = os.path.join(os.path.dirname(__file__), "data")
 """Base directory where the file matplotlibrc lives
 
 It is required for certain builds that use matplotlib functionality.
 """
 
-BOBRC_PATH = pkg_resources.resource_filename(
-    __name__, os.path.join("data", "bobrc")
-)
+BOBRC_PATH = os.path.join(os.path.dirname(__file__), "data", "bobrc")
 """The path to custom Bob configuration file to be used during the CI
 """
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "bdt"
+)
+"""Base directory where bdt keeps caches that persist across runs
+
+Follows the XDG base directory specification, so that CI jobs (which set
+``XDG_CACHE_HOME`` to a directory inside the project) keep it together with
+other functional caches.
+"""
+
+DOCS_SPARSE_CHECKOUT = (
+    "/*",
+    "!**/test/data/",
+    "!**/tests/data/",
+)
+"""Sparse checkout patterns of packages cloned for the aggregated documentation
+
+Keeps all files and (package) directories of the package, whatever the name
+of its top-level modules (e.g. ``bob/``, ``gridtk/`` or ``src/``), which are
+required for autodoc, but not test data.
+"""
@@ -5,8 +5,6 @@ import hashlib
 import pathlib
 import re
 
-from distutils.version import StrictVersion
-
 import dateutil.parser
 
 from .config import read_config
@@ -131,6 +129,8 @@ def remove_old_beta_packages(client, path, dry_run, pyver=True, includes=None):
 
     """
 
+    from distutils.version import StrictVersion
+
     server_path = client.get_url(path)
 
     if not client.is_dir(path):
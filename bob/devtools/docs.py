@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Caches that speed-up (aggregated) documentation builds."""
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+
+INTERSPHINX_TTL = 24 * 60 * 60
+"""Time (in seconds) intersphinx inventories are used from the cache without
+checking for updates.  May be overridden by the environment variable
+``BDT_INTERSPHINX_TTL``"""
+
+_MAX_INVENTORY_REQUESTS = 8
+"""Maximum number of intersphinx inventories to download concurrently"""
+
+
+def sphinx_cache_dir(project):
+    """Returns the directory where the Sphinx build cache of a project is kept
+
+    Args:
+
+      project: The (gitlab) path of the project building the documentation
+        (e.g. ``bob/docs``)
+
+    """
+
+    from .constants import CACHE_DIR
+
+    return os.path.join(CACHE_DIR, "sphinx", project)
+
+
+def _set_mtime(path, mtime):
+    """Sets the modification time of all files inside a directory"""
+
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [k for k in dirs if k != ".git"]
+        for name in files:
+            filename = os.path.join(root, name)
+            if not os.path.islink(filename):
+                os.utime(filename, (mtime, mtime))
+
+
+def freeze_unchanged_sources(directories, state_path):
+    """Hides fresh checkouts of unchanged sources from Sphinx
+
+    Sphinx decides which documents (and modules documented with autodoc) to
+    re-read by comparing their modification times with the time they were
+    read for the cached environment.  Fresh clones of packages look newer
+    than any cached environment, even if their contents did not change.
+    This function compares a digest of the contents of each directory with
+    the one recorded for the previous build and, if they match, resets the
+    modification times of its files to the time of that build.  Directories
+    with different contents are kept as they are, so Sphinx re-reads them.
+
+    .. note::
+
+       Only sources inside the given directories are handled.  Documents
+       using autodoc also depend on the documented modules, as installed on
+       the documentation build environment (e.g. ``site-packages``).  Those
+       are installed anew for every build, so documents using autodoc are
+       always re-read.  The cache still avoids re-reading all other documents
+       and re-writing unchanged pages.  The documentation must be built
+       without ``-E`` (and ``-a``), otherwise the cached environment is
+       discarded.
+
+
+    Args:
+
+      directories: A list of directories (e.g. package clones) to check
+      state_path: Path to the (JSON) file keeping digests and build times of
+        each directory, updated by this function
+
+
+    Returns: a list with directories whose contents changed (or are new)
+
+    """
+
+    from .build import _source_tree_digest
+
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, "rt") as f:
+            state = json.load(f)
+
+    now = time.time()
+    changed = []
+    for k in directories:
+        key = os.path.relpath(k, os.path.dirname(os.path.dirname(k)))
+        digest = _source_tree_digest(k)
+        previous = state.get(key)
+        if previous is not None and previous["digest"] == digest:
+            _set_mtime(k, previous["mtime"])
+            continue
+        changed.append(k)
+        state[key] = dict(digest=digest, mtime=now)
+
+    logger.info(
+        "%d of %d source directories changed since the last build",
+        len(changed),
+        len(directories),
+    )
+
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp = "%s.%d.tmp" % (state_path, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, state_path)
+
+    return changed
+
+
+def restore_doctrees(cache_dir, doctrees):
+    """Restores Sphinx doctrees (and its pickled environment) from the cache
+
+    Args:
+
+      cache_dir: The cache directory of the project (see
+        :py:func:`sphinx_cache_dir`)
+      doctrees: The doctrees directory of the documentation build (by
+        default, ``.doctrees`` inside the Sphinx output directory)
+
+
+    Returns: ``True`` if a cached environment was restored, ``False``
+    otherwise
+
+    """
+
+    cached = os.path.join(cache_dir, "doctrees")
+    if not os.path.exists(os.path.join(cached, "environment.pickle")):
+        logger.info("No cached Sphinx environment at %s", cached)
+        return False
+
+    logger.info("Restoring Sphinx environment %s -> %s", cached, doctrees)
+    shutil.copytree(cached, doctrees, dirs_exist_ok=True)
+    return True
+
+
+def save_doctrees(doctrees, cache_dir):
+    """Saves Sphinx doctrees (and its pickled environment) on the cache
+
+    Args:
+
+      doctrees: The doctrees directory of the documentation build
+      cache_dir: The cache directory of the project (see
+        :py:func:`sphinx_cache_dir`)
+
+    """
+
+    if not os.path.exists(os.path.join(doctrees, "environment.pickle")):
+        logger.warning("No Sphinx environment at %s to cache", doctrees)
+        return
+
+    cached = os.path.join(cache_dir, "doctrees")
+    tmp = "%s.%d.tmp" % (cached, os.getpid())
+    logger.info("Saving Sphinx environment %s -> %s", doctrees, cached)
+    shutil.copytree(doctrees, tmp)
+    if os.path.exists(cached):
+        shutil.rmtree(cached)
+    os.rename(tmp, cached)
+
+
+def intersphinx_cache_dir():
+    """Returns the directory where intersphinx inventories are cached
+
+    This is ``intersphinx`` inside the bdt cache directory, unless the
+    environment variable ``BDT_INTERSPHINX_CACHE`` is set.
+    """
+
+    from .constants import CACHE_DIR
+
+    return os.environ.get(
+        "BDT_INTERSPHINX_CACHE", os.path.join(CACHE_DIR, "intersphinx")
+    )
+
+
+def cached_inventory(session, uri, cache_dir, ttl):
+    """Returns the path of an (up-to-date) cached copy of an inventory
+
+    Inventories younger than ``ttl`` seconds are used without any network
+    access.  Older ones are re-validated with a conditional HTTP GET request
+    (using their ETag and Last-Modified headers), so they are only downloaded
+    again if they changed.  If the inventory cannot be downloaded, a stale
+    copy is used, if available.
+
+
+    Args:
+
+      session: A :py:class:`requests.Session` to use for downloads
+      uri: The base URI of the documentation (``objects.inv`` is appended)
+      cache_dir: The directory where to keep inventories
+      ttl: Time (in seconds) during which cached inventories are trusted
+
+
+    Returns: the path of the cached inventory, or ``None``, if it cannot be
+    downloaded nor is cached
+
+    """
+
+    import requests
+
+    url = uri.rstrip("/") + "/objects.inv"
+    base = os.path.join(cache_dir, hashlib.sha256(url.encode()).hexdigest())
+    path, meta_path = base + ".inv", base + ".json"
+
+    meta = {}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, "rt") as f:
+            meta = json.load(f)
+        if time.time() - meta["checked"] < ttl:
+            logger.debug("Intersphinx inventory %s is cached at %s", url, path)
+            return path
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = session.get(url, headers=headers, timeout=30)
+        if response.status_code != 304:
+            response.raise_for_status()
+    except requests.RequestException as e:
+        if meta:
+            logger.warning("Cannot update %s (%s) - using stale copy", url, e)
+            return path
+        logger.warning("Cannot download intersphinx inventory %s: %s", url, e)
+        return None
+
+    if response.status_code == 304:
+        logger.debug("Intersphinx inventory %s did not change", url)
+    else:
+        logger.info("Downloaded intersphinx inventory %s", url)
+        meta = dict(
+            url=url,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp, path)
+
+    meta["checked"] = time.time()
+    tmp = "%s.%d.tmp" % (meta_path, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    os.replace(tmp, meta_path)
+
+    return path
+
+
+def cached_intersphinx_mapping(mapping, cache_dir=None, ttl=None):
+    """Points an intersphinx mapping to locally cached inventories
+
+    Entries of the mapping that use the default (remote) inventory location
+    are modified to use a local copy of the inventory instead (see
+    :py:func:`cached_inventory`), which Sphinx reads without network access.
+    Inventories are downloaded concurrently.  Entries whose inventory cannot
+    be cached are left untouched.  Mappings in the old format (URIs mapped to
+    inventory locations) are converted to the named format, using URIs as
+    names.
+
+
+    Args:
+
+      mapping: An intersphinx mapping, as set on ``conf.py``
+      cache_dir: The directory where to keep inventories.  If not set, use
+        :py:func:`intersphinx_cache_dir`
+      ttl: Time (in seconds) during which cached inventories are trusted.  If
+        not set, use :py:data:`INTERSPHINX_TTL` or the value of the
+        environment variable ``BDT_INTERSPHINX_TTL``
+
+
+    Returns: a new intersphinx mapping
+
+    """
+
+    import requests
+
+    cache_dir = cache_dir or intersphinx_cache_dir()
+    if ttl is None:
+        ttl = float(os.environ.get("BDT_INTERSPHINX_TTL", INTERSPHINX_TTL))
+    os.makedirs(cache_dir, exist_ok=True)
+
+    retval = {}
+    for name, value in mapping.items():
+        if isinstance(value, (tuple, list)):
+            retval[name] = tuple(value)
+        else:  # old format: {uri: inventory}
+            retval[name] = (name, value)
+
+    remote = [k for k, (_, inventory) in retval.items() if inventory is None]
+    with requests.Session() as session, concurrent.futures.ThreadPoolExecutor(
+        max_workers=_MAX_INVENTORY_REQUESTS
+    ) as executor:
+        futures = dict(
+            (
+                k,
+                executor.submit(
+                    cached_inventory, session, retval[k][0], cache_dir, ttl
+                ),
+            )
+            for k in remote
+        )
+        for k, future in futures.items():
+            path = future.result()
+            if path is not None:
+                retval[k] = (retval[k][0], path)
+
+    return retval
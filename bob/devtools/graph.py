@@ -3,14 +3,14 @@
 
 """Utilities for calculating package dependencies and drawing graphs"""
 
-import glob
+import concurrent.futures
+import hashlib
+import json
 import os
 import re
 import tarfile
 import tempfile
 
-from io import BytesIO
-
 from .bootstrap import set_environment
 from .build import (
     get_output_path,
@@ -23,6 +23,314 @@ from .log import echo_info, get_logger
 logger = get_logger(__name__)
 
 
+def _add_default_group(p):
+    """Completes the package group, which is not provided by conda-build"""
+
+    if p.startswith("bob") or p.startswith("gridtk"):
+        return "/".join(("bob", p))
+    elif p.startswith("beat"):
+        return "/".join(("beat", p))
+    elif p.startswith("batl"):
+        return "/".join(("batl", p))
+    else:
+        logger.warning(
+            "Do not know how to recurse to package %s "
+            "(to which group does it belong?) - skipping...",
+            p,
+        )
+        return None
+
+
+def conda_config_digest(config, python, append_file, condarc_options):
+    """
+    Returns a hash of all inputs of :py:func:`bob.devtools.build.make_conda_config`
+
+    Use it as the ``config_digest`` of :py:func:`compute_adjencence_matrix`, to
+    invalidate cached package nodes when the conda configuration changes.
+
+    Parameters
+    ----------
+
+    config : str
+        Path leading to the ``conda_build_config.yaml`` to use
+
+    python : str
+        The version of python to use for the build as ``x.y``
+
+    append_file : str
+        Path leading to the ``recipe_append.yaml`` file to use
+
+    condarc_options : dict
+        Dictionary (typically read from a condarc YAML file) that contains
+        build and channel options
+
+
+    Returns
+    -------
+
+    digest : str
+        A hexadecimal hash of the contents of the configuration files and
+        options
+
+    """
+
+    h = hashlib.sha256()
+    for path in (config, append_file):
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+    h.update(json.dumps([python, condarc_options], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _node_cache_path(package, sha, config_digest, deptypes):
+    """Returns the path of the on-disk cache entry for a resolved package"""
+
+    from .constants import CACHE_DIR
+
+    key = json.dumps([package, sha, config_digest, sorted(deptypes)])
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(CACHE_DIR, "graph", "%s.json" % digest)
+
+
+def _load_node(path):
+    """Loads a cached package node, returns ``None`` if not available"""
+
+    try:
+        with open(path, "rt") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_node(path, node):
+    """Atomically saves a package node to the on-disk cache"""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(node, f, indent=2)
+    os.replace(tmp, path)
+
+
+_RECIPE_ROOT_FILES = (
+    "version.txt",
+    "pyproject.toml",
+    "setup.py",
+    "requirements.txt",
+)
+"""Files at the root of package repositories recipes may read when rendered"""
+
+
+def _is_recipe_file(path):
+    """Tells if a path (relative to the repository root) is needed to render
+    the package recipe"""
+
+    return (
+        path == "conda"
+        or path.startswith("conda/")
+        or (path in _RECIPE_ROOT_FILES)
+    )
+
+
+def _fetch_recipe_files(project, ref, destdir):
+    """Fetches the files required to render a package recipe, one by one,
+    through the repository files API"""
+
+    root = project.repository_tree(ref=ref, all=True)
+    if not any(k["path"] == "conda" and k["type"] == "tree" for k in root):
+        return False
+
+    paths = [
+        k["path"]
+        for k in root
+        if k["type"] == "blob" and k["path"] in _RECIPE_ROOT_FILES
+    ]
+    paths += [
+        k["path"]
+        for k in project.repository_tree(
+            path="conda", ref=ref, recursive=True, all=True
+        )
+        if k["type"] == "blob"
+    ]
+
+    for path in paths:
+        logger.debug("Downloading %s@%s...", path, ref)
+        target = os.path.join(destdir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(project.files.raw(file_path=path, ref=ref))
+
+    return True
+
+
+def _fetch_recipe_archive(project, ref, destdir):
+    """Fetches the files required to render a package recipe from a
+    repository archive
+
+    The archive is streamed to a temporary file, and only files required to
+    render the recipe are extracted.
+    """
+
+    with tempfile.TemporaryFile() as archive:
+        logger.debug("Downloading archive for %s...", ref)
+        project.repository_archive(ref=ref, streamed=True, action=archive.write)
+        logger.debug("Archive has %d bytes", archive.tell())
+        archive.seek(0)
+
+        found = False
+        with tarfile.open(fileobj=archive, mode="r|gz") as f:
+            for member in f:
+                # strips the leading "<project>-<ref>-<sha>/" directory
+                path = member.name.partition("/")[2]
+                if not _is_recipe_file(path):
+                    continue
+                found = found or path not in _RECIPE_ROOT_FILES
+                member.name = path
+                f.extract(member, path=destdir)
+
+    return found
+
+
+def _download_recipe(gl, package, ref, tmpdir, config_digest, deptypes):
+    """Downloads the repository of a package and returns its recipe directory
+
+    If ``config_digest`` is set, first looks up for the package node on the
+    on-disk cache, keyed by the commit ``ref`` points to.  This function only
+    does I/O (it is safe to call it from various threads at once).
+
+
+    Returns
+    -------
+
+    recipe_dir : str
+        The path to the downloaded recipe, or ``None``, if the node was cached
+
+    node : dict
+        The cached package node, or ``None``, if it was not cached
+
+    cache_path : str
+        Path to save the node to, once resolved (``None`` if not caching)
+
+    """
+
+    use_package = gl.projects.get(package)
+
+    cache_path = None
+    if config_digest is not None:
+        sha = use_package.commits.get(ref).id
+        cache_path = _node_cache_path(package, sha, config_digest, deptypes)
+        node = _load_node(cache_path)
+        if node is not None:
+            logger.info("Using cached graph node for %s@%s", package, sha)
+            return None, node, cache_path
+
+    echo_info(
+        "Resolving graph for %s@%s"
+        % (use_package.attributes["path_with_namespace"], ref)
+    )
+
+    import gitlab
+
+    destdir = tempfile.mkdtemp(dir=tmpdir)
+    try:
+        found = _fetch_recipe_files(use_package, ref, destdir)
+    except gitlab.exceptions.GitlabError as e:
+        logger.debug(
+            "Cannot fetch recipe files of %s@%s (%s) - using archive",
+            package,
+            ref,
+            e,
+        )
+        found = _fetch_recipe_archive(use_package, ref, destdir)
+
+    if not found:
+        raise RuntimeError(
+            "The conda recipe directory for %s@%s does not exist"
+            % (package, ref)
+        )
+
+    return os.path.join(destdir, "conda"), None, cache_path
+
+
+def _resolve_recipe(recipe_dir, conda_config, main_channel, deptypes):
+    """Renders a package recipe and returns its node on the adjacence matrix
+
+    This function uses the conda-build API, which is not thread-safe.
+    """
+
+    logger.debug("Resolving conda recipe for package at %s...", recipe_dir)
+
+    version_candidate = os.path.join(recipe_dir, "..", "version.txt")
+    if os.path.exists(version_candidate):
+        version = open(version_candidate).read().rstrip()
+        set_environment("BOB_PACKAGE_VERSION", version)
+
+    # pre-renders the recipe - figures out the destination
+    metadata = get_rendered_metadata(recipe_dir, conda_config)
+    rendered_recipe = get_parsed_recipe(metadata)
+    path = get_output_path(metadata, conda_config)[0]
+
+    # gets the next build number
+    build_number, _ = next_build_number(main_channel, os.path.basename(path))
+
+    # at this point, all elements are parsed, I know the package version,
+    # build number and all dependencies
+    # exclude stuff we are not interested in
+
+    # host and build should have precise numbers to be used for building
+    # this package.
+    if "host" not in deptypes:
+        host = []
+    else:
+        host = rendered_recipe["requirements"].get("host", [])
+
+    if "build" not in deptypes:
+        build = []
+    else:
+        build = rendered_recipe["requirements"].get("build", [])
+
+    # run dependencies are more vague
+    if "run" not in deptypes:
+        run = []
+    else:
+        run = rendered_recipe["requirements"].get("run", [])
+
+    # test dependencies even more vague
+    if "test" not in deptypes:
+        test = []
+    else:
+        test = rendered_recipe.get("test", {}).get("requires", [])
+
+    return dict(
+        host=host,
+        build=build,
+        run=run,
+        test=test,
+        version=rendered_recipe["package"]["version"],
+        name=rendered_recipe["package"]["name"],
+        build_string=os.path.basename(path).split("-")[-1].split(".")[0],
+    )
+
+
+def _packages_to_recurse(node, recurse_regexp):
+    """Returns the (gitlab) packages a node of the adjacence matrix depends on,
+    and that match the regular expression"""
+
+    # for each of the dependence sections, recurse in figuring out
+    # dependencies, if dependencies match a target set of globs
+    recurse_compiled = re.compile(recurse_regexp)
+
+    retval = set()
+    for deptype in ("host", "build", "run", "test"):
+        for k in node[deptype]:
+            if recurse_compiled.match(k):
+                retval.add(_add_default_group(k.split()[0]))
+    retval.discard(None)
+
+    return retval
+
+
 def compute_adjencence_matrix(
     gl,
     package,
@@ -32,11 +340,20 @@ def compute_adjencence_matrix(
     current={},
     ref="master",
     deptypes=[],
+    jobs=0,
+    config_digest=None,
 ):
     """
     Given a target package, returns an adjacence matrix with its dependencies
     returned via the conda-build API
 
+    Dependencies are resolved breadth-first: package repositories are
+    downloaded concurrently by a pool of threads, while recipes are rendered
+    (sequentially, as the conda-build API is not thread-safe) as soon as their
+    download finishes.  Each package is only resolved once.  If
+    ``config_digest`` is set, resolved packages are cached on disk, so that
+    only packages whose reference moved are resolved again on later calls.
+
     Parameters
     ----------
 
@@ -77,6 +394,16 @@ def compute_adjencence_matrix(
         empty, then preserve all.  You may set values "build", "host",
         "run" and "test", in any combination
 
+    jobs : int
+        Maximum number of package repositories to download concurrently.  If
+        set to zero, use a default depending on the number of CPUs available
+
+    config_digest : str
+        A hash of the conda configuration, as returned by
+        :py:func:`conda_config_digest`.  If set, the cache of resolved package
+        nodes is used.  Cached nodes are keyed by package, commit, dependence
+        types and this value
+
 
     Returns
     -------
@@ -89,143 +416,332 @@ def compute_adjencence_matrix(
 
     """
 
-    use_package = gl.projects.get(package)
     deptypes = deptypes if deptypes else ["host", "build", "run", "test"]
 
-    if use_package.attributes["path_with_namespace"] in current:
-        return current
+    retval = dict(current)
+    if package in retval:
+        return retval
 
-    echo_info(
-        "Resolving graph for %s@%s"
-        % (use_package.attributes["path_with_namespace"], ref)
-    )
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with tempfile.TemporaryDirectory() as tmpdir, (
+        concurrent.futures.ThreadPoolExecutor(max_workers=(jobs or None))
+    ) as executor:
 
-        logger.debug("Downloading archive for %s...", ref)
-        archive = use_package.repository_archive(ref=ref)  # in memory
-        logger.debug("Archive has %d bytes", len(archive))
+        visited = set(retval.keys()) | set([package])
+        pending = {
+            executor.submit(
+                _download_recipe,
+                gl,
+                package,
+                ref,
+                tmpdir,
+                config_digest,
+                deptypes,
+            ): package
+        }
+
+        try:
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    name = pending.pop(future)
+                    recipe_dir, node, cache_path = future.result()
+                    if node is None:
+                        node = _resolve_recipe(
+                            recipe_dir, conda_config, main_channel, deptypes
+                        )
+                        if cache_path is not None:
+                            _save_node(cache_path, node)
+                    retval[name] = node
+
+                    # do not recurse for packages we already know
+                    recurse = _packages_to_recurse(retval[name], recurse_regexp)
+                    recurse -= visited
+                    if recurse:
+                        logger.info(
+                            "Recursing over the following packages: %s",
+                            ", ".join(sorted(recurse)),
+                        )
+                    for dep in recurse:
+                        visited.add(dep)
+                        future = executor.submit(
+                            _download_recipe,
+                            gl,
+                            dep,
+                            ref,
+                            tmpdir,
+                            config_digest,
+                            deptypes,
+                        )
+                        pending[future] = dep
+        except Exception:
+            # do not wait for downloads that will never be used
+            for future in pending:
+                future.cancel()
+            raise
+
+    return retval
+
+
+def package_dependencies(adjacence_matrix, deptypes=[]):
+    """
+    Returns, for each package on the adjacence matrix, the packages (also on
+    the matrix) it depends on
 
-        with tarfile.open(fileobj=BytesIO(archive), mode="r:gz") as f:
-            f.extractall(path=tmpdir)
+    Parameters
+    ----------
+
+    adjacence_matrix : dict
+        A dictionary containing the adjacence matrix, as returned by
+        :py:func:`compute_adjencence_matrix`
 
-        # use conda-build API to figure out all dependencies
-        recipe_dir = glob.glob(os.path.join(tmpdir, "*", "conda"))[0]
-        logger.debug("Resolving conda recipe for package at %s...", recipe_dir)
-        if not os.path.exists(recipe_dir):
+    deptypes : list
+        A list of dependence types to consider.  If empty, then consider all.
+        You may set values "build", "host", "run" and "test", in any
+        combination
+
+
+    Returns
+    -------
+
+    dependencies : dict
+        A dictionary mapping each package (as keyed on the adjacence matrix)
+        to the set of packages (also keyed as on the adjacence matrix) it
+        depends on
+
+    """
+
+    deptypes = deptypes if deptypes else ["host", "build", "run", "test"]
+    names = dict((v["name"], k) for k, v in adjacence_matrix.items())
+
+    retval = {}
+    for package, values in adjacence_matrix.items():
+        deps = set()
+        for deptype in deptypes:
+            for dep in values[deptype]:
+                key = names.get(dep.split()[0])
+                if key is not None and key != package:
+                    deps.add(key)
+        retval[package] = deps
+
+    return retval
+
+
+def _find_cycle(dependencies):
+    """Returns a list of packages forming a dependence cycle"""
+
+    # all packages still have unresolved dependencies, so walking through
+    # them always reaches a package that was already visited
+    package = sorted(dependencies)[0]
+    path = []
+    while package not in path:
+        path.append(package)
+        package = sorted(dependencies[package])[0]
+    return path[path.index(package) :] + [package]
+
+
+def sort_levels(dependencies):
+    """
+    Sorts packages topologically, in levels
+
+    Parameters
+    ----------
+
+    dependencies : dict
+        A dictionary mapping each package to the set of packages it depends
+        on, as returned by :py:func:`package_dependencies`
+
+
+    Returns
+    -------
+
+    levels : list
+        A list of lists of packages.  Packages on a level only depend on
+        packages of previous levels.  Each list is sorted alphabetically.
+
+
+    Raises
+    ------
+
+    RuntimeError
+        If packages depend on each other in a cycle
+
+    """
+
+    levels = []
+    while dependencies:
+        level = sorted(k for k, v in dependencies.items() if not v)
+        if not level:
             raise RuntimeError(
-                "The conda recipe directory %s does not " "exist" % recipe_dir
+                "Cannot sort packages in build order - dependence cycle: %s"
+                % " -> ".join(_find_cycle(dependencies))
             )
+        levels.append(level)
+        done = set(level)
+        dependencies = dict(
+            (k, v - done) for k, v in dependencies.items() if k not in done
+        )
 
-        version_candidate = os.path.join(recipe_dir, "..", "version.txt")
-        if os.path.exists(version_candidate):
-            version = open(version_candidate).read().rstrip()
-            set_environment("BOB_PACKAGE_VERSION", version)
+    return levels
 
-        # pre-renders the recipe - figures out the destination
-        metadata = get_rendered_metadata(recipe_dir, conda_config)
-        rendered_recipe = get_parsed_recipe(metadata)
-        path = get_output_path(metadata, conda_config)[0]
 
-        # gets the next build number
-        build_number, _ = next_build_number(
-            main_channel, os.path.basename(path)
-        )
+def compute_build_order(adjacence_matrix, deptypes=[]):
+    """
+    Sorts packages on the adjacence matrix in build order
 
-        # at this point, all elements are parsed, I know the package version,
-        # build number and all dependencies
-        # exclude stuff we are not interested in
+    Packages are organized in levels: packages on a level only depend on
+    packages of previous levels, so that packages on the same level may be
+    built concurrently.
 
-        # host and build should have precise numbers to be used for building
-        # this package.
-        if "host" not in deptypes:
-            host = []
-        else:
-            host = rendered_recipe["requirements"].get("host", [])
+    Parameters
+    ----------
 
-        if "build" not in deptypes:
-            build = []
-        else:
-            build = rendered_recipe["requirements"].get("build", [])
+    adjacence_matrix : dict
+        A dictionary containing the adjacence matrix, as returned by
+        :py:func:`compute_adjencence_matrix`
 
-        # run dependencies are more vague
-        if "run" not in deptypes:
-            run = []
-        else:
-            run = rendered_recipe["requirements"].get("run", [])
+    deptypes : list
+        A list of dependence types to consider.  If empty, then consider all.
+        You may set values "build", "host", "run" and "test", in any
+        combination
 
-        # test dependencies even more vague
-        if "test" not in deptypes:
-            test = []
-        else:
-            test = rendered_recipe.get("test", {}).get("requires", [])
-
-        # for each of the above sections, recurse in figuring out dependencies,
-        # if dependencies match a target set of globs
-        recurse_compiled = re.compile(recurse_regexp)
-
-        def _re_filter(ll):
-            return [k for k in ll if recurse_compiled.match(k)]
-
-        all_recurse = set()
-        all_recurse |= set([z.split()[0] for z in _re_filter(host)])
-        all_recurse |= set([z.split()[0] for z in _re_filter(build)])
-        all_recurse |= set([z.split()[0] for z in _re_filter(run)])
-        all_recurse |= set([z.split()[0] for z in _re_filter(test)])
-
-        # complete the package group, which is not provided by conda-build
-        def _add_default_group(p):
-            if p.startswith("bob") or p.startswith("gridtk"):
-                return "/".join(("bob", p))
-            elif p.startswith("beat"):
-                return "/".join(("beat", p))
-            elif p.startswith("batl"):
-                return "/".join(("batl", p))
-            else:
-                logger.warning(
-                    "Do not know how to recurse to package %s "
-                    "(to which group does it belong?) - skipping...",
-                    p,
-                )
-                return None
 
-        all_recurse = set([_add_default_group(k) for k in all_recurse])
-        if None in all_recurse:
-            all_recurse.remove(None)
+    Returns
+    -------
 
-        # do not recurse for packages we already know
-        all_recurse -= set(current.keys())
-        logger.info(
-            "Recursing over the following packages: %s", ", ".join(all_recurse)
-        )
+    levels : list
+        A list of lists of packages (as keyed on the adjacence matrix).  Each
+        list contains a level, sorted alphabetically.
 
-        for dep in all_recurse:
-            dep_adjmtx = compute_adjencence_matrix(
-                gl,
-                dep,
-                conda_config,
-                main_channel,
-                recurse_regexp=recurse_regexp,
-                ref=ref,
-                deptypes=deptypes,
+
+    Raises
+    ------
+
+    RuntimeError
+        If packages depend on each other in a cycle
+
+    """
+
+    return sort_levels(package_dependencies(adjacence_matrix, deptypes))
+
+
+def impacted_packages(adjacence_matrix, packages, deptypes=[]):
+    """
+    Returns packages impacted by changes on other packages, in build order
+
+    A reverse dependence index is built from the adjacence matrix, and used to
+    find all packages depending (directly or indirectly) on the changed ones.
+
+    Parameters
+    ----------
+
+    adjacence_matrix : dict
+        A dictionary containing the adjacence matrix, as returned by
+        :py:func:`compute_adjencence_matrix`
+
+    packages : list
+        A list of changed packages, either as keyed on the adjacence matrix
+        (e.g. ``bob/bob.extension``) or by their name (e.g.
+        ``bob.extension``)
+
+    deptypes : list
+        A list of dependence types to consider.  If empty, then consider all.
+        You may set values "build", "host", "run" and "test", in any
+        combination
+
+
+    Returns
+    -------
+
+    levels : list
+        The changed packages and all packages that depend on them, organized
+        in levels, as returned by :py:func:`compute_build_order`
+
+    """
+
+    names = dict((v["name"], k) for k, v in adjacence_matrix.items())
+
+    dependents = dict((k, set()) for k in adjacence_matrix)
+    for package, deps in package_dependencies(
+        adjacence_matrix, deptypes
+    ).items():
+        for dep in deps:
+            dependents[dep].add(package)
+
+    queue = []
+    for package in packages:
+        key = package if package in adjacence_matrix else names.get(package)
+        if key is None:
+            raise RuntimeError(
+                "Package %s is not part of the dependency graph" % package
             )
-            current.update(dep_adjmtx)
-
-        current[package] = dict(
-            host=host,
-            build=build,
-            run=run,
-            test=test,
-            version=rendered_recipe["package"]["version"],
-            name=rendered_recipe["package"]["name"],
-            build_string=os.path.basename(path).split("-")[-1].split(".")[0],
+        queue.append(key)
+
+    impacted = set(queue)
+    while queue:
+        for dependent in dependents[queue.pop()]:
+            if dependent not in impacted:
+                impacted.add(dependent)
+                queue.append(dependent)
+
+    return compute_build_order(
+        dict((k, adjacence_matrix[k]) for k in impacted), deptypes
+    )
+
+
+def write_build_order(levels, stream, ref="master"):
+    """
+    Writes packages in build order, in the format read by
+    :py:func:`bob.devtools.ci.read_packages`
+
+    Each level is preceded by a comment.
+
+    Parameters
+    ----------
+
+    levels : list
+        A list of lists of packages, as returned by
+        :py:func:`compute_build_order`
+
+    stream : object
+        A text stream (file-like object) to write to
+
+    ref : str
+        Name of the git reference (branch, tag or commit hash) packages
+        should be built from
+
+    """
+
+    suffix = "" if ref == "master" else ", %s" % ref
+
+    stream.write("# packages in build order (generated by bdt gitlab graph)\n")
+    for k, level in enumerate(levels):
+        stream.write(
+            "\n# level %d: %d package(s), may be built concurrently\n"
+            % (k + 1, len(level))
         )
+        for package in level:
+            stream.write("%s%s\n" % (package, suffix))
 
-    return current
 
+def _parse_specs(values, deptypes):
+    """Parses the dependence specifications of a package once, returning a
+    dictionary mapping dependence names to the remaining parts (version and
+    build) of their most complete specification"""
 
-def generate_graph(adjacence_matrix, deptypes, whitelist):
+    retval = {}
+    for k in deptypes:
+        for dep in values[k]:
+            name, *parts = dep.split()
+            if not retval.get(name):
+                retval[name] = parts
+    return retval
+
+
+def compute_graph(adjacence_matrix, deptypes, whitelist):
     """
-    Computes a graphviz/dot representation of the build graph
+    Computes the nodes and edges of the build graph
 
     Parameters
     ----------
@@ -247,68 +763,195 @@ def generate_graph(adjacence_matrix, deptypes, whitelist):
     Returns
     -------
 
-        graph : graphviz.Digraph
-            The generated graph
+        nodes : dict
+            A dictionary mapping node names to their attributes: ``version``
+            and ``build`` (strings or ``None``, if unknown) and ``package``, a
+            boolean indicating if the node is one of the packages on the
+            adjacence matrix or one of their dependencies
 
-    """
+        edges : list
+            A list of tuples ``(package, dependence)``, with the names of the
+            connected nodes
 
-    from graphviz import Digraph
+    """
 
     whitelist_compiled = re.compile(whitelist)
     deptypes = deptypes if deptypes else ["host", "build", "run", "test"]
 
-    graph = Digraph()
+    # memoizes whitelist matches, dependence names repeat a lot
+    whitelisted = {}
+
+    def _whitelisted(name):
+        if name not in whitelisted:
+            whitelisted[name] = whitelist_compiled.match(name) is not None
+        return whitelisted[name]
+
     nodes = {}
 
     # generate nodes for all packages we want to track explicitly
     for package, values in adjacence_matrix.items():
-        if not whitelist_compiled.match(values["name"]):
+        if not _whitelisted(values["name"]):
             logger.debug(
                 "Skipping main package %s (did not match whitelist)",
                 values["name"],
             )
             continue
-        name = (
-            values["name"]
-            + "\n"
-            + values["version"]
-            + "\n"
-            + values["build_string"]
-        )
-        nodes[values["name"]] = graph.node(
-            values["name"], name, shape="box", color="blue"
+        nodes[values["name"]] = dict(
+            version=values["version"],
+            build=values["build_string"],
+            package=True,
         )
 
     # generates nodes for all dependencies
+    edges = []
     for package, values in adjacence_matrix.items():
 
-        # ensures we only have the most complete dependence in the our list
-        deps = {}
-        to_consider = set()
-        for k in deptypes:
-            to_consider |= set(values[k])
-        for dep in to_consider:
-            name = dep.split()[0]
-            if name not in deps or (name in deps and not deps[name]):
-                deps[name] = dep.split()[1:]
-
-        for ref, parts in deps.items():
-            if not whitelist_compiled.match(ref):
+        for ref, parts in _parse_specs(values, deptypes).items():
+            if not _whitelisted(ref):
                 logger.debug(
                     "Skipping dependence %s (did not match whitelist)", ref
                 )
                 continue
 
-            if not any([k == ref for k in nodes.keys()]):
+            if ref not in nodes:
                 # we do not have a node for that dependence, create it
-                name = str(ref)  # new string
-                if len(parts) >= 1:
-                    name += "\n" + parts[0]  # dep version
-                if len(parts) >= 2:
-                    name += "\n" + parts[1]  # dep build
-                nodes[ref] = graph.node(ref, name)
+                nodes[ref] = dict(
+                    version=parts[0] if len(parts) >= 1 else None,
+                    build=parts[1] if len(parts) >= 2 else None,
+                    package=False,
+                )
 
             # connects package -> dep
-            graph.edge(values["name"], ref)
+            edges.append((values["name"], ref))
+
+    # packages that did not match the whitelist, but have edges
+    for package, _ in edges:
+        nodes.setdefault(package, dict(version=None, build=None, package=False))
+
+    return nodes, edges
+
+
+def generate_graph(adjacence_matrix, deptypes, whitelist):
+    """
+    Computes a graphviz/dot representation of the build graph
+
+    Parameters
+    ----------
+
+        adjacence_matrix : dict
+            A dictionary containing the adjacence matrix, that states the
+            dependencies for each package in the build, to other packages
+
+        deptypes : list
+            A list of dependence types to preserve when building the graph.  If
+            empty, then preserve all.  You may set values "build", "host",
+            "run" and "test", in any combination
+
+        whitelist : str
+            Regular expression for matching strings to preserve while building
+            the graph
+
+
+    Returns
+    -------
+
+        graph : graphviz.Digraph
+            The generated graph
+
+    """
+
+    from graphviz import Digraph
+
+    nodes, edges = compute_graph(adjacence_matrix, deptypes, whitelist)
+
+    graph = Digraph()
+
+    for name, attrs in nodes.items():
+        label = "\n".join(
+            [name] + [attrs[k] for k in ("version", "build") if attrs[k]]
+        )
+        if attrs["package"]:
+            graph.node(name, label, shape="box", color="blue")
+        else:
+            graph.node(name, label)
+
+    for package, dep in edges:
+        graph.edge(package, dep)
 
     return graph
+
+
+def write_json_graph(nodes, edges, stream):
+    """
+    Writes the build graph in JSON format
+
+    The output contains an object with two lists: ``nodes``, containing
+    objects with the node ``id`` and its attributes, and ``edges``, containing
+    objects with ``source`` (package) and ``target`` (dependence) nodes.
+
+    Parameters
+    ----------
+
+        nodes : dict
+            The nodes of the graph, as returned by :py:func:`compute_graph`
+
+        edges : list
+            The edges of the graph, as returned by :py:func:`compute_graph`
+
+        stream : object
+            A text stream (file-like object) to write to
+
+    """
+
+    json.dump(
+        dict(
+            nodes=[dict(id=k, **v) for k, v in nodes.items()],
+            edges=[dict(source=k, target=v) for k, v in edges],
+        ),
+        stream,
+        indent=2,
+    )
+
+
+def write_graphml(nodes, edges, stream):
+    """
+    Writes the build graph in GraphML format
+
+    Parameters
+    ----------
+
+        nodes : dict
+            The nodes of the graph, as returned by :py:func:`compute_graph`
+
+        edges : list
+            The edges of the graph, as returned by :py:func:`compute_graph`
+
+        stream : object
+            A binary stream (file-like object) to write to
+
+    """
+
+    import xml.etree.ElementTree as ET
+
+    root = ET.Element("graphml", xmlns="http://graphml.graphdrawing.org/xmlns")
+    for k, type_ in (
+        ("version", "string"),
+        ("build", "string"),
+        ("package", "boolean"),
+    ):
+        attrib = {"for": "node", "attr.name": k, "attr.type": type_}
+        ET.SubElement(root, "key", id=k, attrib=attrib)
+
+    graph = ET.SubElement(root, "graph", id="G", edgedefault="directed")
+    for name, attrs in nodes.items():
+        node = ET.SubElement(graph, "node", id=name)
+        for k in ("version", "build"):
+            if attrs[k]:
+                ET.SubElement(node, "data", key=k).text = attrs[k]
+        ET.SubElement(node, "data", key="package").text = str(
+            attrs["package"]
+        ).lower()
+    for package, dep in edges:
+        ET.SubElement(graph, "edge", source=package, target=dep)
+
+    ET.ElementTree(root).write(stream, encoding="utf-8", xml_declaration=True)
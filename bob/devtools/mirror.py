@@ -17,8 +17,6 @@ import random
 import tempfile
 import time
 
-import requests
-
 from .log import get_logger
 
 logger = get_logger(__name__)
@@ -40,6 +38,8 @@ def _download(url, target_directory):
         The size in bytes of the file that was downloaded
     """
 
+    import requests
+
     file_size = 0
     chunk_size = 1024  # 1KB chunks
     logger.info("Download %s -> %s", url, target_directory)
@@ -99,6 +99,8 @@ def get_json(channel, platform, name):
         If the URL cannot be reached
     """
 
+    import requests
+
     url = channel + "/" + platform + "/" + name
     logger.debug("[checking] %s...", url)
     r = requests.get(url, allow_redirects=True, stream=True)
@@ -211,6 +213,8 @@ def download_packages(packages, repodata, channel_url, dest_dir, arch, dry_run):
 
     """
 
+    import requests
+
     # download files into temporary directory, that is removed by the end of
     # the procedure, or if something bad occurs
     with tempfile.TemporaryDirectory() as download_dir:
@@ -3,16 +3,24 @@
 
 """Pipeline utilities"""
 
+import json
+import os
 import re
 
 from datetime import datetime
 
-from tabulate import tabulate
+DURATIONS_HISTORY = 10
+"""Number of (most recent) durations kept per package on the durations store"""
 
 
-def process_log(log):
+def log_durations(log):
     """
-    Summarizes the execution time of a pipeline given its Job log
+    Calculates the execution time of each package built in a pipeline, given
+    its Job log
+
+    Returns a dictionary mapping package names (e.g. ``bob/bob.io.base``) to
+    tuples with the date and time of the first and last log entries for
+    the package.
     """
 
     current_package = None
@@ -21,11 +29,13 @@ def process_log(log):
     for ll in log:
 
         # Check which package are we
-        if len(re.findall("Building bob/[a-z]*", ll)) > 0:
-            logs[current_package] = dates
+        package = re.search(r"Building (bob/[\w.-]*)", ll)
+        if package is not None:
+            if dates:
+                logs[current_package] = dates
             dates = []
 
-            current_package = ll[9:-1]
+            current_package = package.group(1)
             continue
 
         # Checking the date
@@ -41,12 +51,134 @@ def process_log(log):
     if len(dates) > 0:
         logs[current_package] = dates
 
-    table = []
-    for k in logs:
-        first = datetime.strptime(logs[k][0], "%Y-%m-%d %H:%M:%S")
-        last = datetime.strptime(logs[k][-1], "%Y-%m-%d %H:%M:%S")
-        delta = ((last - first).seconds) / 60
+    return dict(
+        (
+            k,
+            (
+                datetime.strptime(v[0], "%Y-%m-%d %H:%M:%S"),
+                datetime.strptime(v[-1], "%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+        for k, v in logs.items()
+    )
+
+
+def concurrent_jobs(log):
+    """Lists packages built by concurrent jobs, given a nightlies Job log
+
+    Packages of level-parallel nightlies (``bdt ci nightlies --jobs=N``) are
+    built on separate processes, with separate logs (kept as job artifacts on
+    ``nightlies/<group>/<name>/output.log``), that are only copied into the
+    Job log once each package is built.  Their durations must be calculated
+    from those logs (see :py:func:`job_log_durations`), as the Job log does
+    not represent a single sequential build.
+
+    Returns a list of package names (e.g. ``bob/bob.io.base``), in the order
+    they finished building, or an empty list, if packages were built
+    sequentially.
+    """
+
+    retval = []
+    for ll in log:
+        package = re.search(r"Output of (bob/[\w.-]*) \(", ll)
+        if package is not None:
+            retval.append(package.group(1))
+    return retval
+
 
-        table.append([str(k), str(first), str(round(delta, 2)) + "m"])
+def job_log_artifact(package):
+    """Returns the path of the log of a concurrent nightlies job, relative to
+    the project directory (and job artifacts)"""
+
+    return "/".join(("nightlies", package, "output.log"))
+
+
+def job_log_durations(logs):
+    """
+    Calculates the execution time of each package built by concurrent jobs
+
+    Accepts a dictionary mapping package names to their (separate) job logs,
+    each a list of lines.  Returns a dictionary in the same format as
+    :py:func:`log_durations`.
+    """
+
+    retval = {}
+    for package, log in logs.items():
+        durations = log_durations(log)
+        if package in durations:
+            retval[package] = durations[package]
+    return retval
+
+
+def process_log(log, job_logs=None):
+    """
+    Summarizes the execution time of a pipeline given its Job log
+
+    If set, ``job_logs`` maps packages built by concurrent jobs (see
+    :py:func:`concurrent_jobs`) to their separate logs, that are used instead
+    of the Job log.  Returns a dictionary mapping package names to their build
+    duration, in seconds.
+    """
+
+    from tabulate import tabulate
+
+    if job_logs:
+        durations = job_log_durations(job_logs)
+    else:
+        durations = log_durations(log)
+
+    table = []
+    retval = {}
+    for k, (first, last) in durations.items():
+        delta = (last - first).total_seconds()
+        table.append([str(k), str(first), str(round(delta / 60, 2)) + "m"])
+        if k is not None:
+            retval[k] = delta
 
     print(tabulate(table))
+
+    return retval
+
+
+def durations_path():
+    """Returns the path of the store of historical package build durations"""
+
+    from .constants import CACHE_DIR
+
+    return os.path.join(CACHE_DIR, "durations.json")
+
+
+def load_durations(path=None):
+    """
+    Loads historical package build durations
+
+    Returns a dictionary mapping package names to lists of durations, in
+    seconds (most recent last).  The dictionary is empty if no durations were
+    recorded so far.
+    """
+
+    path = path or durations_path()
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rt") as f:
+        return json.load(f)
+
+
+def record_durations(durations, path=None):
+    """
+    Records package build durations on the store of historical durations
+
+    Only the last :py:data:`DURATIONS_HISTORY` durations of each package are
+    kept.
+    """
+
+    path = path or durations_path()
+    history = load_durations(path)
+    for k, v in durations.items():
+        history[k] = (history.get(k, []) + [v])[-DURATIONS_HISTORY:]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
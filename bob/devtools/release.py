@@ -8,10 +8,6 @@ import re
 import shutil
 import time
 
-from distutils.version import StrictVersion
-
-import gitlab
-
 from .log import get_logger
 
 logger = get_logger(__name__)
@@ -63,6 +59,8 @@ def download_path(package, path, output=None, ref="master"):
 def get_gitlab_instance():
     """Returns an instance of the gitlab object for remote operations."""
 
+    import gitlab
+
     # tries to figure if we can authenticate using a global configuration
     cfgs = ["~/.python-gitlab.cfg", "/etc/python-gitlab.cfg"]
     cfgs = [os.path.expanduser(k) for k in cfgs]
@@ -138,6 +136,8 @@ def get_latest_tag_name(gitpkg):
     the package were found.
     """
 
+    from distutils.version import StrictVersion
+
     # get 50 latest tags as a list
     latest_tags = gitpkg.releases.list(all=True)
     if not latest_tags:
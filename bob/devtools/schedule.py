@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Critical-path scheduling of package builds"""
+
+import heapq
+import statistics
+
+from .graph import sort_levels
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+
+DEFAULT_DURATION = 600.0
+"""Duration (in seconds) assumed for packages without any recorded history,
+if no package has any history"""
+
+
+def estimate_durations(packages, history):
+    """
+    Estimates build durations of packages from historical data
+
+    Parameters
+    ----------
+
+    packages : list
+        A list of package names
+
+    history : dict
+        A dictionary mapping package names to lists of durations (in seconds),
+        as returned by :py:func:`bob.devtools.pipelines.load_durations`
+
+
+    Returns
+    -------
+
+    durations : dict
+        A dictionary mapping each package to its estimated build duration, in
+        seconds: the median of its recorded durations.  Packages without
+        recorded durations are assigned the median estimate of all other
+        packages (or :py:data:`DEFAULT_DURATION`, if no package has durations)
+
+    unknown : set
+        The set of packages without recorded durations
+
+    """
+
+    durations = dict(
+        (k, statistics.median(history[k])) for k in packages if history.get(k)
+    )
+    unknown = set(packages) - set(durations)
+    default = (
+        statistics.median(durations.values()) if durations else DEFAULT_DURATION
+    )
+    durations.update((k, default) for k in unknown)
+
+    return durations, unknown
+
+
+def _dependents(dependencies):
+    """Builds a reverse dependence index"""
+
+    retval = dict((k, set()) for k in dependencies)
+    for package, deps in dependencies.items():
+        for dep in deps:
+            retval[dep].add(package)
+    return retval
+
+
+def bottom_levels(dependencies, durations):
+    """
+    Calculates the bottom level of each package
+
+    The bottom level of a package is the length (in time) of the longest path
+    from the start of its build until the end of the build of all packages
+    that depend on it.  Packages with larger bottom levels should be built
+    first.
+
+    Parameters
+    ----------
+
+    dependencies : dict
+        A dictionary mapping each package to the set of packages it depends
+        on, as returned by :py:func:`bob.devtools.graph.package_dependencies`
+
+    durations : dict
+        A dictionary mapping each package to its build duration
+
+
+    Returns
+    -------
+
+    levels : dict
+        A dictionary mapping each package to its bottom level
+
+    """
+
+    dependents = _dependents(dependencies)
+
+    retval = {}
+    for level in reversed(sort_levels(dependencies)):
+        for package in level:
+            retval[package] = durations[package] + max(
+                [retval[k] for k in dependents[package]], default=0.0
+            )
+    return retval
+
+
+def critical_path(dependencies, durations):
+    """
+    Calculates the critical path of a build
+
+    The critical path is the longest chain of packages depending on each
+    other.  Its length is the minimum time required to build all packages,
+    independently of the number of runners available.
+
+    Parameters
+    ----------
+
+    dependencies : dict
+        A dictionary mapping each package to the set of packages it depends
+        on, as returned by :py:func:`bob.devtools.graph.package_dependencies`
+
+    durations : dict
+        A dictionary mapping each package to its build duration
+
+
+    Returns
+    -------
+
+    path : list
+        The packages on the critical path, in build order
+
+    length : float
+        The sum of build durations of packages on the critical path
+
+    """
+
+    if not dependencies:
+        return [], 0.0
+
+    levels = bottom_levels(dependencies, durations)
+    dependents = _dependents(dependencies)
+
+    def _key(k):
+        return (levels[k], k)
+
+    package = max(levels, key=_key)
+    path = [package]
+    while dependents[package]:
+        package = max(dependents[package], key=_key)
+        path.append(package)
+
+    return path, levels[path[0]]
+
+
+def schedule(dependencies, durations, runners):
+    """
+    Plans the execution of package builds on a number of runners
+
+    Uses critical-path list scheduling: whenever a runner becomes free, it
+    picks, among packages whose dependencies were already built, the one with
+    the highest bottom level (see :py:func:`bottom_levels`).  This favours
+    packages on the critical path and approximately minimises the time
+    required to build all packages (makespan).
+
+    Parameters
+    ----------
+
+    dependencies : dict
+        A dictionary mapping each package to the set of packages it depends
+        on, as returned by :py:func:`bob.devtools.graph.package_dependencies`
+
+    durations : dict
+        A dictionary mapping each package to its build duration
+
+    runners : int
+        The number of runners available to build packages concurrently
+
+
+    Returns
+    -------
+
+    plan : list
+        A list of dictionaries, one per package, sorted by start time, with
+        the keys ``package``, ``runner`` (index, starting at zero), ``start``
+        and ``end`` (times relative to the start of the build)
+
+    makespan : float
+        The time required to build all packages with this plan
+
+    """
+
+    levels = bottom_levels(dependencies, durations)
+    dependents = _dependents(dependencies)
+    missing = dict((k, len(v)) for k, v in dependencies.items())
+
+    # earliest start time of packages whose dependencies were scheduled
+    ready = dict((k, 0.0) for k, v in missing.items() if v == 0)
+    free = [(0.0, k) for k in range(runners)]  # (time, runner)
+    heapq.heapify(free)
+
+    plan = []
+    finished = {}
+    while ready:
+        time, runner = heapq.heappop(free)
+        candidates = [k for k, v in ready.items() if v <= time]
+        if not candidates:
+            # runner idles until the first package becomes available
+            time = min(ready.values())
+            candidates = [k for k, v in ready.items() if v <= time]
+        package = max(candidates, key=lambda k: (levels[k], k))
+        del ready[package]
+
+        end = finished[package] = time + durations[package]
+        plan.append(dict(package=package, runner=runner, start=time, end=end))
+        heapq.heappush(free, (end, runner))
+
+        for k in dependents[package]:
+            missing[k] -= 1
+            if missing[k] == 0:
+                ready[k] = max(finished[d] for d in dependencies[k])
+
+    plan.sort(key=lambda k: (k["start"], k["runner"]))
+    return plan, max([k["end"] for k in plan], default=0.0)
@@ -2,7 +2,6 @@
 
 
 import click
-import gitlab
 
 from ..log import echo_warning, get_logger, verbosity_option
 from ..release import get_gitlab_instance, update_files_at_master
@@ -124,6 +123,8 @@ Examples:
 def badges(package, update_readme, dry_run, server):
     """Creates stock badges for a project repository"""
 
+    import gitlab
+
     # if we are in a dry-run mode, let's let it be known
     if dry_run:
         logger.warn("!!!! DRY RUN MODE !!!!")
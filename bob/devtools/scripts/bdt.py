@@ -6,27 +6,81 @@
 import os
 
 import click
-import pkg_resources
-
-from click_plugins import with_plugins
 
 from ..log import setup
 
 logger = setup("bob")
 
 
+def _entry_points(group):
+    """Returns entry points registered on a group, without loading them.
+
+    Uses :py:mod:`importlib.metadata`, which is much faster than scanning the
+    whole working set with ``pkg_resources``.
+    """
+
+    from importlib.metadata import entry_points
+
+    eps = entry_points()
+    if hasattr(eps, "select"):  # python >= 3.10
+        eps = eps.select(group=group)
+    else:
+        eps = eps.get(group, [])
+
+    return dict((k.name, k) for k in eps)
+
+
 class AliasedGroup(click.Group):
-    """Class that handles prefix aliasing for commands."""
+    """Class that handles prefix aliasing for commands.
 
-    def get_command(self, ctx, cmd_name):
+    If ``entry_point_group`` is set, then commands registered on that entry
+    point group are also listed as sub-commands.  Those are only loaded when
+    required (i.e., upon invocation or help display), so that modules of
+    unrelated commands are never imported.
+    """
+
+    def __init__(self, *args, entry_point_group=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.entry_point_group = entry_point_group
+        self._entry_points = None
+
+    @property
+    def entry_points(self):
+        if self._entry_points is None:
+            self._entry_points = {}
+            if self.entry_point_group is not None:
+                self._entry_points = _entry_points(self.entry_point_group)
+        return self._entry_points
+
+    def list_commands(self, ctx):
+        return sorted(
+            set(click.Group.list_commands(self, ctx)) | set(self.entry_points)
+        )
+
+    def _get_command(self, ctx, cmd_name):
         rv = click.Group.get_command(self, ctx, cmd_name)
+        if rv is not None or cmd_name not in self.entry_points:
+            return rv
+
+        from click_plugins.core import BrokenCommand
+
+        entry_point = self.entry_points[cmd_name]
+        try:
+            rv = entry_point.load()
+        except Exception:
+            rv = BrokenCommand(cmd_name)
+        self.add_command(rv, cmd_name)
+        return rv
+
+    def get_command(self, ctx, cmd_name):
+        rv = self._get_command(ctx, cmd_name)
         if rv is not None:
             return rv
         matches = [x for x in self.list_commands(ctx) if x.startswith(cmd_name)]
         if not matches:
             return None
         elif len(matches) == 1:
-            return click.Group.get_command(self, ctx, matches[0])
+            return self._get_command(ctx, matches[0])
         ctx.fail("Too many matches: %s" % ", ".join(sorted(matches)))
 
 
@@ -58,12 +112,39 @@ if "LC_ALL" not in os.environ:
     os.environ["LC_ALL"] = "en_US.UTF-8"
 
 
-@with_plugins(pkg_resources.iter_entry_points("bdt.cli"))
 @click.group(
     cls=AliasedGroup,
+    entry_point_group="bdt.cli",
     context_settings=dict(help_option_names=["-?", "-h", "--help"]),
 )
-def main():
+@click.option(
+    "--timing-report",
+    envvar="BDT_TIMING_REPORT",
+    type=click.Path(file_okay=True, dir_okay=False),
+    help="If set, write (or append to) a JSON report with the time taken "
+    "by each phase (render, channel lookup, solve, build, test, upload and "
+    "cleanup) of the executed command.  May also be set through the "
+    "environment variable BDT_TIMING_REPORT",
+)
+@click.option(
+    "--timestamps/--no-timestamps",
+    default=False,
+    envvar="BDT_TIMESTAMPS",
+    help="If set, prefix every line of output from subprocesses (e.g. "
+    "conda-build or compilers) with the time elapsed since they started.  May "
+    "also be set through the environment variable BDT_TIMESTAMPS, which "
+    "--no-timestamps overrides",
+)
+@click.option(
+    "--log-file",
+    envvar="BDT_LOG_FILE",
+    type=click.Path(file_okay=True, dir_okay=False),
+    help="If set, also append the output of subprocesses to this "
+    "(gzip-compressed) file.  May also be set through the environment "
+    "variable BDT_LOG_FILE",
+)
+@click.pass_context
+def main(ctx, timing_report, timestamps, log_file):
     """Bob Development Tools - see available commands below"""
 
     from ..bootstrap import set_environment
@@ -72,3 +153,26 @@ def main():
     # certificate setup: required for gitlab API interaction
     set_environment("SSL_CERT_FILE", CACERT, os.environ)
     set_environment("REQUESTS_CA_BUNDLE", CACERT, os.environ)
+
+    # subprocess output handling: applies to all bdt subprocesses, including
+    # those running on (worker) subprocesses
+    # always set, so --no-timestamps overrides a BDT_TIMESTAMPS inherited
+    # by (worker) subprocesses
+    set_environment(
+        "BDT_TIMESTAMPS", "true" if timestamps else "false", os.environ
+    )
+    if log_file:
+        set_environment("BDT_LOG_FILE", os.path.abspath(log_file), os.environ)
+
+    if timing_report:
+        import sys
+
+        from ..bootstrap import write_timing_report
+
+        ctx.call_on_close(
+            lambda: write_timing_report(timing_report, " ".join(sys.argv))
+        )
+
+
+if __name__ == "__main__":
+    main()
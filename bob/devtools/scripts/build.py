@@ -1,24 +1,37 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
+import copy
+import functools
 import os
+import shutil
 import sys
 
 import click
-import conda_build.api
-import yaml
 
-from ..bootstrap import get_channels, run_cmdline, set_environment
+from ..bootstrap import (
+    add_spans,
+    get_channels,
+    run_cmdline,
+    set_environment,
+    span,
+    take_spans,
+)
 from ..build import (
+    compiler_cache,
     conda_arch,
+    get_build_key,
     get_docserver_setup,
     get_env_directory,
     get_output_path,
     get_parsed_recipe,
     get_rendered_metadata,
     make_conda_config,
+    merge_into_croot,
     next_build_number,
     root_logger_protection,
+    set_build_key,
     should_skip_build,
     use_mambabuild,
 )
@@ -36,6 +49,15 @@ from . import bdt
 logger = get_logger(__name__)
 
 
+_VARIANT_ENVIRON = (
+    "BOB_PACKAGE_VERSION",
+    "BDT_INTERSPHINX_CACHE",
+    "BDT_INTERSPHINX_TTL",
+)
+"""Environment variables passed to processes building (and testing) each
+variant of a recipe"""
+
+
 @click.command(
     epilog="""
 Examples:
@@ -55,6 +77,12 @@ Examples:
   3. To build multiple recipes, just pass the paths to them:
 
      $ bdt build --python=3.6 -vv path/to/recipe-dir1 path/to/recipe-dir2
+
+
+  4. Builds recipe for several versions of python at once.  Variants are
+     rendered first and then built concurrently:
+
+     $ bdt build -vv --python=3.9 --python=3.10 --python=3.11 path/to/conda/dir
 """
 )
 @click.argument(
@@ -66,9 +94,11 @@ Examples:
 @click.option(
     "-p",
     "--python",
-    default=("%d.%d" % sys.version_info[:2]),
+    default=[("%d.%d" % sys.version_info[:2])],
+    multiple=True,
     show_default=True,
-    help="Version of python to build the environment for",
+    help="Version of python to build the environment for.  Pass multiple "
+    "times to build variants for multiple python versions",
 )
 @click.option(
     "-r",
@@ -151,6 +181,37 @@ Examples:
     "It forwards all settings to ``nosetests`` via --eval-attr=<settings>``"
     " and ``pytest`` via -m=<settings>.",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    default=0,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Maximum number of variants (python versions) of the same recipe "
+    "to build concurrently.  If set to zero, then build all variants of a "
+    "recipe at once.  Variants built concurrently use separate conda-build "
+    "root directories (inside ``variants`` on the root directory, sharing "
+    "its source caches), and their packages are merged into the root "
+    "directory once all are built",
+)
+@click.option(
+    "--croot",
+    envvar="BDT_CROOT",
+    hidden=True,
+    help="conda-build root directory, where packages are built (defaults to "
+    "conda-bld on the base environment).  If set, packages on the default "
+    "root directory are also used, with priority, during the build",
+)
+@click.option(
+    "--compiler-cache",
+    "compiler_cache_tool",
+    envvar="BDT_COMPILER_CACHE",
+    type=click.Choice(["ccache", "sccache"]),
+    default=None,
+    help="Use a compiler cache (ccache or sccache, which must be installed "
+    "on the current environment) for compiled code.  The cache is kept under "
+    "the bdt cache directory, so it is re-used by subsequent builds",
+)
 @verbosity_option()
 @bdt.raise_on_error
 def build(
@@ -167,6 +228,9 @@ def build(
     dry_run,
     ci,
     test_mark_expr,
+    jobs,
+    croot,
+    compiler_cache_tool,
 ):
     """Builds package through conda-build with stock configuration.
 
@@ -175,6 +239,8 @@ def build(
     anaconda-upload``.
     """
 
+    import yaml
+
     # if we are in a dry-run mode, let's let it be known
     if dry_run:
         logger.warn("!!!! DRY RUN MODE !!!!")
@@ -216,95 +282,328 @@ def build(
 
     # dump packages at base environment
     prefix = get_env_directory(os.environ["CONDA_EXE"], "base")
-    condarc_options["croot"] = os.path.join(prefix, "conda-bld")
+    default_croot = os.path.join(prefix, "conda-bld")
+    condarc_options["croot"] = croot or default_croot
+
+    # isolated builds (e.g. concurrent nightlies) use packages built before
+    # and merged into the default root, with priority
+    if (
+        croot is not None
+        and os.path.realpath(croot) != os.path.realpath(default_croot)
+        and os.path.exists(
+            os.path.join(default_croot, "noarch", "repodata.json")
+        )
+    ):
+        logger.info("Using packages available at %s", default_croot)
+        condarc_options["channels"].insert(0, default_croot)
+
+    with compiler_cache(
+        compiler_cache_tool, append_file, condarc_options["croot"]
+    ) as append_file:
+
+        # one configuration per python variant, shared by all recipes
+        conda_configs = {}
+        for k in python:
+            conda_configs[k] = make_conda_config(
+                config, k, append_file, condarc_options
+            )
 
-    conda_config = make_conda_config(
-        config, python, append_file, condarc_options
-    )
+        set_environment("MATPLOTLIBRC", MATPLOTLIB_RCDIR)
+        set_environment("BOBRC", BOBRC_PATH)
+
+        # setup BOB_DOCUMENTATION_SERVER environment variable (used for bob.extension
+        # and derived documentation building via Sphinx)
+        doc_urls = get_docserver_setup(
+            public=(not private),
+            stable=stable,
+            server=server,
+            intranet=ci,
+            group=group,
+        )
+        set_environment("BOB_DOCUMENTATION_SERVER", doc_urls)
 
-    set_environment("MATPLOTLIBRC", MATPLOTLIB_RCDIR)
-    set_environment("BOBRC", BOBRC_PATH)
+        # this is for testing and may limit which tests run
+        set_environment("NOSE_EVAL_ATTR", test_mark_expr)
+        set_environment("PYTEST_ADDOPTS", f"-m '{test_mark_expr}'")
 
-    # setup BOB_DOCUMENTATION_SERVER environment variable (used for bob.extension
-    # and derived documentation building via Sphinx)
-    doc_urls = get_docserver_setup(
-        public=(not private),
-        stable=stable,
-        server=server,
-        intranet=ci,
-        group=group,
-    )
-    set_environment("BOB_DOCUMENTATION_SERVER", doc_urls)
+        arch = conda_arch()
 
-    # this is for testing and may limit which tests run
-    set_environment("NOSE_EVAL_ATTR", test_mark_expr)
-    set_environment("PYTEST_ADDOPTS", f"-m '{test_mark_expr}'")
+        for d in recipe_dir:
 
-    arch = conda_arch()
+            if not os.path.exists(d):
+                raise RuntimeError("The directory %s does not exist" % d)
 
-    for d in recipe_dir:
+            # If using RH based image/runner, install the packages inside the
+            # yum_requirements.txt file if it exists
+            yum_requirements_file = os.path.join(d, "yum_requirements.txt")
+            if os.path.exists("/usr/bin/yum") and os.path.exists(
+                yum_requirements_file
+            ):
+                logger.info(
+                    "Installing packages from yum_requirements.txt file using yum"
+                )
+                cmd = ["/usr/bin/sudo", "-n", "yum", "-y", "install"]
+                cmd.extend(open(yum_requirements_file).read().splitlines())
+                run_cmdline(cmd)
+
+            version_candidate = os.path.join(d, "..", "version.txt")
+            if os.path.exists(version_candidate):
+                version = open(version_candidate).read().rstrip()
+                set_environment("BOB_PACKAGE_VERSION", version)
+
+            # pre-renders all variants of the recipe before building any of them -
+            # figures out destinations and build numbers (channel index is only
+            # downloaded once for all variants)
+            variants = []
+            for py in python:
+
+                conda_config = conda_configs[py]
+                with span("render", recipe=d, python=py):
+                    metadata = get_rendered_metadata(d, conda_config)
+
+                # checks if we should actually build this recipe
+                if should_skip_build(metadata):
+                    logger.info(
+                        "Skipping UNSUPPORTED build of %s for %s (python %s)",
+                        d,
+                        arch,
+                        py,
+                    )
+                    continue
+
+                rendered_recipe = get_parsed_recipe(metadata)
+
+                logger.info("Printing rendered recipe")
+                logger.info("\n" + yaml.dump(rendered_recipe))
+                logger.info("Finished printing rendered recipe")
+                path = get_output_path(metadata, conda_config)[0]
+
+                # gets the next build number
+                with span("channel", recipe=d, python=py):
+                    build_number, _ = next_build_number(
+                        upload_channel, os.path.basename(path)
+                    )
+
+                logger.info(
+                    "Building %s-%s-py%s (build: %d) for %s",
+                    rendered_recipe["package"]["name"],
+                    rendered_recipe["package"]["version"],
+                    py.replace(".", ""),
+                    build_number,
+                    arch,
+                )
+
+                build_key = get_build_key(d, metadata)
+                logger.info(
+                    "Build key for %s (python %s): %s", d, py, build_key
+                )
 
-        if not os.path.exists(d):
-            raise RuntimeError("The directory %s does not exist" % d)
+                variants.append((py, build_number, build_key))
 
-        # If using RH based image/runner, install the packages inside the
-        # yum_requirements.txt file if it exists
-        yum_requirements_file = os.path.join(d, "yum_requirements.txt")
-        if os.path.exists("/usr/bin/yum") and os.path.exists(
-            yum_requirements_file
-        ):
-            logger.info(
-                "Installing packages from yum_requirements.txt file using yum"
+            if dry_run or not variants:
+                continue
+
+            # set $BOB_BUILD_NUMBER and force conda_build to reparse recipe to get
+            # it right - variants built concurrently run on separate processes,
+            # so they do not share (environment) state.  Variables set by bdt
+            # itself are passed explicitly (the test phase, e.g. documentation
+            # builds, inherits the environment of the variant build process)
+            environ = dict(
+                (k, os.environ[k]) for k in _VARIANT_ENVIRON if k in os.environ
             )
-            cmd = ["/usr/bin/sudo", "-n", "yum", "-y", "install"]
-            cmd.extend(open(yum_requirements_file).read().splitlines())
-            run_cmdline(cmd)
-
-        version_candidate = os.path.join(d, "..", "version.txt")
-        if os.path.exists(version_candidate):
-            version = open(version_candidate).read().rstrip()
-            set_environment("BOB_PACKAGE_VERSION", version)
-
-        # pre-renders the recipe - figures out the destination
-        metadata = get_rendered_metadata(d, conda_config)
-
-        # checks if we should actually build this recipe
-        if should_skip_build(metadata):
-            logger.info(
-                "Skipping UNSUPPORTED build of %s for %s", recipe_dir, arch
+            max_workers = min(jobs or len(variants), len(variants))
+
+            # conda-build is not safe for concurrent builds sharing the same
+            # root directory (index, work and test directories) - each
+            # variant built concurrently uses its own root, and can install
+            # packages built before from the shared one.  Downloaded sources
+            # (and git caches) are still shared.
+            croot = condarc_options["croot"]
+            variant_options = {}
+            for py, _, _ in variants:
+                variant_options[py] = condarc_options
+                if max_workers == 1:
+                    continue
+                variant_options[py] = copy.deepcopy(condarc_options)
+                variant_options[py]["croot"] = os.path.join(
+                    croot, "variants", "py" + py.replace(".", "")
+                )
+                variant_options[py]["src_cache_root"] = croot
+                if os.path.exists(
+                    os.path.join(croot, "noarch", "repodata.json")
+                ):
+                    variant_options[py]["channels"].insert(0, croot)
+
+            arguments = dict(
+                (
+                    py,
+                    dict(
+                        recipe_dir=d,
+                        python=py,
+                        config=config,
+                        append_file=append_file,
+                        condarc_options=variant_options[py],
+                        build_number=build_number,
+                        no_test=no_test,
+                        environ=environ,
+                        build_key=build_key,
+                    ),
+                )
+                for py, build_number, build_key in variants
             )
-            continue
 
-        rendered_recipe = get_parsed_recipe(metadata)
+            results = {}
+
+            def _collect(py, result):
+                try:
+                    results[py], spans = result()
+                    add_spans(spans)
+                except Exception as e:
+                    add_spans(getattr(e, "spans", []))
+                    logger.error(
+                        "Build of %s for python %s: FAILED (%s)", d, py, e
+                    )
+                    results[py] = e
+
+            with span(
+                "build", recipe=d, python=",".join(py for py, _, _ in variants)
+            ):
+                if max_workers == 1:
+                    for py, _, _ in variants:
+                        _collect(
+                            py,
+                            functools.partial(build_variant, **arguments[py]),
+                        )
+                else:
+                    with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=max_workers
+                    ) as executor:
+                        futures = dict(
+                            (
+                                executor.submit(build_variant, **arguments[py]),
+                                py,
+                            )
+                            for py, _, _ in variants
+                        )
+                        for future in concurrent.futures.as_completed(futures):
+                            _collect(futures[future], future.result)
+
+            for py, _, _ in variants:
+                if isinstance(results[py], Exception):
+                    continue
+                logger.info(
+                    "Build of %s for python %s: SUCCESS (%s)",
+                    d,
+                    py,
+                    ", ".join(results[py]),
+                )
 
-        logger.info("Printing rendered recipe")
-        logger.info("\n" + yaml.dump(rendered_recipe))
-        logger.info("Finished printing rendered recipe")
-        path = get_output_path(metadata, conda_config)[0]
+            failed = [k for k, v in results.items() if isinstance(v, Exception)]
+            if failed:
+                raise RuntimeError(
+                    "Build of %s failed for python %s"
+                    % (d, ", ".join(sorted(failed)))
+                )
 
-        # gets the next build number
-        build_number, _ = next_build_number(
-            upload_channel, os.path.basename(path)
-        )
+            if max_workers > 1:
+                built = [k for py, _, _ in variants for k in results[py]]
+                with span("index", channel=croot):
+                    merged = dict(zip(built, merge_into_croot(croot, built)))
+                for py, _, _ in variants:
+                    results[py] = [merged[k] for k in results[py]]
+                    shutil.rmtree(
+                        variant_options[py]["croot"], ignore_errors=True
+                    )
+
+            # if you get to this point, the packages were successfully rebuilt
+            # set environment to signal caller we may dispose of them.  Variables
+            # BDT_BUILD_PY<XY> contain outputs per python variant, while
+            # BDT_BUILD lists all outputs for all variants.
+            paths = []
+            for py, _, _ in variants:
+                os.environ["BDT_BUILD_PY" + py.replace(".", "")] = ":".join(
+                    results[py]
+                )
+                paths += results[py]
+            os.environ["BDT_BUILD"] = ":".join(paths)
 
-        logger.info(
-            "Building %s-%s-py%s (build: %d) for %s",
-            rendered_recipe["package"]["name"],
-            rendered_recipe["package"]["version"],
-            python.replace(".", ""),
-            build_number,
-            arch,
-        )
 
-        if not dry_run:
-            # set $BOB_BUILD_NUMBER and force conda_build to reparse recipe to
-            # get it right
-            set_environment("BOB_BUILD_NUMBER", str(build_number))
+def build_variant(
+    recipe_dir,
+    python,
+    config,
+    append_file,
+    condarc_options,
+    build_number,
+    no_test,
+    environ,
+    build_key=None,
+):
+    """Builds a single (python) variant of a recipe through conda-build.
+
+    When variants are built concurrently, this function is executed in a
+    separate process, so that environment variables set for the build (e.g.
+    ``BOB_BUILD_NUMBER``) do not leak into other variants.  Because of that,
+    it only takes simple (picklable) arguments and re-creates the conda-build
+    configuration locally.  ``SystemExit``, raised by conda-build on (some)
+    test failures, is converted into a :py:class:`RuntimeError`.
+
+
+    Args:
+
+      recipe_dir: The directory containing the recipe's ``meta.yaml`` file
+      python: The version of python to build the variant for, as ``x.y``
+      config: Path leading to the ``conda_build_config.yaml`` to use
+      append_file: Path leading to the ``recipe_append.yaml`` file to use
+      condarc_options: Pre-parsed condarc options
+      build_number: The build number to use for this variant
+      no_test: If set, then do not test the package after building it
+      environ: Dictionary of further environment variables to set before
+        building
+      build_key: If set, the build key (see
+        :py:func:`bob.devtools.build.get_build_key`) to record on the
+        metadata of built packages
+
+
+    Returns:
+
+      tuple: The list of built packages, as returned by
+      ``conda_build.api.build()``, and the list of timing spans recorded
+      during the build (see :py:func:`bob.devtools.bootstrap.take_spans`).
+      If the build fails, spans are set on the ``spans`` attribute of the
+      raised exception.
+    """
+
+    import conda_build.api
+
+    # keeps spans of the parent process apart (from forking, or if called
+    # on the parent process itself)
+    inherited = take_spans()
+
+    for k, v in environ.items():
+        set_environment(k, v)
+    set_environment("BOB_BUILD_NUMBER", str(build_number))
+
+    try:
+        with span("variant", recipe=recipe_dir, python=python):
+            conda_config = make_conda_config(
+                config, python, append_file, condarc_options
+            )
+            if build_key is not None:
+                set_build_key(conda_config, build_key)
             with root_logger_protection():
                 use_mambabuild()
                 paths = conda_build.api.build(
-                    d, config=conda_config, notest=no_test
+                    recipe_dir, config=conda_config, notest=no_test
                 )
-            # if you get to this point, the package was successfully rebuilt
-            # set environment to signal caller we may dispose of it
-            os.environ["BDT_BUILD"] = ":".join(paths)
+    except (Exception, SystemExit) as e:
+        if isinstance(e, SystemExit):
+            # conda-build exits on (some) test failures
+            e = RuntimeError("conda-build exited with status %s" % e.code)
+        e.spans = take_spans()
+        add_spans(inherited)
+        raise e
+
+    spans = take_spans()
+    add_spans(inherited)
+    return paths, spans
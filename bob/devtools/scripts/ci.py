@@ -6,14 +6,12 @@ import shutil
 import sys
 
 import click
-import pkg_resources
-import yaml
-
-from click_plugins import with_plugins
 
+from ..bootstrap import span
 from ..build import comment_cleanup, load_order_file, uniq
 from ..ci import (
     cleanup,
+    git_clone,
     is_private,
     read_packages,
     select_conda_build_config,
@@ -21,16 +19,22 @@ from ..ci import (
     select_user_condarc,
     temporary_cwd,
 )
-from ..constants import BASE_CONDARC, SERVER
+from ..constants import BASE_CONDARC, DOCS_SPARSE_CHECKOUT, SERVER
 from ..deploy import deploy_conda_package, deploy_documentation
+from ..docs import (
+    freeze_unchanged_sources,
+    intersphinx_cache_dir,
+    restore_doctrees,
+    save_doctrees,
+    sphinx_cache_dir,
+)
 from ..log import echo_normal, get_logger, verbosity_option
 from . import bdt
 
 logger = get_logger(__name__)
 
 
-@with_plugins(pkg_resources.iter_entry_points("bdt.ci.cli"))
-@click.group(cls=bdt.AliasedGroup)
+@click.group(cls=bdt.AliasedGroup, entry_point_group="bdt.ci.cli")
 @click.option(
     "-l",
     "--local",
@@ -107,16 +111,17 @@ def base_deploy(dry_run):
                 logger.debug("Skipping deploying of %s - not a base package", k)
                 continue
 
-            deploy_conda_package(
-                k,
-                arch=arch,
-                stable=True,
-                public=True,
-                username=os.environ["DOCUSER"],
-                password=os.environ["DOCPASS"],
-                overwrite=False,
-                dry_run=dry_run,
-            )
+            with span("upload", package=k):
+                deploy_conda_package(
+                    k,
+                    arch=arch,
+                    stable=True,
+                    public=True,
+                    username=os.environ["DOCUSER"],
+                    password=os.environ["DOCPASS"],
+                    overwrite=False,
+                    dry_run=dry_run,
+                )
 
             logger.info("Removing %s after successful deployment", k)
             os.unlink(k)
@@ -192,30 +197,32 @@ def deploy(latest, dry_run):
         deploy_packages = glob.glob(conda_paths) + glob.glob(tarbz2_paths)
 
         for k in deploy_packages:
-            deploy_conda_package(
-                k,
-                arch=arch,
-                stable=stable,
-                public=public,
-                username=os.environ["DOCUSER"],
-                password=os.environ["DOCPASS"],
-                overwrite=False,
-                dry_run=dry_run,
-            )
+            with span("upload", package=k):
+                deploy_conda_package(
+                    k,
+                    arch=arch,
+                    stable=stable,
+                    public=public,
+                    username=os.environ["DOCUSER"],
+                    password=os.environ["DOCPASS"],
+                    overwrite=False,
+                    dry_run=dry_run,
+                )
 
     local_docs = os.path.join(os.environ["CI_PROJECT_DIR"], "sphinx")
-    deploy_documentation(
-        local_docs,
-        package,
-        stable=stable,
-        latest=latest,
-        public=public,
-        branch=os.environ["CI_COMMIT_REF_NAME"],
-        tag=os.environ.get("CI_COMMIT_TAG"),
-        username=os.environ["DOCUSER"],
-        password=os.environ["DOCPASS"],
-        dry_run=dry_run,
-    )
+    with span("upload", package=package):
+        deploy_documentation(
+            local_docs,
+            package,
+            stable=stable,
+            latest=latest,
+            public=public,
+            branch=os.environ["CI_COMMIT_REF_NAME"],
+            tag=os.environ.get("CI_COMMIT_TAG"),
+            username=os.environ["DOCUSER"],
+            password=os.environ["DOCPASS"],
+            dry_run=dry_run,
+        )
 
 
 @ci.command(
@@ -382,6 +389,8 @@ def base_build(order, group, dry_run):
     be used outside this context.
     """
 
+    import yaml
+
     condarc = select_user_condarc(
         paths=[os.curdir], branch=os.environ.get("CI_COMMIT_REF_NAME")
     )
@@ -544,7 +553,9 @@ def build(ctx, dry_run, recipe_dir):
     """Builds packages.
 
     This command builds packages in the CI infrastructure.  It is
-    **not** meant to be used outside this context.
+    **not** meant to be used outside this context.  If the environment
+    variable ``PYTHON_VERSION`` contains multiple (space-separated)
+    python versions, then variants for all of them are built in one go.
     """
 
     group = os.environ["CI_PROJECT_NAMESPACE"]
@@ -577,7 +588,7 @@ def build(ctx, dry_run, recipe_dir):
     ctx.invoke(
         build,
         recipe_dir=[recipe_dir],
-        python=os.environ["PYTHON_VERSION"],  # python version
+        python=os.environ["PYTHON_VERSION"].split(),  # python version(s)
         condarc=condarc,
         config=variants_file,
         no_test=False,
@@ -589,6 +600,7 @@ def build(ctx, dry_run, recipe_dir):
         dry_run=dry_run,
         ci=True,
         test_mark_expr=os.environ.get("TEST_MARK_EXPR", ""),
+        compiler_cache_tool=os.environ.get("BDT_COMPILER_CACHE"),
     )
 
 
@@ -615,7 +627,8 @@ def clean(ctx):
     from ..bootstrap import run_cmdline
     from ..build import git_clean_build
 
-    git_clean_build(run_cmdline, verbose=(ctx.meta["verbosity"] >= 3))
+    with span("cleanup"):
+        git_clean_build(run_cmdline, verbose=(ctx.meta["verbosity"] >= 3))
 
 
 @ci.command(
@@ -626,6 +639,18 @@ Examples:
 
      $ bdt ci nightlies -vv order.txt
 
+
+  2. Builds up to 4 packages of each dependence level concurrently (the order
+     file should be generated with ``bdt gitlab graph --order``):
+
+     $ bdt ci nightlies -vv --jobs=4 order.txt
+
+
+  3. Retries the nightly builds of a pipeline, skipping packages successfully
+     built on a previous attempt:
+
+     $ bdt ci nightlies -vv --resume order.txt
+
 """
 )
 @click.argument(
@@ -642,10 +667,57 @@ Examples:
     "(combine with the verbosity flags - e.g. ``-vvv``) to enable "
     "printing to help you understand what will be done",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    envvar="BDT_NIGHTLIES_JOBS",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of packages of the same dependence level to build "
+    "concurrently.  Levels are read from the order file (see ``bdt gitlab "
+    "graph --order``)",
+)
+@click.option(
+    "--checkpoint/--no-checkpoint",
+    envvar="BDT_NIGHTLIES_CHECKPOINT",
+    default=True,
+    show_default=True,
+    help="Records the result, commit and artifacts of each package built on "
+    "a checkpoint file in the bdt cache directory",
+)
+@click.option(
+    "-r",
+    "--resume/--no-resume",
+    envvar="BDT_NIGHTLIES_RESUME",
+    default=False,
+    show_default=True,
+    help="Skips packages successfully built before (see ``--checkpoint``), "
+    "from the same commit and on the same local channel state, re-using "
+    "their artifacts",
+)
+@click.option(
+    "--config-dir",
+    default=os.curdir,
+    hidden=True,
+    type=click.Path(file_okay=False, dir_okay=True, exists=True),
+    help="Directory where to look for condarc, conda-build configuration and "
+    "recipe-append files, besides the recipe directory (used by concurrent "
+    "jobs, that run on separate directories)",
+)
+@click.option(
+    "--update-mirrors/--no-update-mirrors",
+    default=True,
+    hidden=True,
+    help="Updates local mirrors of packages before cloning them (concurrent "
+    "jobs do not update mirrors just updated by the parent process)",
+)
 @verbosity_option()
 @bdt.raise_on_error
 @click.pass_context
-def nightlies(ctx, order, dry_run):
+def nightlies(
+    ctx, order, dry_run, jobs, checkpoint, resume, config_dir, update_mirrors
+):
     """Runs nightly builds.
 
     This command can run nightly builds for packages listed on a file.
@@ -663,17 +735,50 @@ def nightlies(ctx, order, dry_run):
 
     Dependencies are searched with priority to locally built packages.  For this
     reason, the input file **must** be provided in the right dependence order.
+
+    If more than one job is allowed, packages on the same dependence level
+    (delimited by ``# level`` comments on the order file) are built
+    concurrently, each on a separate process, with its own build directory and
+    output log.  Packages built on a level are merged into the local channel
+    before the next level starts.
+
+    The result of each package build is recorded on a checkpoint file.  When
+    resuming, packages built before from the same commit, on the same
+    pipeline and after the same packages, are not rebuilt: their artifacts
+    are restored into the local channel instead.  Checkpoints of other
+    pipelines are removed, and so are checkpoints of successful builds.
     """
 
+    from ..ci import remove_checkpoint, reset_checkpoint
+
+    checkpoint = _checkpoint_path() if checkpoint else None
+    if checkpoint and not dry_run:
+        reset_checkpoint(checkpoint, _checkpoint_environment())
+
+    if jobs > 1:
+        _concurrent_nightlies(ctx, order, dry_run, jobs, checkpoint, resume)
+        if checkpoint and not dry_run:
+            remove_checkpoint(checkpoint)
+        return
+
     # loads dirnames from order file (accepts # comments and empty lines)
     packages = read_packages(order)
 
     token = os.environ["CI_JOB_TOKEN"]
 
-    import git
-
+    from ..ci import (
+        channel_state,
+        checkpoint_valid,
+        load_checkpoint,
+        record_checkpoint,
+    )
     from .build import build
 
+    records = load_checkpoint(checkpoint) if checkpoint else {}
+    environment = _checkpoint_environment()
+    previous = []
+    restored = []
+
     # loaded all recipes, now cycle through them implementing what is described
     # in the documentation of this function
     for n, (package, branch) in enumerate(packages):
@@ -693,14 +798,38 @@ def nightlies(ctx, order, dry_run):
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
-        # clone the repo, shallow version, on the specified branch
-        logger.info('Cloning "%s", branch "%s" (depth=1)...', package, branch)
-        git.Repo.clone_from(
-            "https://gitlab-ci-token:%s@gitlab.idiap.ch/%s" % (token, package),
+        # clone the repo on the specified branch, borrowing from the mirror
+        repo = git_clone(
+            "https://gitlab.idiap.ch",
+            package,
+            branch,
             clone_to,
-            branch=branch,
-            depth=1,
+            token,
+            update_mirror=update_mirrors,
         )
+        commit = repo.head.commit.hexsha
+
+        channel = channel_state(previous, environment)
+        previous.append((package, commit))
+        if resume and checkpoint_valid(
+            checkpoint, records.get(package), commit, channel
+        ):
+            logger.info(
+                "Skipping %s@%s (%s) - checkpoint is valid",
+                package,
+                branch,
+                commit,
+            )
+            restored += [
+                os.path.join(os.path.dirname(checkpoint), k)
+                for k in records[package]["artifacts"]
+            ]
+            continue
+
+        # makes packages skipped so far available to this one
+        if restored and not dry_run:
+            _merge_into_croot(_local_croot(), restored)
+            restored = []
 
         # determine package visibility
         private = is_private("https://gitlab.idiap.ch", package)
@@ -713,45 +842,57 @@ def nightlies(ctx, order, dry_run):
         recipe_dir = os.path.join(clone_to, "conda")
 
         condarc = select_user_condarc(
-            paths=[recipe_dir, os.curdir],
+            paths=[recipe_dir, config_dir],
             branch=os.environ.get("CI_COMMIT_REF_NAME"),
         )
         if condarc is not None:
             logger.info("Condarc configuration file: %s", condarc)
 
         variants_file = select_conda_build_config(
-            paths=[recipe_dir, os.curdir],
+            paths=[recipe_dir, config_dir],
             branch=os.environ.get("CI_COMMIT_REF_NAME"),
         )
         logger.info("Conda build configuration file: %s", variants_file)
 
         append_file = select_conda_recipe_append(
-            paths=[recipe_dir, os.curdir],
+            paths=[recipe_dir, config_dir],
             branch=os.environ.get("CI_COMMIT_REF_NAME"),
         )
         logger.info("Conda build recipe-append file: %s", append_file)
 
-        logger.info("Running checks...")
-        with temporary_cwd(clone_to):
-            ctx.invoke(check)
-
-        logger.info("Building")
-        ctx.invoke(
-            build,
-            recipe_dir=[recipe_dir],
-            python=os.environ["PYTHON_VERSION"],  # python version
-            condarc=condarc,
-            config=variants_file,
-            no_test=False,
-            append_file=append_file,
-            server=SERVER,
-            group=group,
-            private=private,
-            stable=stable,
-            dry_run=dry_run,
-            ci=True,
-            test_mark_expr=os.environ.get("TEST_MARK_EXPR", ""),
-        )
+        os.environ.pop("BDT_BUILD", None)
+        try:
+            logger.info("Running checks...")
+            with temporary_cwd(clone_to):
+                ctx.invoke(check)
+
+            logger.info("Building")
+            ctx.invoke(
+                build,
+                recipe_dir=[recipe_dir],
+                python=os.environ["PYTHON_VERSION"].split(),
+                condarc=condarc,
+                config=variants_file,
+                no_test=False,
+                append_file=append_file,
+                server=SERVER,
+                group=group,
+                private=private,
+                stable=stable,
+                dry_run=dry_run,
+                ci=True,
+                test_mark_expr=os.environ.get("TEST_MARK_EXPR", ""),
+                croot=os.environ.get("BDT_CROOT"),
+                compiler_cache_tool=os.environ.get("BDT_COMPILER_CACHE"),
+            )
+        except Exception:
+            if checkpoint and not dry_run:
+                record_checkpoint(
+                    checkpoint, package, branch, commit, channel, [], "failed"
+                )
+            raise
+
+        artifacts = [k for k in os.environ.get("BDT_BUILD", "").split(":") if k]
 
         is_master = os.environ["CI_COMMIT_REF_NAME"] == "master"
 
@@ -760,18 +901,20 @@ def nightlies(ctx, order, dry_run):
         # n.b.: can only arrive here if dry_run was ``False`` (no need to check
         # again)
         if "BDT_BUILD" in os.environ and is_master:
-            tarball = os.environ["BDT_BUILD"]
+            tarballs = os.environ["BDT_BUILD"].split(":")
             del os.environ["BDT_BUILD"]
-            deploy_conda_package(
-                tarball,
-                arch=None,
-                stable=stable,
-                public=(not private),
-                username=os.environ["DOCUSER"],
-                password=os.environ["DOCPASS"],
-                overwrite=False,
-                dry_run=dry_run,
-            )
+            for tarball in tarballs:
+                with span("upload", package=tarball):
+                    deploy_conda_package(
+                        tarball,
+                        arch=None,
+                        stable=stable,
+                        public=(not private),
+                        username=os.environ["DOCUSER"],
+                        password=os.environ["DOCPASS"],
+                        overwrite=False,
+                        dry_run=dry_run,
+                    )
 
         # removes the documentation to avoid permissions issues with the following
         # projects being built
@@ -784,6 +927,368 @@ def nightlies(ctx, order, dry_run):
             )
             shutil.rmtree(local_docs)
 
+        if checkpoint and not dry_run:
+            record_checkpoint(
+                checkpoint,
+                package,
+                branch,
+                commit,
+                channel,
+                artifacts,
+                "success",
+            )
+
+    # all packages were built, there is nothing to resume
+    if checkpoint and not dry_run:
+        remove_checkpoint(checkpoint)
+
+
+def _nightly_job(package, branch, dry_run, verbosity, update_mirror=True):
+    """Builds a single package of the nightlies on a separate process
+
+    Each process runs on its own working (and project) directory, with its own
+    build directory, log files and timing report, so concurrent jobs do not
+    share any outputs.  If ``update_mirror`` is not set, the process clones
+    the package from its local mirror without updating it.  Returns the path
+    to the process log and its exit status.
+    """
+
+    import subprocess
+
+    group, name = package.split("/", 1)
+    workdir = os.path.join(
+        os.environ["CI_PROJECT_DIR"], "nightlies", group, name
+    )
+    os.makedirs(workdir, exist_ok=True)
+
+    order = os.path.join(workdir, "order.txt")
+    with open(order, "wt") as f:
+        f.write("%s, %s\n" % (package, branch))
+
+    # clones, sphinx outputs and builds go to the job directory
+    env = dict(
+        os.environ,
+        CI_PROJECT_DIR=workdir,
+        BDT_CROOT=os.path.join(workdir, "conda-bld"),
+    )
+    if "BDT_TIMING_REPORT" in env:  # one report per process
+        root, ext = os.path.splitext(os.path.abspath(env["BDT_TIMING_REPORT"]))
+        env["BDT_TIMING_REPORT"] = "%s-%s%s" % (root, name, ext)
+    if "BDT_LOG_FILE" in env:  # gzip streams cannot be appended concurrently
+        env["BDT_LOG_FILE"] = os.path.join(workdir, "output.log.gz")
+
+    cmd = [sys.executable, "-m", "bob.devtools.scripts.bdt", "ci", "nightlies"]
+    if verbosity:
+        cmd.append("-" + verbosity * "v")
+    if dry_run:
+        cmd.append("--dry-run")
+    cmd += ["--jobs=1", "--no-checkpoint", "--no-resume"]
+    if not update_mirror:
+        cmd.append("--no-update-mirrors")
+    cmd += ["--config-dir=%s" % os.path.realpath(os.curdir), order]
+
+    log = os.path.join(workdir, "output.log")
+    with open(log, "wb") as f:
+        status = subprocess.call(
+            cmd, cwd=workdir, env=env, stdout=f, stderr=subprocess.STDOUT
+        )
+
+    return log, status
+
+
+def _merge_into_croot(croot, packages):
+    """Merges packages built on isolated build directories into the local
+    channel at ``croot``, and re-indexes it"""
+
+    from ..build import merge_into_croot
+
+    with span("index", channel=croot):
+        merge_into_croot(croot, packages)
+
+
+def _checkpoint_path():
+    """Returns the path of the nightlies checkpoint file for this build"""
+
+    from ..build import conda_arch
+    from ..constants import CACHE_DIR
+
+    python = "-".join(os.environ["PYTHON_VERSION"].split())
+    return os.path.join(
+        CACHE_DIR,
+        "nightlies",
+        "%s-py%s" % (conda_arch(), python.replace(".", "")),
+        "checkpoint.json",
+    )
+
+
+def _checkpoint_environment():
+    """Returns variables that invalidate nightlies checkpoints if changed
+
+    The pipeline identifier is part of it, so that checkpoints are only
+    reused when jobs of the same pipeline are retried.
+    """
+
+    return dict(
+        python=os.environ["PYTHON_VERSION"],
+        stable="STABLE" in os.environ,
+        test_mark_expr=os.environ.get("TEST_MARK_EXPR", ""),
+        pipeline=os.environ.get("CI_PIPELINE_ID"),
+    )
+
+
+def _local_croot():
+    """Returns the path of the local channel nightlies are built into"""
+
+    from ..build import get_env_directory
+
+    return os.environ.get("BDT_CROOT") or os.path.join(
+        get_env_directory(os.environ["CONDA_EXE"], "base"), "conda-bld"
+    )
+
+
+def _concurrent_nightlies(ctx, order, dry_run, jobs, checkpoint, resume):
+    """Runs nightlies, building packages on the same level concurrently"""
+
+    import concurrent.futures
+
+    import git
+
+    from ..build import conda_arch
+    from ..ci import (
+        channel_state,
+        checkpoint_valid,
+        git_mirror,
+        load_checkpoint,
+        mirror_commit,
+        read_package_levels,
+        record_checkpoint,
+    )
+
+    levels = read_package_levels(order)
+    croot = _local_croot()
+    subdirs = (conda_arch(), "noarch")
+    records = load_checkpoint(checkpoint) if checkpoint else {}
+    environment = _checkpoint_environment()
+    previous = []
+
+    total = sum(len(k) for k in levels)
+    done = 0
+    for n, level in enumerate(levels):
+
+        # skips packages with valid checkpoints, restoring their artifacts.
+        # Packages on the same level do not depend on each other: the state
+        # of the local channel is defined by packages of previous levels
+        channel = channel_state(previous, environment)
+        commits = {}
+        restored = []
+        pending = []
+        for package, branch in level:
+            commit = None
+            if checkpoint and resume:  # needed to validate the checkpoint
+                try:
+                    git_mirror(
+                        "https://gitlab.idiap.ch",
+                        package,
+                        os.environ["CI_JOB_TOKEN"],
+                    )
+                    commit = commits[package] = mirror_commit(package, branch)
+                except git.GitCommandError as e:
+                    # the job clones from the server: checkpoint is invalid,
+                    # and so is the (unknown) commit that will be built
+                    commits[package] = None
+                    logger.warning(
+                        'Cannot update mirror of "%s" (%s)',
+                        package,
+                        e.stderr.strip(),
+                    )
+            if resume and checkpoint_valid(
+                checkpoint, records.get(package), commit, channel
+            ):
+                logger.info(
+                    "Skipping %s@%s (%s) - checkpoint is valid",
+                    package,
+                    branch,
+                    commit,
+                )
+                restored += [
+                    os.path.join(os.path.dirname(checkpoint), k)
+                    for k in records[package]["artifacts"]
+                ]
+                done += 1
+                continue
+            pending.append((package, branch))
+        if restored and not dry_run:
+            _merge_into_croot(croot, restored)
+
+        echo_normal("\n" + (80 * "="))
+        echo_normal(
+            "Building level %d/%d (%d package(s), %d concurrently): %s"
+            % (
+                n + 1,
+                len(levels),
+                len(pending),
+                min(jobs, len(pending)),
+                ", ".join(k[0] for k in pending),
+            )
+        )
+        echo_normal((80 * "=") + "\n")
+
+        failed = []
+        built = []
+        with span("level", level=n + 1), (
+            concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        ) as executor:
+            futures = dict(
+                (
+                    executor.submit(
+                        _nightly_job,
+                        package,
+                        branch,
+                        dry_run,
+                        ctx.meta.get("verbosity", 0),
+                        # mirrors just updated (above) are not updated again
+                        update_mirror=commits.get(package) is None,
+                    ),
+                    (package, branch),
+                )
+                for package, branch in pending
+            )
+            for future in concurrent.futures.as_completed(futures):
+                package, branch = futures[future]
+                log, status = future.result()
+                done += 1
+                echo_normal("\n" + (80 * "-"))
+                echo_normal(
+                    "Output of %s (%d/%d) - %s"
+                    % (package, done, total, "FAILED" if status else "SUCCESS")
+                )
+                echo_normal((80 * "-") + "\n")
+                with open(log, "rt", errors="replace") as f:
+                    shutil.copyfileobj(f, sys.stdout)
+                sys.stdout.flush()
+                if status:
+                    failed.append(package)
+
+                # packages built by the job, to be merged into the local
+                # channel and recorded on the checkpoint
+                group, name = package.split("/", 1)
+                artifacts = []
+                for subdir in subdirs:
+                    base = os.path.join(
+                        os.environ["CI_PROJECT_DIR"],
+                        "nightlies",
+                        group,
+                        name,
+                        "conda-bld",
+                        subdir,
+                    )
+                    artifacts += glob.glob(os.path.join(base, "*.conda"))
+                    artifacts += glob.glob(os.path.join(base, "*.tar.bz2"))
+                built += artifacts
+
+                # the job updated the mirror while cloning (if it got there)
+                if package not in commits:
+                    commits[package] = mirror_commit(package, branch)
+
+                if checkpoint and not dry_run:
+                    record_checkpoint(
+                        checkpoint,
+                        package,
+                        branch,
+                        commits[package],
+                        channel,
+                        [] if status else artifacts,
+                        "failed" if status else "success",
+                    )
+
+        previous += [(k, commits.get(k)) for k, _ in level]
+
+        if failed:
+            raise RuntimeError(
+                "Nightly build failed for package(s) %s (level %d/%d)"
+                % (", ".join(sorted(failed)), n + 1, len(levels))
+            )
+
+        # makes packages built on this level available to the next ones
+        if built and not dry_run:
+            _merge_into_croot(croot, built)
+
+
+def _docs_harvest(package, branch, progress, doc_path, token, dry_run, sparse):
+    """Clones (or updates) a package for the aggregated documentation build
+
+    The package is cloned from its local mirror.  If sparse checkout patterns
+    are set, then only files matching them are checked out.  Returns lists
+    with (uncleaned) extra intersphinx requirements and nitpick exceptions
+    harvested from the package.
+    """
+
+    import git
+
+    group, name = package.split("/", 1)
+
+    clone_to = os.path.join(doc_path, group, name)
+    dirname = os.path.dirname(clone_to)
+    os.makedirs(dirname, exist_ok=True)
+
+    # clone the repo on the specified branch, borrowing from the mirror
+    if dry_run:
+        logger.info(
+            'Cloning "%s" [%s], branch "%s" to %s...',
+            package,
+            progress,
+            branch,
+            clone_to,
+        )
+        return [], []
+
+    if os.path.exists(clone_to):
+        logger.info(
+            'Repo "%s" [%s], already cloned at %s; updating branch "%s"...',
+            package,
+            progress,
+            clone_to,
+            branch,
+        )
+        git.Git(clone_to).pull("origin", branch)
+    else:
+        logger.info(
+            'Cloning "%s" [%s], branch "%s" to %s...',
+            package,
+            progress,
+            branch,
+            clone_to,
+        )
+        git_clone(
+            "https://gitlab.idiap.ch",
+            package,
+            branch,
+            clone_to,
+            token,
+            sparse=sparse,
+        )
+
+    extra_intersphinx = []
+    nitpick = []
+
+    # Copying the content from extra_intersphinx, test and run requirements
+    for k in (
+        os.path.join("doc", "extra-intersphinx.txt"),
+        os.path.join("doc", "test-requirements.txt"),
+        "requirements.txt",
+    ):
+        path = os.path.join(clone_to, k)
+        if os.path.exists(path):
+            with open(path) as f:
+                extra_intersphinx += comment_cleanup(f.readlines())
+
+    nitpick_path = os.path.join(clone_to, "doc", "nitpick-exceptions.txt")
+    if os.path.exists(nitpick_path):
+        with open(nitpick_path) as f:
+            nitpick += comment_cleanup(f.readlines())
+
+    return extra_intersphinx, nitpick
+
 
 @ci.command(
     epilog="""
@@ -793,6 +1298,11 @@ Examples:
 
      $ bdt ci docs -vv requirements.txt
 
+
+  2. Also clones test data and other files left out by default:
+
+     $ bdt ci docs -vv --no-partial requirements.txt
+
 """
 )
 @click.argument(
@@ -809,10 +1319,50 @@ Examples:
     "(combine with the verbosity flags - e.g. ``-vvv``) to enable "
     "printing to help you understand what will be done",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    envvar="BDT_DOCS_JOBS",
+    default=8,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of packages to clone and harvest concurrently",
+)
+@click.option(
+    "--partial/--no-partial",
+    envvar="BDT_DOCS_PARTIAL",
+    default=True,
+    show_default=True,
+    help="Makes sparse clones of packages (from their local mirrors), only "
+    "checking out files matching the sparse checkout patterns",
+)
+@click.option(
+    "-s",
+    "--sparse",
+    envvar="BDT_DOCS_SPARSE",
+    multiple=True,
+    default=DOCS_SPARSE_CHECKOUT,
+    show_default=True,
+    help="Sparse checkout pattern (gitignore-style) of files to check out "
+    "for partial clones.  May be repeated",
+)
+@click.option(
+    "--incremental/--no-incremental",
+    envvar="BDT_DOCS_INCREMENTAL",
+    default=False,
+    show_default=True,
+    help="Re-uses the Sphinx environment of the previous documentation build, "
+    "kept on the bdt cache directory.  Only documents of packages whose "
+    "sources changed since then are read again, except for documents using "
+    "autodoc, which depend on modules installed anew for every build, and "
+    "are always read again.  The documentation recipe must run "
+    "``sphinx-build`` without ``-a`` and ``-E``, and with the default "
+    "doctrees directory (``sphinx/.doctrees``)",
+)
 @verbosity_option()
 @bdt.raise_on_error
 @click.pass_context
-def docs(ctx, requirement, dry_run):
+def docs(ctx, requirement, dry_run, jobs, partial, sparse, incremental):
     """Prepares documentation build.
 
     This command:
@@ -825,95 +1375,48 @@ def docs(ctx, requirement, dry_run):
       2. Generates the `extra-intersphinx.txt` and `nitpick-exceptions.txt` file
       \b
 
+      3. Restores the Sphinx environment of the previous build (if
+         incremental), so that only packages that changed are read again
+         (documents using autodoc are always read again)
+      \b
+
     This command is supposed to be run **instead** of `bdt ci build...`
     """
 
     packages = read_packages(requirement)
 
-    import git
+    import concurrent.futures
 
     token = os.environ["CI_JOB_TOKEN"]
 
     # loaded all recipes, now cycle through them implementing what is described
-    # in the documentation of this function
+    # in the documentation of this function - packages are independent and
+    # harvested concurrently, while results are merged following the input
+    # order, so generated files are the same whatever the number of jobs
     extra_intersphinx = []
     nitpick = []
     doc_path = os.path.join(os.environ["CI_PROJECT_DIR"], "doc")
 
-    for n, (package, branch) in enumerate(packages):
-
-        group, name = package.split("/", 1)
-
-        clone_to = os.path.join(doc_path, group, name)
-        dirname = os.path.dirname(clone_to)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-
-        # clone the repo, shallow version, on the specified branch
-        if dry_run:
-            logger.info(
-                'Cloning "%s" [%d/%d], branch "%s" (depth=1) to %s...',
+    with span("clone", packages=len(packages)), (
+        concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    ) as executor:
+        futures = [
+            executor.submit(
+                _docs_harvest,
                 package,
-                n + 1,
-                len(packages),
                 branch,
-                clone_to,
+                "%d/%d" % (n + 1, len(packages)),
+                doc_path,
+                token,
+                dry_run,
+                list(sparse) if partial else None,
             )
-        else:
-            if os.path.exists(clone_to):
-                logger.info(
-                    'Repo "%s" [%d/%d], already cloned at %s; '
-                    'updating branch "%s"...',
-                    package,
-                    n + 1,
-                    len(packages),
-                    clone_to,
-                    branch,
-                )
-                git.Git(clone_to).pull("origin", branch)
-            else:
-                logger.info(
-                    'Cloning "%s" [%d/%d], branch "%s" (depth=1) to %s...',
-                    package,
-                    n + 1,
-                    len(packages),
-                    branch,
-                    clone_to,
-                )
-                git.Repo.clone_from(
-                    "https://gitlab-ci-token:%s@gitlab.idiap.ch/%s"
-                    % (token, package),
-                    clone_to,
-                    branch=branch,
-                    depth=1,
-                )
-
-            # Copying the content from extra_intersphinx
-            extra_intersphinx_path = os.path.join(
-                clone_to, "doc", "extra-intersphinx.txt"
-            )
-            if os.path.exists(extra_intersphinx_path):
-                with open(extra_intersphinx_path) as f:
-                    extra_intersphinx += comment_cleanup(f.readlines())
-
-            test_requirements_path = os.path.join(
-                clone_to, "doc", "test-requirements.txt"
-            )
-            if os.path.exists(test_requirements_path):
-                with open(test_requirements_path) as f:
-                    extra_intersphinx += comment_cleanup(f.readliens())
-
-            requirements_path = os.path.join(clone_to, "requirements.txt")
-            if os.path.exists(requirements_path):
-                with open(requirements_path) as f:
-                    extra_intersphinx += comment_cleanup(f.readlines())
-
-            nitpick_path = os.path.join(
-                clone_to, "doc", "nitpick-exceptions.txt"
-            )
-            if os.path.exists(nitpick_path):
-                with open(nitpick_path) as f:
-                    nitpick += comment_cleanup(f.readlines())
+            for n, (package, branch) in enumerate(packages)
+        ]
+        for future in futures:
+            _extra_intersphinx, _nitpick = future.result()
+            extra_intersphinx += _extra_intersphinx
+            nitpick += _nitpick
 
     logger.info("Generating (extra) sphinx files...")
 
@@ -940,9 +1443,28 @@ def docs(ctx, requirement, dry_run):
         with open(os.path.join(doc_path, "nitpick-exceptions.txt"), "w") as f:
             f.write(data)
 
+    # re-uses the Sphinx environment (doctrees) of the previous build
+    doctrees = os.path.join(os.environ["CI_PROJECT_DIR"], "sphinx", ".doctrees")
+    cache_dir = sphinx_cache_dir(os.environ["CI_PROJECT_PATH"])
+    if incremental and not dry_run:
+        freeze_unchanged_sources(
+            [os.path.join(doc_path, k) for k, _ in packages],
+            os.path.join(cache_dir, "sources.json"),
+        )
+        restore_doctrees(cache_dir, doctrees)
+
+    # documentation builds (see the conda test phase) share inventories
+    os.environ.setdefault("BDT_INTERSPHINX_CACHE", intersphinx_cache_dir())
+    logger.info(
+        "Intersphinx inventory cache: %s", os.environ["BDT_INTERSPHINX_CACHE"]
+    )
+
     logger.info("Building documentation...")
     ctx.invoke(build, dry_run=dry_run)
 
+    if incremental and not dry_run:
+        save_doctrees(doctrees, cache_dir)
+
 
 @ci.command(
     epilog="""
@@ -6,7 +6,6 @@ import sys
 import warnings
 
 import click
-import yaml
 
 from ..bootstrap import run_cmdline, set_environment
 from ..build import conda_create, make_conda_config, parse_dependencies, uniq
@@ -72,6 +71,22 @@ Examples:
      wish to install ``logging_tree`` as a plus, then just specify
      ``--pip-extras=logging_tree``.
 
+
+  6. Environments are installed from a lockfile (skipping the solver) if one
+  was saved by a previous call with the same dependencies.  To force a new
+  solution (e.g. to pick up newer beta packages) and update the lockfile, use
+  `--refresh-lockfile`:
+
+     $ bdt dev create -vv --overwrite --refresh-lockfile myenv
+
+
+  7. To create development environments in seconds, clone them from a
+  template environment kept in the bdt cache directory.  The first call
+  creates the template, while later calls (e.g. for another environment
+  name, or after small changes to the recipe dependencies) clone it:
+
+     $ bdt dev create -vv --template myenv
+
 """
 )
 @click.argument("name")
@@ -170,6 +185,35 @@ Examples:
     "created environments.  Pip installation happens after the base conda "
     "install (defaults, if any, are listed in ~/.bdtrc)",
 )
+@click.option(
+    "-L",
+    "--lockfile/--no-lockfile",
+    default=True,
+    help="Installs the environment from a lockfile (skipping the solver) if "
+    "one was saved by a previous run with the same dependencies, channels and "
+    "platform, and saves one otherwise.  Lockfiles are kept in the bdt cache "
+    "directory.  This option has no effect if --use-local is also set",
+)
+@click.option(
+    "-R",
+    "--refresh-lockfile",
+    is_flag=True,
+    default=False,
+    help="Ignores any existing lockfile for this environment, solving it "
+    "from scratch (e.g. to pick up new beta packages), and then updates the "
+    "lockfile",
+)
+@click.option(
+    "-T",
+    "--template/--no-template",
+    default=False,
+    help="Creates the environment by cloning (hard-linking) a template "
+    "environment kept in the bdt cache directory for the same dependencies, "
+    "channels and platform.  Templates for new dependencies are created by "
+    "cloning the closest existing template and installing only what "
+    "changed.  This option has no effect if --use-local or --dry-run are "
+    "also set",
+)
 @verbosity_option()
 @bdt.raise_on_error
 def create(
@@ -187,6 +231,9 @@ def create(
     stable,
     dry_run,
     pip_extras,
+    lockfile,
+    refresh_lockfile,
+    template,
 ):
     """Creates a development environment for a recipe.
 
@@ -204,8 +251,11 @@ def create(
     this app and use the flag `--overwrite` to re-create from scratch the
     development environment.
     """
+
     import pathlib
 
+    import yaml
+
     recipe_dir = recipe_dir or os.path.join(os.path.realpath("."), "conda")
 
     if not os.path.exists(recipe_dir):
@@ -273,7 +323,16 @@ def create(
     # when creating a local development environment, remove the always_yes option
     del condarc_options["always_yes"]
     conda_create(
-        conda, name, overwrite, condarc_options, deps, dry_run, use_local
+        conda,
+        name,
+        overwrite,
+        condarc_options,
+        deps,
+        dry_run,
+        use_local,
+        use_lockfile=lockfile,
+        refresh_lockfile=refresh_lockfile,
+        use_template=template,
     )
 
     # part 2: pip-install everything listed in pip-extras
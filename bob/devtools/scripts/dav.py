@@ -6,9 +6,6 @@ import re
 import tempfile
 
 import click
-import pkg_resources
-
-from click_plugins import with_plugins
 
 from ..dav import (
     augment_path_with_hash,
@@ -27,8 +24,7 @@ from . import bdt
 logger = get_logger(__name__)
 
 
-@with_plugins(pkg_resources.iter_entry_points("bdt.dav.cli"))
-@click.group(cls=bdt.AliasedGroup)
+@click.group(cls=bdt.AliasedGroup, entry_point_group="bdt.dav.cli")
 def dav():
     """Commands for reading/listing/renaming/copying content to a WebDAV server
 
@@ -19,16 +19,13 @@ def dependencies(env_name, python):
     """Creates an environment with all external bob dependencies."""
     import subprocess
 
-    import pkg_resources
-
     from bob.devtools.build import load_packages_from_conda_build_config
+    from bob.devtools.constants import CONDA_BUILD_CONFIG
 
-    conda_config_path = pkg_resources.resource_filename(
-        "bob.devtools", "data/conda_build_config.yaml"
-    )
+    conda_config_path = CONDA_BUILD_CONFIG
 
     packages, _ = load_packages_from_conda_build_config(
-        conda_config_path, {"channels": []}, with_pins=True
+        conda_config_path, with_pins=True
     )
 
     # ask mamba to create an environment with the packages
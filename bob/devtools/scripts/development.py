@@ -1,7 +1,6 @@
 import click
 
-from click_plugins import with_plugins
-from pkg_resources import iter_entry_points
+from . import bdt
 
 
 @click.command(epilog="See bdt dev --help for examples of this command.")
@@ -22,7 +21,7 @@ def install(env_name, folders):
     pip install -vvv --no-build-isolation --no-dependencies --editable <folder>
 
     inside the specified conda environment"""
-    import subprocess
+    from ..bootstrap import run_cmdline
 
     for folder in folders:
 
@@ -40,12 +39,8 @@ def install(env_name, folders):
             "--editable",
             folder,
         ]
-        cmd = " ".join(cmd)
-        subprocess.check_call(
-            cmd,
-            shell=True,
-        )
-        click.echo(f"Installed package using the command: {cmd}")
+        run_cmdline(cmd)
+        click.echo(f"Installed package using the command: {' '.join(cmd)}")
 
 
 @click.command(epilog="See bdt dev --help for examples of this command.")
@@ -58,7 +53,8 @@ def install(env_name, folders):
 def checkout(ctx, names, use_https, subfolder):
     """git clones a Bob package and installs the pre-commit hook if required."""
     import os
-    import subprocess
+
+    from ..bootstrap import run_cmdline
 
     # create the subfolder directory
     if subfolder:
@@ -78,7 +74,7 @@ def checkout(ctx, names, use_https, subfolder):
             if use_https:
                 url = f"https://gitlab.idiap.ch/bob/{name}.git"
 
-            subprocess.check_call(["git", "clone", url, dest])
+            run_cmdline(["git", "clone", url, dest])
 
             # call pre-commit if its configuration exists
             if os.path.isfile(os.path.join(dest, ".pre-commit-config.yaml")):
@@ -86,8 +82,8 @@ def checkout(ctx, names, use_https, subfolder):
                     "Installing pre-commit hooks. Make sure you have pre-commit installed."
                 )
                 try:
-                    subprocess.check_call(["pre-commit", "install"], cwd=dest)
-                except subprocess.CalledProcessError:
+                    run_cmdline(["pre-commit", "install"], cwd=dest)
+                except (RuntimeError, OSError):
                     click.echo(
                         "pre-commit git hook installation failed. "
                         "Please make sure you have pre-commit installed "
@@ -97,8 +93,9 @@ def checkout(ctx, names, use_https, subfolder):
 
 
 # the group command must be at the end of this file for plugins to work.
-@with_plugins(iter_entry_points("bdt.dev.cli"))
 @click.group(
+    cls=bdt.AliasedGroup,
+    entry_point_group="bdt.dev.cli",
     epilog="""Examples:
 
 \b
@@ -123,7 +120,7 @@ bdt install -n bobnewpackage .
 \b
 # create an environment with all external bob dependencies
 bdt dev dependencies --python 3.9 my_env
-"""
+""",
 )
 def dev():
     """Development scripts"""
@@ -4,8 +4,6 @@
 
 import click
 
-from sphinx.ext import intersphinx
-
 from ..log import get_logger, verbosity_option
 from . import bdt
 
@@ -40,4 +38,7 @@ def dumpsphinx(url):
     This command is useful when you are struggling to do proper links
     from your documentation.
     """
+
+    from sphinx.ext import intersphinx
+
     intersphinx.inspect_main([url])
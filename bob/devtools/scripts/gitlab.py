@@ -1,15 +1,11 @@
 #!/usr/bin/env python
 
 import click
-import pkg_resources
-
-from click_plugins import with_plugins
 
 from . import bdt
 
 
-@with_plugins(pkg_resources.iter_entry_points("bdt.gitlab.cli"))
-@click.group(cls=bdt.AliasedGroup)
+@click.group(cls=bdt.AliasedGroup, entry_point_group="bdt.gitlab.cli")
 def gitlab():
     """Commands for that interact with gitlab.
 
@@ -4,7 +4,6 @@
 import sys
 
 import click
-import yaml
 
 from ..bootstrap import get_channels, set_environment
 from ..build import make_conda_config
@@ -16,7 +15,17 @@ from ..constants import (
     MATPLOTLIB_RCDIR,
     SERVER,
 )
-from ..graph import compute_adjencence_matrix, generate_graph
+from ..graph import (
+    compute_adjencence_matrix,
+    compute_build_order,
+    compute_graph,
+    conda_config_digest,
+    generate_graph,
+    impacted_packages,
+    write_build_order,
+    write_graphml,
+    write_json_graph,
+)
 from ..log import get_logger, verbosity_option
 from ..release import get_gitlab_instance
 from . import bdt
@@ -43,6 +52,35 @@ Examples:
 \b
      $ bdt gitlab graph beat/beat.editor --deptypes=run --deptypes=test --whitelist='^beat\\.(editor|cmdline).*$'
 
+\b
+  4. Calculates the graph of a package and writes all packages it depends on
+     (and the package itself), in build order, to an order file
+
+\b
+     $ bdt gitlab graph bob/bob.bio.base --order=order.txt
+
+\b
+  5. Lists packages, among those bob.bio.base depends on, that need to be
+     rebuilt (in build order) after a change on bob.io.base
+
+\b
+     $ bdt gitlab graph bob/bob.bio.base --impacted-by=bob/bob.io.base
+
+\b
+  6. Exports the complete graph of a package, including non-maintained
+     dependencies, for analysis with other tools (e.g. networkx)
+
+\b
+     $ bdt gitlab graph bob/bob --whitelist='.*' --format=graphml
+
+\b
+  7. Plans the build of all packages of the bob stack on 4 runners, based on
+     historical build durations
+
+\b
+     $ bdt gitlab process-pipelines --record bob/nightlies <pipeline>
+     $ bdt gitlab graph bob/bob --plan=plan.json --runners=4
+
 """
 )
 @click.argument("package", required=True)
@@ -116,7 +154,10 @@ Examples:
     "--format",
     show_default=True,
     default="svg",
-    help="determines the type of output to expect",
+    help="determines the type of output to expect.  Use 'json' or 'graphml' "
+    "to export the graph for analysis, without rendering it (graphviz is not "
+    "required in this case).  Other values are passed to graphviz, for "
+    "rendering",
 )
 @click.option(
     "-w",
@@ -139,6 +180,62 @@ Examples:
     "more types.  Valid types are 'host', 'build', 'run' and 'test'.  An "
     "empty set considers all dependencies to the graph",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    default=0,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Maximum number of package repositories to download concurrently "
+    "while resolving dependencies.  If set to zero, then use a default "
+    "depending on the number of CPUs available",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    show_default=True,
+    help="Caches resolved packages on disk, keyed by the commit their "
+    "reference points to and the conda configuration.  Subsequent runs only "
+    "resolve packages whose reference moved",
+)
+@click.option(
+    "-o",
+    "--order",
+    type=click.File("wt"),
+    help="Also writes all packages (in gitlab) the target package depends on "
+    "in build order, to the given file (use - for the standard output).  "
+    "Packages are organized in levels of packages that can be built "
+    "concurrently.  The output may be used as an order file for nightlies.  "
+    "Only the dependence types selected with --deptypes are considered",
+)
+@click.option(
+    "-i",
+    "--impacted-by",
+    multiple=True,
+    help="Only considers packages impacted by changes on the given package "
+    "(pass multiple times for more packages): the package itself and all "
+    "packages on the graph that depend on it, directly or indirectly.  These "
+    "are written in build order to the file set with --order, or to the "
+    "standard output, if that is not set",
+)
+@click.option(
+    "--plan",
+    type=click.File("wt"),
+    help="Also writes an execution plan for building all packages (in "
+    "gitlab) the target package depends on, in JSON format, to the given "
+    "file (use - for the standard output).  The plan uses historical build "
+    "durations (see ``bdt gitlab process-pipelines --record``) to prioritize "
+    "packages on the critical path, minimizing the total build time given "
+    "the number of runners set with --runners",
+)
+@click.option(
+    "--runners",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of runners available to build packages concurrently, for "
+    "execution plans",
+)
 @verbosity_option()
 @bdt.raise_on_error
 def graph(
@@ -155,6 +252,12 @@ def graph(
     format,
     whitelist,
     deptypes,
+    jobs,
+    cache,
+    order,
+    impacted_by,
+    plan,
+    runners,
 ):
     """
     Computes the dependency graph of a gitlab package (via its conda recipe)
@@ -164,6 +267,8 @@ def graph(
     This command uses the conda-build API to resolve the package dependencies.
     """
 
+    import yaml
+
     if "/" not in package:
         raise RuntimeError('PACKAGE should be specified as "group/name"')
 
@@ -199,6 +304,11 @@ def graph(
     conda_config = make_conda_config(
         config, python, append_file, condarc_options
     )
+    config_digest = None
+    if cache:
+        config_digest = conda_config_digest(
+            config, python, append_file, condarc_options
+        )
 
     set_environment("MATPLOTLIBRC", MATPLOTLIB_RCDIR)
     set_environment("BOBRC", BOBRC_PATH)
@@ -212,8 +322,82 @@ def graph(
     set_environment("PYTEST_ADDOPTS", "")
 
     adj_matrix = compute_adjencence_matrix(
-        gl, package, conda_config, upload_channel, deptypes=deptypes
+        gl,
+        package,
+        conda_config,
+        upload_channel,
+        deptypes=deptypes,
+        jobs=jobs,
+        config_digest=config_digest,
     )
 
+    if impacted_by:
+        levels = impacted_packages(adj_matrix, impacted_by, deptypes=deptypes)
+        write_build_order(levels, order or sys.stdout)
+    elif order is not None:
+        levels = compute_build_order(adj_matrix, deptypes=deptypes)
+        write_build_order(levels, order)
+
+    if plan is not None:
+        _write_plan(adj_matrix, deptypes, runners, plan)
+
+    if format in ("json", "graphml"):
+        nodes, edges = compute_graph(
+            adj_matrix, deptypes=deptypes, whitelist=whitelist
+        )
+        output = "%s.%s" % (name, format)
+        logger.info("Writing graph to %s...", output)
+        if format == "json":
+            with open(output, "wt") as f:
+                write_json_graph(nodes, edges, f)
+        else:
+            with open(output, "wb") as f:
+                write_graphml(nodes, edges, f)
+        return
+
     graph = generate_graph(adj_matrix, deptypes=deptypes, whitelist=whitelist)
     graph.render(name, format=format, cleanup=True)
+
+
+def _write_plan(adj_matrix, deptypes, runners, stream):
+    """Calculates and writes an execution plan for building packages"""
+
+    import json
+
+    from ..graph import package_dependencies
+    from ..pipelines import load_durations
+    from ..schedule import critical_path, estimate_durations, schedule
+
+    dependencies = package_dependencies(adj_matrix, deptypes=deptypes)
+    durations, unknown = estimate_durations(dependencies, load_durations())
+    if unknown:
+        logger.warning(
+            "No build durations recorded for %d package(s) - using estimates "
+            "for: %s",
+            len(unknown),
+            ", ".join(sorted(unknown)),
+        )
+
+    path, length = critical_path(dependencies, durations)
+    jobs, makespan = schedule(dependencies, durations, runners)
+    logger.info(
+        "Critical path (%.1f minutes): %s", length / 60, " -> ".join(path)
+    )
+    logger.info(
+        "Planned build time with %d runner(s): %.1f minutes",
+        runners,
+        makespan / 60,
+    )
+
+    json.dump(
+        dict(
+            runners=runners,
+            makespan=makespan,
+            critical_path=path,
+            critical_path_length=length,
+            estimated=sorted(unknown),
+            jobs=jobs,
+        ),
+        stream,
+        indent=2,
+    )
@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import click
-import gitlab
 
 from ..changelog import get_last_tag, parse_date
 from ..log import echo_normal, echo_warning, get_logger, verbosity_option
@@ -32,6 +31,8 @@ Examples:
 def lasttag(package):
     """Returns the last tag information on a given PACKAGE."""
 
+    import gitlab
+
     if "/" not in package:
         raise RuntimeError('PACKAGE should be specified as "group/name"')
 
@@ -4,10 +4,6 @@ import os
 import sys
 
 import click
-import gitlab
-import pkg_resources
-
-from click_plugins import with_plugins
 
 from ..log import get_logger, verbosity_option
 from . import bdt, ci
@@ -18,6 +14,9 @@ logger = get_logger(__name__)
 def set_up_environment_variables(python, name_space, project_dir):
     """This function sets up the proper environment variables when user wants
     to run the commands usually run on ci locally."""
+
+    import gitlab
+
     project_dir = os.path.abspath(project_dir)
     project_name = os.path.basename(project_dir)
     gl = gitlab.Gitlab.from_config("idiap")
@@ -35,13 +34,13 @@ def set_up_environment_variables(python, name_space, project_dir):
     os.environ["CI_JOB_TOKEN"] = gl.private_token
     os.environ["CI_PROJECT_DIR"] = project_dir
     os.environ["CI_PROJECT_NAMESPACE"] = name_space
+    os.environ["CI_PROJECT_PATH"] = package_name
     os.environ["CI_PROJECT_VISIBILITY"] = project_visibility
     if python:
         os.environ["PYTHON_VERSION"] = python
 
 
-@with_plugins(pkg_resources.iter_entry_points("bdt.local.cli"))
-@click.group(cls=bdt.AliasedGroup)
+@click.group(cls=bdt.AliasedGroup, entry_point_group="bdt.local.cli")
 def local():
     """Commands for building packages and handling certain activities locally
     it requires a proper set up for ~/.python-gitlab.cfg.
@@ -7,7 +7,6 @@ import os
 import tempfile
 
 import click
-import conda_build.api
 
 from ..log import echo_info, echo_warning, get_logger, verbosity_option
 from ..mirror import (
@@ -156,6 +155,8 @@ def mirror(
     available on the channel, and only downloading the missing files.
     """
 
+    import conda_build.api
+
     # creates a self destructing temporary directory that will act as temporary
     # directory for the rest of this program
     tmpdir2 = tempfile.TemporaryDirectory(prefix="bdt-mirror-tmp", dir=tmpdir)
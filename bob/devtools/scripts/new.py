@@ -5,8 +5,6 @@ import os
 import shutil
 
 import click
-import jinja2
-import pkg_resources
 
 from ..log import get_logger, verbosity_option
 from . import bdt
@@ -23,8 +21,8 @@ def copy_file(template, output_dir):
       output_dir: Where to save the output
     """
 
-    template_file = pkg_resources.resource_filename(
-        __name__, os.path.join("..", "templates", template)
+    template_file = os.path.join(
+        os.path.dirname(__file__), "..", "templates", template
     )
     output_file = os.path.join(output_dir, template)
 
@@ -101,6 +99,8 @@ Examples:
 def new(package, author, email, title, license, output_dir):
     """Creates a folder structure for a new Bob/BEAT package."""
 
+    import jinja2
+
     if "/" not in package:
         raise RuntimeError('PACKAGE should be specified as "group/name"')
 
@@ -180,9 +180,7 @@ def new(package, author, email, title, license, output_dir):
         render_template(env, "LICENSE", context, output_dir)
 
     # creates the base python module structure
-    template_dir = pkg_resources.resource_filename(
-        __name__, os.path.join("..", "templates")
-    )
+    template_dir = os.path.join(os.path.dirname(__file__), "..", "templates")
     logger.info("Creating base %s python module", group)
     shutil.copytree(
         os.path.join(template_dir, "pkg"), os.path.join(output_dir, group)
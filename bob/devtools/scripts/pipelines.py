@@ -3,12 +3,14 @@
 import urllib
 
 import click
-import gitlab
-
-from tabulate import tabulate
 
 from ..log import echo_warning, get_logger, verbosity_option
-from ..pipelines import process_log
+from ..pipelines import (
+    concurrent_jobs,
+    job_log_artifact,
+    process_log,
+    record_durations,
+)
 from ..release import get_gitlab_instance
 from . import bdt
 
@@ -27,16 +29,28 @@ Examples:
 
      $ bdt gitlab process-pipelines bob/nightlies pipelines --job-id xxx
 
+  3. Records build durations of packages on a pipeline, for planning builds
+
+     $ bdt gitlab process-pipelines --record bob/nightlies pipelines
+
 """
 )
 @click.argument("package")
 @click.argument("pipeline")
 @click.option("--job-id", default=None, help="A job id from a pipeline")
+@click.option(
+    "--record/--no-record",
+    default=False,
+    help="Records package build durations found on job logs, for planning "
+    "future builds (see ``bdt gitlab graph --plan``)",
+)
 @verbosity_option()
 @bdt.raise_on_error
-def process_pipelines(package, pipeline, job_id):
+def process_pipelines(package, pipeline, job_id, record):
     """Returns the last tag information on a given PACKAGE."""
 
+    import gitlab
+
     if "/" not in package:
         raise RuntimeError('PACKAGE should be specified as "group/name"')
 
@@ -67,7 +81,19 @@ def process_pipelines(package, pipeline, job_id):
                 )
                 web_url = j.attributes["web_url"] + "/raw"
                 log = str(urllib.request.urlopen(web_url).read()).split("\\n")
-                process_log(log)
+                # logs of packages built concurrently are kept as artifacts
+                job_logs = {}
+                for k in concurrent_jobs(log):
+                    job = project.jobs.get(j.id, lazy=True)
+                    try:
+                        data = job.artifact(job_log_artifact(k))
+                    except gitlab.GitlabGetError:
+                        logger.warning("No job log for %s on artifacts", k)
+                        continue
+                    job_logs[k] = data.decode(errors="replace").split("\n")
+                durations = process_log(log, job_logs)
+                if record:
+                    record_durations(durations)
         except urllib.error.HTTPError:
             logger.warn(
                 "Gitlab access error - Log %s can't be found" % web_url,
@@ -109,6 +135,10 @@ Examples:
 def get_pipelines(package):
     """Returns the CI pipelines given a given PACKAGE."""
 
+    import gitlab
+
+    from tabulate import tabulate
+
     if "/" not in package:
         raise RuntimeError('PACKAGE should be specified as "group/name"')
 
@@ -6,20 +6,24 @@ import sys
 import urllib.request
 
 import click
-import conda_build.api
-import yaml
 
-from ..bootstrap import get_channels, set_environment
+from ..bootstrap import get_channels, set_environment, span
 from ..build import (
+    compiler_cache,
     conda_arch,
+    get_build_key,
     get_docserver_setup,
     get_env_directory,
     get_output_path,
+    get_package_build_key,
     get_parsed_recipe,
     get_rendered_metadata,
+    get_tested_build_key,
     make_conda_config,
     next_build_number,
+    record_tested_build_key,
     root_logger_protection,
+    set_build_key,
     should_skip_build,
 )
 from ..constants import (
@@ -139,6 +143,16 @@ Examples:
     "It forwards all settings to ``nosetests`` via --eval-attr=<settings>``"
     " and ``pytest`` via -m=<settings>.",
 )
+@click.option(
+    "--compiler-cache",
+    "compiler_cache_tool",
+    envvar="BDT_COMPILER_CACHE",
+    type=click.Choice(["ccache", "sccache"]),
+    default=None,
+    help="Use a compiler cache (ccache or sccache, which must be installed "
+    "on the current environment) for compiled code.  The cache is kept under "
+    "the bdt cache directory, so it is re-used by subsequent builds",
+)
 @verbosity_option()
 @bdt.raise_on_error
 def rebuild(
@@ -154,6 +168,7 @@ def rebuild(
     dry_run,
     ci,
     test_mark_expr,
+    compiler_cache_tool,
 ):
     """Tests and rebuilds packages through conda-build with stock
     configuration.
@@ -161,11 +176,20 @@ def rebuild(
     This command wraps the execution of conda-build in two stages:
     first, from the original package recipe and some channel look-ups,
     it figures out what is the lastest version of the package available.
-    It downloads such file and runs a test.  If the test suceeds, then
-    it proceeds to the next recipe. Otherwise, it rebuilds the package
-    and uploads a new version to the channel.
+    It downloads such file and compares the build key recorded on it (a hash
+    of the rendered recipe, including the exact build and host dependencies,
+    and of the source tree) with the one of the current recipe.  If those
+    match, the package is up-to-date and it proceeds to the next recipe.
+    Otherwise, it runs a test.  If the test suceeds, then it records the
+    build key on the bdt cache (so the package is not tested again while
+    the build key does not change) and proceeds to the next recipe.
+    Otherwise, it rebuilds the package and uploads a new
+    version to the channel.
     """
 
+    import conda_build.api
+    import yaml
+
     # if we are in a dry-run mode, let's let it be known
     if dry_run:
         logger.warn("!!!! DRY RUN MODE !!!!")
@@ -210,123 +234,191 @@ def rebuild(
     prefix = get_env_directory(os.environ["CONDA_EXE"], "base")
     condarc_options["croot"] = os.path.join(prefix, "conda-bld")
 
-    conda_config = make_conda_config(
-        config, python, append_file, condarc_options
-    )
+    with compiler_cache(
+        compiler_cache_tool, append_file, condarc_options["croot"]
+    ) as append_file:
 
-    set_environment("MATPLOTLIBRC", MATPLOTLIB_RCDIR)
-    set_environment("BOBRC", BOBRC_PATH)
+        conda_config = make_conda_config(
+            config, python, append_file, condarc_options
+        )
 
-    # setup BOB_DOCUMENTATION_SERVER environment variable (used for bob.extension
-    # and derived documentation building via Sphinx)
-    doc_urls = get_docserver_setup(
-        public=(not private),
-        stable=stable,
-        server=server,
-        intranet=ci,
-        group=group,
-    )
-    set_environment("BOB_DOCUMENTATION_SERVER", doc_urls)
+        set_environment("MATPLOTLIBRC", MATPLOTLIB_RCDIR)
+        set_environment("BOBRC", BOBRC_PATH)
+
+        # setup BOB_DOCUMENTATION_SERVER environment variable (used for bob.extension
+        # and derived documentation building via Sphinx)
+        doc_urls = get_docserver_setup(
+            public=(not private),
+            stable=stable,
+            server=server,
+            intranet=ci,
+            group=group,
+        )
+        set_environment("BOB_DOCUMENTATION_SERVER", doc_urls)
 
-    # this is for testing and may limit which tests run
-    set_environment("NOSE_EVAL_ATTR", test_mark_expr)
-    set_environment("PYTEST_ADDOPTS", f"-m '{test_mark_expr}'")
+        # this is for testing and may limit which tests run
+        set_environment("NOSE_EVAL_ATTR", test_mark_expr)
+        set_environment("PYTEST_ADDOPTS", f"-m '{test_mark_expr}'")
 
-    arch = conda_arch()
+        arch = conda_arch()
 
-    for d in recipe_dir:
+        for d in recipe_dir:
 
-        if not os.path.exists(d):
-            raise RuntimeError("The directory %s does not exist" % recipe_dir)
+            if not os.path.exists(d):
+                raise RuntimeError(
+                    "The directory %s does not exist" % recipe_dir
+                )
 
-        version_candidate = os.path.join(d, "..", "version.txt")
-        if os.path.exists(version_candidate):
-            version = open(version_candidate).read().rstrip()
-            set_environment("BOB_PACKAGE_VERSION", version)
+            version_candidate = os.path.join(d, "..", "version.txt")
+            if os.path.exists(version_candidate):
+                version = open(version_candidate).read().rstrip()
+                set_environment("BOB_PACKAGE_VERSION", version)
 
-        # pre-renders the recipe - figures out the destination
-        metadata = get_rendered_metadata(d, conda_config)
+            # pre-renders the recipe - figures out the destination
+            with span("render", recipe=d, python=python):
+                metadata = get_rendered_metadata(d, conda_config)
 
-        # checks if we should actually build this recipe
-        if should_skip_build(metadata):
-            logger.info(
-                "Skipping UNSUPPORTED build of %s for %s", recipe_dir, arch
-            )
-            continue
+            # checks if we should actually build this recipe
+            if should_skip_build(metadata):
+                logger.info(
+                    "Skipping UNSUPPORTED build of %s for %s", recipe_dir, arch
+                )
+                continue
 
-        rendered_recipe = get_parsed_recipe(metadata)
+            rendered_recipe = get_parsed_recipe(metadata)
+            build_key = get_build_key(d, metadata)
+            logger.info("Build key for %s: %s", d, build_key)
 
-        path = get_output_path(metadata, conda_config)[0]
+            path = get_output_path(metadata, conda_config)[0]
 
-        # Get the latest build number
-        build_number, existing = next_build_number(
-            upload_channel, os.path.basename(path)
-        )
+            # Get the latest build number
+            with span("channel", recipe=d, python=python):
+                build_number, existing = next_build_number(
+                    upload_channel, os.path.basename(path)
+                )
 
-        should_build = True
-
-        if (
-            existing
-        ):  # other builds exist, get the latest and see if it still works
-
-            destpath = os.path.join(
-                condarc_options["croot"], arch, os.path.basename(existing[0])
-            )
-            if not os.path.exists(os.path.dirname(destpath)):
-                os.makedirs(os.path.dirname(destpath))
-            src = upload_channel + existing[0]
-            logger.info("Downloading %s -> %s", src, destpath)
-            urllib.request.urlretrieve(src, destpath)
-
-            # conda_build may either raise an exception or return ``False`` in
-            # case the build fails, depending on the reason.  This bit of code
-            # tries to accomodate both code paths and decides if we should
-            # rebuild the package or not
-            logger.info("Testing %s", src)
-            try:
-                with root_logger_protection():
-                    result = conda_build.api.test(destpath, config=conda_config)
-                should_build = not result
-            except Exception as error:
-                logger.exception(error)
-                logger.error(
-                    "conda_build.api.test() threw an unknown exception - "
-                    "looks like bad programming, but not on our side this time..."
+            should_build = True
+
+            if existing:
+                # other builds exist, get the latest and see if it still works
+                destpath = os.path.join(
+                    condarc_options["croot"],
+                    arch,
+                    os.path.basename(existing[0]),
                 )
 
-            if should_build:
-                logger.warn("Test for %s: FAILED. Building...", src)
-            else:
-                logger.info("Test for %s: SUCCESS (package is up-to-date)", src)
-
-        if should_build:  # something wrong happened, run a full build
-
-            logger.info(
-                "Re-building %s-%s-py%s (build: %d) for %s",
-                rendered_recipe["package"]["name"],
-                rendered_recipe["package"]["version"],
-                python.replace(".", ""),
-                build_number,
-                arch,
-            )
-
-            if not dry_run:
-                # set $BOB_BUILD_NUMBER and force conda_build to reparse recipe to get it
-                # right
-                set_environment("BOB_BUILD_NUMBER", str(build_number))
-                paths = conda_build.api.build(
-                    d, config=conda_config, notest=False
+                def _test(path):
+                    with root_logger_protection(), span("test", package=path):
+                        return conda_build.api.test(path, config=conda_config)
+
+                should_build = not _is_up_to_date(
+                    upload_channel + existing[0], destpath, build_key, _test
+                )
+
+            if should_build:  # something wrong happened, run a full build
+
+                logger.info(
+                    "Re-building %s-%s-py%s (build: %d) for %s",
+                    rendered_recipe["package"]["name"],
+                    rendered_recipe["package"]["version"],
+                    python.replace(".", ""),
+                    build_number,
+                    arch,
                 )
-                # if you get to this point, the package was successfully rebuilt
-                # set environment to signal caller we may dispose of it
-                os.environ["BDT_BUILD"] = ":".join(paths)
-
-        else:  # skip build, test worked
-            logger.info(
-                "Skipping rebuild of %s-%s-py%s (build: %d) for %s",
-                rendered_recipe["package"]["name"],
-                rendered_recipe["package"]["version"],
-                python.replace(".", ""),
-                build_number,
-                arch,
-            )
+
+                if not dry_run:
+                    # set $BOB_BUILD_NUMBER and force conda_build to reparse recipe to get it
+                    # right
+                    set_environment("BOB_BUILD_NUMBER", str(build_number))
+                    set_build_key(conda_config, build_key)
+                    with span("build", recipe=d, python=python):
+                        paths = conda_build.api.build(
+                            d, config=conda_config, notest=False
+                        )
+                    # if you get to this point, the package was successfully rebuilt
+                    # set environment to signal caller we may dispose of it
+                    os.environ["BDT_BUILD"] = ":".join(paths)
+
+            else:  # skip build, test worked
+                logger.info(
+                    "Skipping rebuild of %s-%s-py%s (build: %d) for %s",
+                    rendered_recipe["package"]["name"],
+                    rendered_recipe["package"]["version"],
+                    python.replace(".", ""),
+                    build_number,
+                    arch,
+                )
+
+
+def _is_up_to_date(url, destpath, build_key, test):
+    """Checks if an existing package is up-to-date with the current recipe
+
+    The package is up-to-date if the build key recorded on it (or recorded
+    after it was successfully tested with a previous build key) matches the
+    current one.  Otherwise, the package is downloaded and tested.  If the
+    test succeeds, the current build key is recorded for the package, so it
+    is not tested again until the build key changes.
+
+
+    Args:
+
+      url: The URL of the existing package, on the upload channel
+      destpath: Where to download the existing package to
+      build_key: The build key of the current recipe
+      test: A callable that tests the package at a given path, returning
+        ``True`` if the test succeeds
+
+
+    Returns: ``True`` if the existing package is up-to-date, ``False`` if it
+    should be re-built
+    """
+
+    basename = os.path.basename(url)
+    if get_tested_build_key(basename) == build_key:
+        logger.info(
+            "Build key for %s matches (%s) a successful test - package is "
+            "up-to-date",
+            url,
+            build_key,
+        )
+        return True
+
+    os.makedirs(os.path.dirname(destpath), exist_ok=True)
+    logger.info("Downloading %s -> %s", url, destpath)
+    urllib.request.urlretrieve(url, destpath)
+
+    # if the build key recorded on the existing package matches ours,
+    # then re-building would produce the same package: skip the test
+    existing_key = get_package_build_key(destpath)
+    if existing_key == build_key:
+        logger.info(
+            "Build key for %s matches (%s) - package is up-to-date",
+            url,
+            build_key,
+        )
+        return True
+
+    # conda_build may either raise an exception or return ``False`` in
+    # case the build fails, depending on the reason.  This bit of code
+    # tries to accomodate both code paths and decides if we should
+    # rebuild the package or not
+    logger.info(
+        "Build key for %s changed (was: %s) - testing...", url, existing_key
+    )
+    result = False
+    try:
+        result = test(destpath)
+    except Exception as error:
+        logger.exception(error)
+        logger.error(
+            "conda_build.api.test() threw an unknown exception - "
+            "looks like bad programming, but not on our side this time..."
+        )
+
+    if not result:
+        logger.warning("Test for %s: FAILED. Building...", url)
+        return False
+
+    logger.info("Test for %s: SUCCESS (package is up-to-date)", url)
+    record_tested_build_key(basename, build_key)
+    return True
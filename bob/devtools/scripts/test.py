@@ -4,10 +4,8 @@
 import os
 
 import click
-import conda_build.api
-import yaml
 
-from ..bootstrap import set_environment
+from ..bootstrap import set_environment, span
 from ..build import (
     conda_arch,
     get_docserver_setup,
@@ -149,6 +147,9 @@ def test(
     anaconda-upload``.
     """
 
+    import conda_build.api
+    import yaml
+
     # if we are in a dry-run mode, let's let it be known
     if dry_run:
         logger.warn("!!!! DRY RUN MODE !!!!")
@@ -213,5 +214,5 @@ def test(
     for p in package:
         logger.info("Testing %s at %s", p, arch)
         if not dry_run:
-            with root_logger_protection():
+            with root_logger_protection(), span("test", package=p):
                 conda_build.api.test(p, config=conda_config)
@@ -26,7 +26,7 @@ def update_pins(manual_pins, python):
     pip_constraints_path = "bob/devtools/data/pip-constraints.txt"
 
     packages, package_names_map = load_packages_from_conda_build_config(
-        conda_config_path, {"channels": []}
+        conda_config_path
     )
     reversed_package_names_map = {v: k for k, v in package_names_map.items()}
 
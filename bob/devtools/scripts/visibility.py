@@ -3,7 +3,6 @@
 import os
 
 import click
-import gitlab
 
 from ..log import echo_normal, echo_warning, get_logger, verbosity_option
 from ..release import get_gitlab_instance
@@ -49,6 +48,8 @@ def visibility(target, group):
     private to the current user, it says 'unknown' instead.
     """
 
+    import gitlab
+
     gl = get_gitlab_instance()
 
     # reads package list or considers name to be a package name
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import logging
 import os
 import time
 
@@ -237,3 +238,66 @@ if os.path.exists(sphinx_requirements):
     )
 else:
     intersphinx_mapping = link_documentation()
+
+
+def cached_intersphinx_mapping(mapping):
+    """Points intersphinx to local copies of (remote) inventories
+
+    Inventories are kept on the directory set on ``BDT_INTERSPHINX_CACHE``
+    (e.g. by ``bdt ci docs``, with the same layout as
+    :py:func:`bob.devtools.docs.cached_inventory`), and are downloaded again
+    after ``BDT_INTERSPHINX_TTL`` seconds (default: a day).  Entries are left
+    untouched if the environment variable is not set, or their inventory
+    cannot be cached.
+    """
+
+    import hashlib
+    import json
+    import urllib.request
+
+    cache_dir = os.environ.get("BDT_INTERSPHINX_CACHE")
+    if not cache_dir:
+        return mapping
+    ttl = float(os.environ.get("BDT_INTERSPHINX_TTL", 24 * 60 * 60))
+
+    retval = {}
+    for name, value in mapping.items():
+        if isinstance(value, (tuple, list)):
+            uri, inventory = value
+        else:  # old format: {uri: inventory}
+            uri, inventory = name, value
+        retval[name] = (uri, inventory)
+        if inventory is not None:
+            continue
+
+        url = uri.rstrip("/") + "/objects.inv"
+        base = os.path.join(cache_dir, hashlib.sha256(url.encode()).hexdigest())
+        path, meta_path = base + ".inv", base + ".json"
+        try:
+            meta = {}
+            if os.path.exists(path) and os.path.exists(meta_path):
+                with open(meta_path, "rt") as f:
+                    meta = json.load(f)
+            if time.time() - meta.get("checked", 0) >= ttl:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = "%s.%d.tmp" % (path, os.getpid())
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    with open(tmp, "wb") as f:
+                        f.write(response.read())
+                os.replace(tmp, path)
+                tmp = "%s.%d.tmp" % (meta_path, os.getpid())
+                with open(tmp, "wt") as f:
+                    json.dump(dict(url=url, checked=time.time()), f)
+                os.replace(tmp, meta_path)
+        except Exception as e:
+            # e.g. offline or read-only cache: use a stale copy or the remote
+            logging.getLogger(__name__).warning(
+                "Cannot cache intersphinx inventory %s: %s", url, e
+            )
+        if os.path.exists(path):
+            retval[name] = (uri, path)
+
+    return retval
+
+
+intersphinx_mapping = cached_intersphinx_mapping(intersphinx_mapping)
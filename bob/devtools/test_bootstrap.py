@@ -1,6 +1,20 @@
 #!/usr/bin/env python
 
-from .bootstrap import get_channels
+import gzip
+import json
+import sys
+import time
+
+import pytest
+
+from .bootstrap import (
+    add_spans,
+    get_channels,
+    run_cmdline,
+    span,
+    take_spans,
+    write_timing_report,
+)
 
 
 def test_get_channels():
@@ -74,3 +88,115 @@ def test_get_channels():
         f"{server}/private/conda",
     ]
     assert upload_channel == channels[1]
+
+
+def test_timing_report(tmp_path):
+    report = tmp_path / "timings.json"
+
+    with span("render", recipe="conda"):
+        pass
+    try:
+        with span("build", recipe="conda"):
+            raise RuntimeError("failed")
+    except RuntimeError:
+        pass
+    write_timing_report(str(report), "bdt build")
+
+    with span("render", recipe="conda"):
+        pass
+    write_timing_report(str(report), "bdt test")
+
+    data = json.load(open(report))
+    assert [k["command"] for k in data["runs"]] == ["bdt build", "bdt test"]
+    spans = data["runs"][0]["spans"]
+    assert [(k["name"], k["status"]) for k in spans] == [
+        ("render", "ok"),
+        ("build", "error"),
+    ]
+    assert sorted(data["phases"]) == ["build", "render"]
+
+
+def test_run_cmdline(tmp_path, capfd):
+    log_file = str(tmp_path / "output.log.gz")
+    script = "import sys\nfor k in range(100): print(k)\nsys.exit(%d)"
+
+    run_cmdline([sys.executable, "-c", script % 0], log_file=log_file)
+    assert capfd.readouterr().out.split() == [str(k) for k in range(100)]
+
+    with pytest.raises(RuntimeError) as exc:
+        run_cmdline(
+            [sys.executable, "-c", script % 1],
+            log_file=log_file,
+            timestamps=True,
+            tail=3,
+        )
+    assert str(exc.value).endswith("output:\n97\n98\n99")
+    output = capfd.readouterr().out.splitlines()
+    assert len(output) == 100
+    assert all(
+        k.startswith("[") and k.endswith("s] %d" % i)
+        for i, k in enumerate(output)
+    )
+
+    # both runs are appended to the compressed log
+    with gzip.open(log_file, "rt") as f:
+        assert len(f.read().splitlines()) == 200
+
+
+def test_forward_spans(tmp_path):
+    report = tmp_path / "timings.json"
+
+    with span("build", recipe="conda", python="3.10"):
+        pass
+    forwarded = take_spans()
+    assert [k["python"] for k in forwarded] == ["3.10"]
+    assert take_spans() == []
+
+    with span("render", recipe="conda"):
+        pass
+    add_spans(forwarded)
+    write_timing_report(str(report), "bdt build")
+
+    data = json.load(open(report))
+    spans = data["runs"][0]["spans"]
+    assert [k["name"] for k in spans] == ["render", "build"]
+
+
+def test_nested_spans(tmp_path):
+    report = tmp_path / "timings.json"
+
+    with span("build", recipe="conda") as build:
+        with span("test", recipe="conda"):
+            time.sleep(0.05)
+        add_spans(
+            [dict(name="variant", id="1-0", parent=None, start=0, duration=0.1)]
+        )
+    write_timing_report(str(report), "bdt build")
+
+    data = json.load(open(report))
+    spans = dict((k["name"], k) for k in data["runs"][0]["spans"])
+    assert spans["test"]["parent"] == build["id"]
+    assert spans["variant"]["parent"] == build["id"]
+
+    # time of nested phases is only counted once
+    phases = data["phases"]
+    assert phases["test"] >= 0.05
+    assert phases["variant"] == 0.1
+    assert phases["build"] == 0.0  # children took longer than the parent
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_output_forwarder(tmp_path, capfd):
+    from .bootstrap import _OutputForwarder
+
+    log = tmp_path / "output.log.gz"
+    forwarder = _OutputForwarder(str(log))
+    assert forwarder.queue.maxsize > 0  # blocks writers, instead of growing
+    forwarder.start()
+    for k in range(1000):  # more chunks than the queue holds
+        forwarder.write(b"%d\n" % k)
+    forwarder.close()
+
+    expected = "".join("%d\n" % k for k in range(1000))
+    assert capfd.readouterr().out == expected
+    assert gzip.open(log).read().decode() == expected
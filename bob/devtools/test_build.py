@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+
+import json
+import os
+import re
+import sys
+
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+from . import build
+from .build import (
+    _closest_template,
+    _environment_metadata,
+    _source_tree_digest,
+    compiler_cache,
+    find_on_channel,
+    get_env_directory,
+    load_conda_build_config_pins,
+    load_packages_from_conda_build_config,
+)
+from .constants import CONDA_BUILD_CONFIG
+
+
+def test_get_env_directory(tmp_path, monkeypatch):
+    root = tmp_path / "miniconda"
+    for k in ("conda-meta", "bin", "envs/bdt/conda-meta", "envs/broken"):
+        (root / k).mkdir(parents=True)
+    conda = root / "bin" / "conda"
+    conda.touch()
+
+    other = tmp_path / "elsewhere" / "custom"
+    (other / "conda-meta").mkdir(parents=True)
+    (tmp_path / "home" / ".conda").mkdir(parents=True)
+    (tmp_path / "home" / ".conda" / "environments.txt").write_text(
+        "%s\n" % other
+    )
+
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.delenv("CONDA_ENVS_PATH", raising=False)
+    monkeypatch.delenv("CONDA_ENVS_DIRS", raising=False)
+
+    def _no_conda(*args, **kwargs):
+        raise AssertionError("conda should not be executed")
+
+    monkeypatch.setattr("subprocess.check_output", _no_conda)
+
+    assert get_env_directory(str(conda), "base") == str(root)
+    assert get_env_directory(str(conda), "bdt") == os.path.join(
+        str(root), "envs", "bdt"
+    )
+    assert get_env_directory(str(conda), "custom") == str(other)
+
+
+def test_closest_template(tmp_path):
+    channels = ["conda-forge"]
+
+    def _template(name, packages, channels=channels):
+        (tmp_path / name / "conda-meta").mkdir(parents=True)
+        with open(tmp_path / ("%s.json" % name), "wt") as f:
+            json.dump(_environment_metadata(packages, channels), f)
+        return str(tmp_path / name)
+
+    assert _closest_template(str(tmp_path), ["python=3.10"], channels) is None
+
+    _template("py39", ["python=3.9", "numpy=1.23"])
+    _template("other-channels", ["python=3.10", "numpy=1.23"], ["defaults"])
+    small = _template("small", ["python=3.10", "scipy=1.9"])
+    large = _template("large", ["python=3.10", "numpy=1.23", "scipy=1.9"])
+
+    packages = ["python=3.10", "numpy=1.23", "scipy=1.9", "click"]
+    assert _closest_template(str(tmp_path), packages, channels) == large
+    # same number of shared packages: the one with less extras is chosen
+    os.utime(small + ".json", (1, 1))
+    packages = ["python=3.10", "scipy=1.9"]
+    assert _closest_template(str(tmp_path), packages, channels) == small
+
+    # unfinished templates (without metadata) are never chosen
+    os.unlink(large + ".json")
+    packages = ["python=3.10", "numpy=1.23", "scipy=1.9", "click"]
+    assert _closest_template(str(tmp_path), packages, channels) == small
+    packages = ["python=3.11", "scipy=1.9"]
+    assert _closest_template(str(tmp_path), packages, channels) is None
+
+
+_FAKE_CONDA = """#!%s
+import json, os, shutil, sys
+
+args = sys.argv[1:]
+with open(sys.argv[0] + ".log", "a") as f:
+    f.write(json.dumps(args) + "\\n")
+prefix = args[args.index("--prefix") + 1]
+specs = [k for k in args[1:] if "=" in k and not k.startswith("-")]
+records = [dict(zip(("name", "version", "build"), k.replace("==", "=").split("=") + ["0"])) for k in specs]
+if "broken=1" in specs:
+    sys.exit(1)
+if "--dry-run" in args:
+    link = [dict(name=k["name"], version=k["version"], build_string=k["build"]) for k in records]
+    print(json.dumps(dict(actions=dict(LINK=link))))
+elif "--clone" in args:
+    shutil.copytree(args[args.index("--clone") + 1], prefix)
+elif args[0] == "remove":
+    for k in args[args.index(prefix) + 1:]:
+        os.unlink(os.path.join(prefix, "conda-meta", k + ".json"))
+else:
+    os.makedirs(os.path.join(prefix, "conda-meta"), exist_ok=True)
+    for k in records:
+        with open(os.path.join(prefix, "conda-meta", k["name"] + ".json"), "w") as f:
+            json.dump(k, f)
+"""
+
+
+def test_get_template(tmp_path, monkeypatch):
+    conda = tmp_path / "conda"
+    conda.write_text(_FAKE_CONDA % sys.executable)
+    conda.chmod(0o755)
+    monkeypatch.setattr("bob.devtools.constants.CACHE_DIR", str(tmp_path))
+    channels = ["conda-forge"]
+
+    def _get(specs):
+        return build._get_template(str(conda), channels, specs, None, False)
+
+    small = _get(["python=3.10", "scipy=1.9"])
+    assert build._template_ready(small)
+
+    # created from the closest template, without its extra packages
+    prefix = _get(["python=3.10", "numpy=1.23"])
+    assert prefix != small
+    assert build._installed_packages(prefix) == {
+        "python": ("3.10", "0"),
+        "numpy": ("1.23", "0"),
+    }
+    # only the missing packages are installed, as solved
+    calls = [json.loads(k) for k in open(str(conda) + ".log")]
+    assert calls[-1][0] == "install"
+    assert "--no-deps" in calls[-1]
+    assert calls[-1][-1] == "numpy==1.23=0"
+    assert not [k for k in calls[-1] if k.startswith("python")]
+    assert _get(["python=3.10", "numpy=1.23"]) == prefix
+
+    # incomplete templates are removed, and never reused
+    with pytest.raises(RuntimeError):
+        _get(["python=3.10", "broken=1"])
+    broken = build._environment_digest(["python=3.10", "broken=1"], channels)
+    assert not (tmp_path / "templates" / broken).exists()
+    assert not (tmp_path / "templates" / (broken + ".json")).exists()
+
+
+def test_load_pins(tmp_path):
+    pins, names_map = load_conda_build_config_pins(CONDA_BUILD_CONFIG)
+    assert "numpy" in pins
+    assert names_map["click_plugins"] == "click-plugins"
+    packages, _ = load_packages_from_conda_build_config(
+        CONDA_BUILD_CONFIG, with_pins=True
+    )
+    assert "numpy=%s" % pins["numpy"] in packages
+
+    config = tmp_path / "conda_build_config.yaml"
+    config.write_text(
+        """# AUTOMATIC PARSING START
+package_names_map:
+  foo_bar: foo-bar
+foo_bar:
+  - "1.0 cuda*"  # [linux]
+  - "1.0"  # [osx]
+"""
+    )
+    pins, _ = load_conda_build_config_pins(str(config))
+    assert pins == {
+        "foo_bar": "1.0 cuda*"
+        if build.conda_arch().startswith("linux")
+        else "1.0"
+    }
+    assert os.path.realpath(str(config)) in [k[0] for k in build._PINS_CACHE]
+
+
+def test_source_tree_digest(tmp_path):
+    (tmp_path / "conda").mkdir()
+    (tmp_path / "conda" / "meta.yaml").write_text("package: {}")
+    (tmp_path / "setup.py").write_text("setup()")
+
+    digest = _source_tree_digest(str(tmp_path))
+    assert digest == _source_tree_digest(str(tmp_path))
+
+    (tmp_path / ".hidden").mkdir()
+    (tmp_path / ".hidden" / "ignored").write_text("ignored")
+    assert digest == _source_tree_digest(str(tmp_path))
+
+    (tmp_path / "setup.py").write_text("setup(name='changed')")
+    assert digest != _source_tree_digest(str(tmp_path))
+
+
+def test_compiler_cache(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    ccache = bindir / "ccache"
+    ccache.write_text('#!/bin/sh\necho "$@" >> %s\n' % (tmp_path / "calls"))
+    ccache.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bindir), prepend=os.pathsep)
+    monkeypatch.setattr("bob.devtools.constants.CACHE_DIR", str(tmp_path))
+    for k in ("CC", "CXX", "BDT_COMPILER_LAUNCHER"):
+        monkeypatch.delenv(k, raising=False)
+
+    append_file = tmp_path / "recipe_append.yaml"
+    append_file.write_text("about:\n  home: https://www.idiap.ch\n")
+
+    with compiler_cache(None, str(append_file), "croot") as path:
+        assert path == str(append_file)
+
+    monkeypatch.setenv("CCACHE_DIR", "previous")
+    # compilers depend on the platform
+    monkeypatch.setattr("platform.system", lambda: "Linux")
+    monkeypatch.setattr("platform.machine", lambda: "x86_64")
+    with compiler_cache("ccache", str(append_file), "croot") as path:
+        assert os.environ["CCACHE_DIR"] == str(tmp_path / "ccache")
+        assert os.environ["CC"] == "%s x86_64-conda-linux-gnu-cc" % ccache
+        assert os.environ["CXX"] == "%s x86_64-conda-linux-gnu-c++" % ccache
+        contents = open(path).read()
+        assert contents.startswith(append_file.read_text())
+        for k in ("CC", "CXX", "CCACHE_DIR", "BDT_COMPILER_LAUNCHER"):
+            assert "    - %s\n" % k in contents
+
+    assert not os.path.exists(path)
+    # the environment is restored
+    assert os.environ["CCACHE_DIR"] == "previous"
+    assert "CC" not in os.environ
+    calls = (tmp_path / "calls").read_text().split()
+    assert calls == ["--zero-stats", "--show-stats"]
+
+
+def test_find_on_channel(monkeypatch):
+    Dist = namedtuple("Dist", "name version build_string build_number")
+    channel = "https://example.com/conda"
+    index = {}
+    for k, filename in enumerate(
+        (
+            "linux-64/foo-1.0-py39h1234567_0.tar.bz2",
+            "linux-64/foo-1.0-py39h7654321_1.tar.bz2",
+            "noarch/bar-2.0-py_0.conda",
+        )
+    ):
+        basename = re.sub(
+            r"\.(tar\.bz2|conda)$", "", os.path.basename(filename)
+        )
+        name, version, build_string = basename.rsplit("-", 2)
+        build_number = int(build_string.rsplit("_", 1)[1])
+        dist = Dist(name, version, build_string, build_number)
+        index[dist] = SimpleNamespace(
+            url="/".join((channel, filename)), timestamp=k
+        )
+
+    monkeypatch.setattr(build, "_CHANNEL_INDEX_CACHE", {channel: index})
+    monkeypatch.setattr(build, "_CHANNEL_PACKAGES_CACHE", {})
+
+    def _no_head(*args, **kwargs):
+        raise AssertionError("index is cached, no HEAD requests expected")
+
+    build._channel_packages(channel)
+    monkeypatch.setattr(build, "_head_on_channel", _no_head)
+
+    assert find_on_channel(
+        channel,
+        [
+            "conda-bld/linux-64/foo-1.0-py39habcdef0_1.tar.bz2",
+            "conda-bld/linux-64/foo-1.0-py39habcdef0_2.tar.bz2",
+            "conda-bld/linux-64/foo-1.0-py39habcdef0_1.conda",
+            "conda-bld/noarch/bar-2.0-py_0.conda",
+        ],
+    ) == [
+        channel + "/linux-64/foo-1.0-py39h7654321_1.tar.bz2",
+        None,
+        None,
+        channel + "/noarch/bar-2.0-py_0.conda",
+    ]
+
+
+def test_tested_build_key(tmp_path, monkeypatch):
+    import urllib.request
+
+    from .scripts import rebuild
+
+    monkeypatch.setattr("bob.devtools.constants.CACHE_DIR", str(tmp_path))
+    downloads = []
+    monkeypatch.setattr(
+        urllib.request,
+        "urlretrieve",
+        lambda url, path: downloads.append(url),
+    )
+    monkeypatch.setattr(rebuild, "get_package_build_key", lambda path: None)
+
+    url = "https://example.com/linux-64/bob.foo-1.0-py310_0.tar.bz2"
+    destpath = str(tmp_path / "conda-bld" / "linux-64" / os.path.basename(url))
+    tested = []
+
+    def _test(result):
+        return lambda path: tested.append(path) or result
+
+    # packages built before build keys were recorded are tested
+    assert not rebuild._is_up_to_date(url, destpath, "abc", _test(False))
+    assert len(tested) == 1
+    assert rebuild._is_up_to_date(url, destpath, "abc", _test(True))
+    assert len(tested) == 2
+
+    # the key of the successful test is recorded, no more tests needed
+    assert rebuild._is_up_to_date(url, destpath, "abc", _test(False))
+    assert len(tested) == 2
+    assert len(downloads) == 2
+
+    # until the build key changes
+    assert not rebuild._is_up_to_date(url, destpath, "def", _test(False))
+    assert len(tested) == 3
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # coding=utf-8
 import json
+import os
 
 from .ci import is_private
-from .constants import BOBRC_PATH
+from .constants import BOBRC_PATH, DOCS_SPARSE_CHECKOUT
 
 
 def test_is_private():
@@ -17,3 +18,209 @@ def test_bobrc_json_validity():
 
     with open(BOBRC_PATH) as f:
         json.load(f)
+
+
+def test_read_package_levels(tmp_path):
+
+    from .ci import read_package_levels
+
+    order = tmp_path / "order.txt"
+    order.write_text("bob/bob.extension\n# comment\nbob/bob.blitz, 2.x\n")
+    assert read_package_levels(str(order)) == [
+        [("bob/bob.extension", "master")],
+        [("bob/bob.blitz", "2.x")],
+    ]
+
+    order.write_text(
+        "# packages in build order\n\n"
+        "# level 1: 2 package(s)\nbob/bob.extension\nbob/bob.measure\n\n"
+        "# level 2: 1 package(s)\nbob/bob.blitz  # comment\n"
+    )
+    assert read_package_levels(str(order)) == [
+        [("bob/bob.extension", "master"), ("bob/bob.measure", "master")],
+        [("bob/bob.blitz", "master")],
+    ]
+
+
+def test_git_clone(tmp_path):
+
+    import git
+
+    from .ci import git_clone, mirror_commit
+
+    assert mirror_commit("bob/bob.foo", "master", str(tmp_path)) is None
+
+    origin = git.Repo.init(tmp_path / "server" / "bob" / "bob.foo")
+    with origin.config_writer() as config:
+        config.set_value("user", "name", "bdt")
+        config.set_value("user", "email", "bdt@example.com")
+    (tmp_path / "server" / "bob" / "bob.foo" / "version.txt").write_text("1")
+    origin.index.add(["version.txt"])
+    origin.index.commit("first")
+    origin.git.branch("-M", "master")
+
+    baseurl = (tmp_path / "server").as_uri()
+    cache_dir = str(tmp_path / "cache")
+    clone_to = str(tmp_path / "src" / "bob" / "bob.foo")
+    repo = git_clone(
+        baseurl, "bob/bob.foo", "master", clone_to, None, cache_dir
+    )
+    assert repo.head.commit == origin.head.commit
+    assert mirror_commit("bob/bob.foo", "master", cache_dir) == (
+        origin.head.commit.hexsha
+    )
+    assert repo.remotes.origin.url == baseurl + "/bob/bob.foo"
+    alternates = os.path.join(clone_to, ".git", "objects", "info", "alternates")
+    assert os.path.exists(alternates)
+
+    # a new commit on the server is fetched into the existing mirror
+    (tmp_path / "server" / "bob" / "bob.foo" / "version.txt").write_text("2")
+    origin.index.add(["version.txt"])
+    origin.index.commit("second")
+    clone_to = str(tmp_path / "src2")
+    repo = git_clone(
+        baseurl, "bob/bob.foo", "master", clone_to, None, cache_dir
+    )
+    assert repo.head.commit == origin.head.commit
+    assert mirror_commit("bob/bob.foo", "master", cache_dir) == (
+        origin.head.commit.hexsha
+    )
+
+    # mirrors just updated (e.g. by another process) may be used as they are
+    mirrored = origin.head.commit
+    (tmp_path / "server" / "bob" / "bob.foo" / "version.txt").write_text("3")
+    origin.index.add(["version.txt"])
+    origin.index.commit("third")
+    clone_to = str(tmp_path / "src3")
+    repo = git_clone(
+        baseurl,
+        "bob/bob.foo",
+        "master",
+        clone_to,
+        None,
+        cache_dir,
+        update_mirror=False,
+    )
+    assert repo.head.commit == mirrored
+
+
+def test_checkpoint(tmp_path):
+
+    from .ci import (
+        channel_state,
+        checkpoint_valid,
+        load_checkpoint,
+        record_checkpoint,
+    )
+
+    path = str(tmp_path / "cache" / "checkpoint.json")
+    os.makedirs(os.path.dirname(path))
+    (tmp_path / "noarch").mkdir()
+    artifact = tmp_path / "noarch" / "bob.foo-1.0-py_0.conda"
+    artifact.write_text("conda")
+
+    env = dict(python="3.10")
+    channel = channel_state([("bob/bob.extension", "abc")], env)
+    assert channel != channel_state([("bob/bob.extension", "def")], env)
+    assert channel != channel_state(
+        [("bob/bob.extension", "abc")], dict(python="3.9")
+    )
+
+    record_checkpoint(
+        path,
+        "bob/bob.foo",
+        "master",
+        "123",
+        channel,
+        [str(artifact)],
+        "success",
+    )
+    record = load_checkpoint(path)["bob/bob.foo"]
+    assert record["artifacts"] == ["artifacts/noarch/bob.foo-1.0-py_0.conda"]
+    assert checkpoint_valid(path, record, "123", channel)
+    assert not checkpoint_valid(path, record, "456", channel)
+    assert not checkpoint_valid(path, record, "123", "other")
+    assert not checkpoint_valid(path, None, "123", channel)
+
+    # failures are recorded, but never reused; previous artifacts are removed
+    record_checkpoint(
+        path, "bob/bob.foo", "master", "123", channel, [], "failed"
+    )
+    record = load_checkpoint(path)["bob/bob.foo"]
+    assert not checkpoint_valid(path, record, "123", channel)
+    assert not list((tmp_path / "cache" / "artifacts").glob("*/*.conda"))
+
+
+def test_reset_checkpoint(tmp_path):
+
+    from .ci import load_checkpoint, record_checkpoint, reset_checkpoint
+
+    path = str(tmp_path / "cache" / "checkpoint.json")
+    (tmp_path / "noarch").mkdir()
+    artifact = tmp_path / "noarch" / "bob.foo-1.0-py_0.conda"
+    artifact.write_text("conda")
+
+    # checkpoints of the same pipeline are kept
+    reset_checkpoint(path, dict(pipeline="1"))
+    record_checkpoint(
+        path, "bob/bob.foo", "master", "123", "abc", [str(artifact)], "success"
+    )
+    reset_checkpoint(path, dict(pipeline="1"))
+    assert "bob/bob.foo" in load_checkpoint(path)
+
+    # other pipelines remove them, with their artifacts
+    reset_checkpoint(path, dict(pipeline="2"))
+    assert load_checkpoint(path) == {}
+    assert not (tmp_path / "cache" / "artifacts").exists()
+
+
+def test_git_clone_sparse(tmp_path):
+
+    import git
+
+    from .ci import git_clone
+
+    server = tmp_path / "server" / "bob" / "bob.foo"
+    origin = git.Repo.init(server)
+    with origin.config_writer() as config:
+        config.set_value("user", "name", "bdt")
+        config.set_value("user", "email", "bdt@example.com")
+        config.set_value("uploadpack", "allowFilter", "true")
+    files = [
+        "doc/index.rst",
+        "bob/foo/test/data/big.bin",
+        "gridtk/tests/data/big.bin",
+        "gridtk/__init__.py",
+        "setup.py",
+    ]
+    for k in files:
+        (server / k).parent.mkdir(parents=True, exist_ok=True)
+        (server / k).write_text(k)
+    origin.index.add(files)
+    origin.index.commit("first")
+    origin.git.branch("-M", "master")
+
+    baseurl = (tmp_path / "server").as_uri()
+    sparse = list(DOCS_SPARSE_CHECKOUT)
+    for filter in (None, "blob:none"):
+        clone_to = tmp_path / ("src-%s" % filter)
+        repo = git_clone(
+            baseurl,
+            "bob/bob.foo",
+            "master",
+            str(clone_to),
+            cache_dir=str(tmp_path / "cache"),
+            filter=filter,
+            sparse=sparse,
+        )
+        assert repo.head.commit == origin.head.commit
+        assert (clone_to / "setup.py").exists()
+        assert (clone_to / "doc" / "index.rst").exists()
+        assert not (clone_to / "bob" / "foo" / "test" / "data").exists()
+        assert not (clone_to / "gridtk" / "tests" / "data").exists()
+        assert (clone_to / "gridtk" / "__init__.py").exists()
+        if filter is not None:
+            assert repo.git.config("remote.origin.partialclonefilter") == filter
+        else:  # shares objects with the mirror
+            alternates = clone_to / ".git" / "objects" / "info" / "alternates"
+            assert alternates.exists()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import os
+
+from types import SimpleNamespace
+
+from .docs import (
+    cached_intersphinx_mapping,
+    cached_inventory,
+    freeze_unchanged_sources,
+    restore_doctrees,
+    save_doctrees,
+)
+
+
+def test_freeze_unchanged_sources(tmp_path):
+
+    packages = []
+    for name in ("bob.foo", "bob.bar"):
+        path = tmp_path / "doc" / "bob" / name
+        (path / "doc").mkdir(parents=True)
+        (path / "doc" / "index.rst").write_text(name)
+        packages.append(str(path))
+
+    state = str(tmp_path / "cache" / "sources.json")
+    assert freeze_unchanged_sources(packages, state) == packages
+
+    # fresh checkout: one package changes, the other keeps its contents
+    index = tmp_path / "doc" / "bob" / "bob.bar" / "doc" / "index.rst"
+    index.write_text("changed")
+    unchanged = tmp_path / "doc" / "bob" / "bob.foo" / "doc" / "index.rst"
+    os.utime(unchanged, (2e9, 2e9))
+    assert freeze_unchanged_sources(packages, state) == [packages[1]]
+    assert os.path.getmtime(unchanged) < 2e9
+
+
+def test_doctrees(tmp_path):
+
+    cache_dir = str(tmp_path / "cache")
+    doctrees = tmp_path / "sphinx" / ".doctrees"
+    assert not restore_doctrees(cache_dir, str(doctrees))
+
+    doctrees.mkdir(parents=True)
+    (doctrees / "environment.pickle").write_bytes(b"env")
+    save_doctrees(str(doctrees), cache_dir)
+    save_doctrees(str(doctrees), cache_dir)  # replaces previous cache
+
+    restored = tmp_path / "other" / ".doctrees"
+    assert restore_doctrees(cache_dir, str(restored))
+    assert (restored / "environment.pickle").read_bytes() == b"env"
+
+
+def test_cached_inventory(tmp_path):
+
+    requests = []
+
+    class _Session:
+        def get(self, url, headers, timeout):
+            requests.append((url, headers))
+            if headers.get("If-None-Match") == "v1":
+                return SimpleNamespace(status_code=304)
+            return SimpleNamespace(
+                status_code=200,
+                headers={"ETag": "v1"},
+                content=b"inventory",
+                raise_for_status=lambda: None,
+            )
+
+    uri = "https://docs.python.org/3/"
+    cache_dir = str(tmp_path)
+    path = cached_inventory(_Session(), uri, cache_dir, ttl=3600)
+    assert open(path, "rb").read() == b"inventory"
+    assert requests == [("https://docs.python.org/3/objects.inv", {})]
+
+    # fresh: no requests; stale: conditional request
+    assert cached_inventory(_Session(), uri, cache_dir, ttl=3600) == path
+    assert len(requests) == 1
+    assert cached_inventory(_Session(), uri, cache_dir, ttl=0) == path
+    assert requests[-1][1] == {"If-None-Match": "v1"}
+
+    mapping = cached_intersphinx_mapping(
+        {"python": (uri, None), "local": ("https://example.com", "x.inv")},
+        cache_dir=cache_dir,
+        ttl=3600,
+    )
+    assert mapping == {
+        "python": (uri, path),
+        "local": ("https://example.com", "x.inv"),
+    }
+    assert len(requests) == 2
+
+
+def _template_conf_function(name):
+    """Loads a function defined on the documentation template (``conf.py``),
+    which cannot be imported as is"""
+
+    import ast
+    import logging
+    import time
+
+    path = os.path.join(
+        os.path.dirname(__file__), "templates", "doc", "conf.py"
+    )
+    with open(path, "rt") as f:
+        tree = ast.parse(f.read())
+    node = [
+        k
+        for k in tree.body
+        if isinstance(k, ast.FunctionDef) and k.name == name
+    ][0]
+    namespace = dict(os=os, time=time, logging=logging)
+    exec(compile(ast.Module([node], []), path, "exec"), namespace)
+    return namespace[name]
+
+
+def test_template_intersphinx_cache(tmp_path, monkeypatch):
+
+    function = _template_conf_function("cached_intersphinx_mapping")
+    mapping = {
+        "python": ("https://docs.python.org/3/", None),
+        "numpy": ("http://127.0.0.1:9/numpy/", None),
+        "local": ("https://example.com", "x.inv"),
+    }
+
+    monkeypatch.delenv("BDT_INTERSPHINX_CACHE", raising=False)
+    assert function(mapping) is mapping
+
+    # inventories cached by bdt are used without network access
+    class _Session:
+        def get(self, url, headers, timeout):
+            return SimpleNamespace(
+                status_code=200,
+                headers={},
+                content=b"inventory",
+                raise_for_status=lambda: None,
+            )
+
+    cache_dir = str(tmp_path / "intersphinx")
+    os.makedirs(cache_dir)
+    path = cached_inventory(
+        _Session(), mapping["python"][0], cache_dir, ttl=3600
+    )
+    monkeypatch.setenv("BDT_INTERSPHINX_CACHE", cache_dir)
+    assert function(mapping) == {
+        "python": ("https://docs.python.org/3/", path),
+        "numpy": ("http://127.0.0.1:9/numpy/", None),  # cannot download
+        "local": ("https://example.com", "x.inv"),
+    }
+
+    # read-only (or unusable) caches do not break the documentation build
+    monkeypatch.setenv("BDT_INTERSPHINX_CACHE", str(tmp_path / "file"))
+    (tmp_path / "file").write_text("")
+    assert function(mapping) == mapping
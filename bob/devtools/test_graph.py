@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+import io
+import json
+import os
+import tarfile
+import threading
+
+from types import SimpleNamespace
+from xml.etree import ElementTree
+
+import gitlab
+import pytest
+
+from . import graph
+from .ci import read_packages
+
+
+def _node(name, run=[]):
+    return dict(
+        host=[],
+        build=[],
+        run=run,
+        test=[],
+        version="1.0",
+        name=name,
+        build_string="py_0",
+    )
+
+
+PACKAGES = {
+    "bob/bob.a": _node("bob.a", ["bob.b", "bob.c >=1.0", "numpy"]),
+    "bob/bob.b": _node("bob.b", ["bob.d"]),
+    "bob/bob.c": _node("bob.c", ["bob.d", "bob.b"]),
+    "bob/bob.d": _node("bob.d", ["bob.a"]),  # cycle
+}
+
+
+def _resolve_recipe(recipe_dir, conda_config, main_channel, deptypes):
+    assert os.path.exists(os.path.join(recipe_dir, "..", "version.txt"))
+    assert not os.path.exists(os.path.join(recipe_dir, "..", "data"))
+    with open(os.path.join(recipe_dir, "package.txt")) as f:
+        return PACKAGES[f.read()]
+
+
+class _Project:
+    """Mimics the parts of a gitlab project used while graphing"""
+
+    def __init__(self, package, shas, downloads, tree_api=True):
+        self.package = package
+        self.attributes = dict(path_with_namespace=package)
+        self.commits = SimpleNamespace(
+            get=lambda ref: SimpleNamespace(id=shas[package])
+        )
+        self.files = SimpleNamespace(raw=self._raw)
+        self.downloads = downloads
+        self.tree_api = tree_api
+        self.contents = {
+            "conda/package.txt": package.encode(),
+            "version.txt": b"1.0",
+            "data/large.bin": 1024 * b"0",
+        }
+
+    def repository_tree(self, path="", ref="", recursive=False, **kwargs):
+        if not self.tree_api:
+            raise gitlab.exceptions.GitlabGetError("no tree API")
+        if path == "":
+            return [
+                dict(path="conda", type="tree"),
+                dict(path="data", type="tree"),
+                dict(path="version.txt", type="blob"),
+            ]
+        return [
+            dict(path=k, type="blob")
+            for k in self.contents
+            if k.startswith(path + "/")
+        ]
+
+    def _raw(self, file_path, ref):
+        self.downloads.append(self.package)
+        return self.contents[file_path]
+
+    def repository_archive(self, ref, streamed, action):
+        self.downloads.append(self.package)
+        archive = io.BytesIO()
+        prefix = "%s-%s-a1b2c3" % (os.path.basename(self.package), ref)
+        with tarfile.open(fileobj=archive, mode="w:gz") as f:
+            for name, contents in self.contents.items():
+                info = tarfile.TarInfo("%s/%s" % (prefix, name))
+                info.size = len(contents)
+                f.addfile(info, io.BytesIO(contents))
+        action(archive.getvalue())
+
+
+def _gitlab(shas, downloads, tree_api=True):
+    lock = threading.Lock()
+
+    def _get(package):
+        with lock:
+            return _Project(package, shas, downloads, tree_api)
+
+    return SimpleNamespace(projects=SimpleNamespace(get=_get))
+
+
+def test_compute_adjencence_matrix(monkeypatch):
+    monkeypatch.setattr(graph, "_resolve_recipe", _resolve_recipe)
+
+    for tree_api in (True, False):
+        downloads = []
+        gl = _gitlab({}, downloads, tree_api)
+        adjmtx = graph.compute_adjencence_matrix(
+            gl, "bob/bob.a", None, None, jobs=2
+        )
+        assert adjmtx == PACKAGES
+        assert sorted(set(downloads)) == sorted(PACKAGES)
+
+
+def test_cached_nodes(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph, "_resolve_recipe", _resolve_recipe)
+    monkeypatch.setattr("bob.devtools.constants.CACHE_DIR", str(tmp_path))
+
+    shas = dict((k, "a1b2c3") for k in PACKAGES)
+    digest = graph.conda_config_digest(None, "3.10", None, dict(channels=[]))
+
+    def _compute(digest=digest):
+        downloads = []
+        adjmtx = graph.compute_adjencence_matrix(
+            _gitlab(shas, downloads),
+            "bob/bob.a",
+            None,
+            None,
+            config_digest=digest,
+        )
+        assert adjmtx == PACKAGES
+        return sorted(set(downloads))
+
+    assert _compute() == sorted(PACKAGES)
+    assert _compute() == []  # all cached
+
+    shas["bob/bob.c"] = "d4e5f6"
+    assert _compute() == ["bob/bob.c"]
+
+    other = graph.conda_config_digest(None, "3.9", None, dict(channels=[]))
+    assert other != digest
+    assert _compute(other) == sorted(PACKAGES)
+
+
+def test_build_order(tmp_path):
+    adjmtx = dict(PACKAGES)
+    adjmtx["bob/bob.d"] = _node("bob.d")
+    adjmtx["bob/bob.e"] = _node("bob.e", ["python", "bob.e"])
+
+    levels = graph.compute_build_order(adjmtx)
+    assert levels == [
+        ["bob/bob.d", "bob/bob.e"],
+        ["bob/bob.b"],
+        ["bob/bob.c"],
+        ["bob/bob.a"],
+    ]
+
+    with open(tmp_path / "order.txt", "wt") as f:
+        graph.write_build_order(levels, f, ref="2.x")
+    assert read_packages(str(tmp_path / "order.txt")) == [
+        (k, "2.x") for level in levels for k in level
+    ]
+
+    with pytest.raises(RuntimeError) as e:
+        graph.compute_build_order(PACKAGES)
+    assert "bob/bob.a -> bob/bob.b -> bob/bob.d -> bob/bob.a" in str(e.value)
+
+
+def test_impacted_packages():
+    adjmtx = dict(PACKAGES)
+    adjmtx["bob/bob.d"] = _node("bob.d")
+    adjmtx["bob/bob.e"] = _node("bob.e", ["bob.d"])
+
+    assert graph.impacted_packages(adjmtx, ["bob.b"]) == [
+        ["bob/bob.b"],
+        ["bob/bob.c"],
+        ["bob/bob.a"],
+    ]
+    assert graph.impacted_packages(adjmtx, ["bob/bob.d"]) == [
+        ["bob/bob.d"],
+        ["bob/bob.b", "bob/bob.e"],
+        ["bob/bob.c"],
+        ["bob/bob.a"],
+    ]
+    assert graph.impacted_packages(adjmtx, ["bob.a"]) == [["bob/bob.a"]]
+
+    with pytest.raises(RuntimeError):
+        graph.impacted_packages(adjmtx, ["bob.z"])
+
+
+def test_compute_graph():
+    adjmtx = dict(PACKAGES)
+    adjmtx["bob/bob.a"] = _node("bob.a", ["bob.b", "bob.c >=1.0"])
+    adjmtx["bob/bob.b"] = _node("bob.b", ["bob.d", "numpy", "numpy 1.23 py39"])
+
+    nodes, edges = graph.compute_graph(adjmtx, [], r"^(bob|numpy).*$")
+    assert nodes["bob.a"] == dict(version="1.0", build="py_0", package=True)
+    assert nodes["numpy"] == dict(version="1.23", build="py39", package=False)
+    assert sorted(edges) == [
+        ("bob.a", "bob.b"),
+        ("bob.a", "bob.c"),
+        ("bob.b", "bob.d"),
+        ("bob.b", "numpy"),
+        ("bob.c", "bob.b"),
+        ("bob.c", "bob.d"),
+        ("bob.d", "bob.a"),
+    ]
+
+    nodes, edges = graph.compute_graph(adjmtx, ["run"], r"^bob\.(a|b)$")
+    assert sorted(edges) == [
+        ("bob.a", "bob.b"),
+        ("bob.c", "bob.b"),
+        ("bob.d", "bob.a"),
+    ]
+    assert not nodes["bob.c"]["package"]
+
+    stream = io.StringIO()
+    graph.write_json_graph(nodes, edges, stream)
+    data = json.loads(stream.getvalue())
+    assert sorted(k["id"] for k in data["nodes"]) == sorted(nodes)
+    assert len(data["edges"]) == 3
+
+    stream = io.BytesIO()
+    graph.write_graphml(nodes, edges, stream)
+    root = ElementTree.fromstring(stream.getvalue())
+    ns = {"g": "http://graphml.graphdrawing.org/xmlns"}
+    assert len(root.findall("g:graph/g:node", ns)) == len(nodes)
+    assert len(root.findall("g:graph/g:edge", ns)) == 3
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+from .pipelines import (
+    concurrent_jobs,
+    job_log_durations,
+    load_durations,
+    log_durations,
+    record_durations,
+)
+from .schedule import critical_path, estimate_durations, schedule
+
+DEPENDENCIES = {
+    "bob/bob.extension": set(),
+    "bob/bob.blitz": set(["bob/bob.extension"]),
+    "bob/bob.io.base": set(["bob/bob.blitz"]),
+    "bob/bob.learn.em": set(["bob/bob.io.base"]),
+    "bob/bob.bio.base": set(["bob/bob.io.base", "bob/bob.extension"]),
+    "bob/bob.measure": set(["bob/bob.extension"]),
+}
+
+DURATIONS = {
+    "bob/bob.extension": 10,
+    "bob/bob.blitz": 20,
+    "bob/bob.io.base": 30,
+    "bob/bob.learn.em": 50,
+    "bob/bob.bio.base": 10,
+    "bob/bob.measure": 60,
+}
+
+
+def test_critical_path():
+    path, length = critical_path(DEPENDENCIES, DURATIONS)
+    assert path == [
+        "bob/bob.extension",
+        "bob/bob.blitz",
+        "bob/bob.io.base",
+        "bob/bob.learn.em",
+    ]
+    assert length == 110
+
+
+def test_schedule():
+    plan, makespan = schedule(DEPENDENCIES, DURATIONS, runners=1)
+    assert makespan == sum(DURATIONS.values())
+
+    plan, makespan = schedule(DEPENDENCIES, DURATIONS, runners=2)
+    assert makespan == 110  # critical path length
+
+    # critical path packages are never delayed
+    start = dict((k["package"], k["start"]) for k in plan)
+    assert start["bob/bob.blitz"] == 10
+    assert start["bob/bob.io.base"] == 30
+
+    # dependencies are always finished before packages start
+    end = dict((k["package"], k["end"]) for k in plan)
+    for job in plan:
+        for dep in DEPENDENCIES[job["package"]]:
+            assert end[dep] <= job["start"]
+
+
+def test_durations(tmp_path):
+    log = [
+        "Building bob/bob.extension@master (1/2)",
+        "2022-01-01 10:00:00 starting",
+        "2022-01-01 10:05:30 done",
+        "Building bob/bob.blitz@master (2/2)",
+        "2022-01-01 10:06:00 starting",
+        "2022-01-01 11:06:00 done",
+    ]
+    durations = dict(
+        (k, (v[1] - v[0]).total_seconds())
+        for k, v in log_durations(log).items()
+    )
+    assert durations == {"bob/bob.extension": 330, "bob/bob.blitz": 3600}
+
+    path = str(tmp_path / "durations.json")
+    for k in range(12):
+        record_durations(dict(durations, **{"bob/bob.blitz": k}), path)
+    history = load_durations(path)
+    assert history["bob/bob.blitz"] == list(range(2, 12))
+
+    estimates, unknown = estimate_durations(
+        ["bob/bob.extension", "bob/bob.blitz", "bob/bob.io.base"], history
+    )
+    assert unknown == set(["bob/bob.io.base"])
+    assert estimates["bob/bob.blitz"] == 6.5
+    assert estimates["bob/bob.io.base"] == (330 + 6.5) / 2
+
+
+def test_concurrent_durations():
+    log = [
+        "Building level 1/1 (2 package(s), 2 concurrently): bob/a, bob/b",
+        "Output of bob/bob.blitz (1/2) - SUCCESS",
+        "Building bob/bob.blitz@master (1/1)",
+        "2022-01-01 10:00:00 starting",
+        "Output of bob/bob.measure (2/2) - SUCCESS",
+        "2022-01-01 12:00:00 merging",
+    ]
+    assert concurrent_jobs(log) == ["bob/bob.blitz", "bob/bob.measure"]
+    assert concurrent_jobs(["Building bob/bob.blitz@master (1/2)"]) == []
+
+    job_logs = {
+        "bob/bob.blitz": [
+            "Building bob/bob.blitz@master (1/1)",
+            "2022-01-01 10:00:00 starting",
+            "2022-01-01 10:10:00 done",
+        ],
+        "bob/bob.measure": [
+            "Building bob/bob.measure@master (1/1)",
+            "2022-01-01 10:00:00 starting",
+            "2022-01-01 10:20:00 done",
+        ],
+    }
+    durations = dict(
+        (k, (v[1] - v[0]).total_seconds())
+        for k, v in job_log_durations(job_logs).items()
+    )
+    assert durations == {"bob/bob.blitz": 600, "bob/bob.measure": 1200}
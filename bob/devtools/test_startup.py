@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import json
+import os
+import subprocess
+import sys
+
+from importlib.metadata import EntryPoint
+
+import click
+
+from click.testing import CliRunner
+
+from .scripts import bdt
+
+HEAVY_MODULES = [
+    "conda",
+    "conda_build",
+    "git",
+    "gitlab",
+    "jinja2",
+    "pkg_resources",
+    "requests",
+    "sphinx",
+    "yaml",
+]
+"""Modules that must not be imported just to setup the command-line"""
+
+
+STARTUP_SCRIPT = """
+import json, pkgutil, sys, time
+start = time.time()
+import bob.devtools.scripts
+from bob.devtools.scripts.bdt import main
+for k in pkgutil.iter_modules(bob.devtools.scripts.__path__):
+    __import__("bob.devtools.scripts." + k.name)
+try:
+    main(["--help"])
+except SystemExit:
+    pass
+print(json.dumps(dict(elapsed=time.time() - start, modules=list(sys.modules))))
+"""
+
+
+def test_startup_time():
+    # time budget (in seconds) for loading all commands and printing help
+    budget = float(os.environ.get("BDT_STARTUP_BUDGET", "2.0"))
+
+    output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT])
+    result = json.loads(output.decode().splitlines()[-1])
+
+    loaded = [k for k in HEAVY_MODULES if k in result["modules"]]
+    assert not loaded, "modules %s imported at startup" % ", ".join(loaded)
+    assert result["elapsed"] < budget, "startup took %.2fs (budget: %.2fs)" % (
+        result["elapsed"],
+        budget,
+    )
+
+
+def test_lazy_entry_points(monkeypatch):
+    monkeypatch.setattr(
+        bdt,
+        "_entry_points",
+        lambda group: dict(
+            caupdate=EntryPoint(
+                "caupdate", "bob.devtools.scripts.caupdate:caupdate", group
+            ),
+            broken=EntryPoint("broken", "bob.devtools.missing:broken", group),
+        ),
+    )
+
+    @click.group(cls=bdt.AliasedGroup, entry_point_group="test.cli")
+    def cli():
+        pass
+
+    assert cli.list_commands(None) == ["broken", "caupdate"]
+    assert not cli.commands  # nothing loaded so far
+
+    result = CliRunner().invoke(cli, ["cau", "--help"])
+    assert result.exit_code == 0, result.output
+    assert "certificate authority" in result.output
+    assert list(cli.commands) == ["caupdate"]
+
+    result = CliRunner().invoke(cli, ["broken"])
+    assert result.exit_code != 0
+
+
+def test_timestamps_flag(monkeypatch):
+    @click.command()
+    def noop():
+        click.echo(os.environ["BDT_TIMESTAMPS"])
+
+    monkeypatch.setitem(bdt.main.commands, "noop", noop)
+    monkeypatch.setenv("BDT_TIMESTAMPS", "1")
+    monkeypatch.setenv("SSL_CERT_FILE", "")
+    monkeypatch.setenv("REQUESTS_CA_BUNDLE", "")
+
+    result = CliRunner().invoke(bdt.main, ["noop"])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip() == "true"
+
+    # the command-line overrides the environment
+    result = CliRunner().invoke(bdt.main, ["--no-timestamps", "noop"])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip() == "false"